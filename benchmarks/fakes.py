@@ -0,0 +1,437 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local stand-ins of the BigQuery and Gemini clients for benchmarks.
+
+The fakes implement only the calls the agent makes, answer them from a
+synthetic dataset of N tables x M columns and sleep a configurable latency
+per call, so the real tool functions and agent run without GCP. Every call
+is counted.
+"""
+
+import asyncio
+import datetime
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow as pa
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.api_core import exceptions
+from google.cloud import bigquery
+from google.genai import types
+
+
+CHARS_PER_TOKEN = 4
+
+# Column types of the synthetic tables, cycled after the key columns.
+COLUMN_TYPES = [
+    "STRING", "INT64", "FLOAT64", "DATE", "TIMESTAMP", "NUMERIC(10, 2)",
+    "BOOL", "ARRAY<STRING>", "STRUCT<code STRING, score FLOAT64>",
+]
+
+# Tables referenced by a query, e.g. `project.dataset.table`.
+TABLE_PATTERN = re.compile(r"`([\w-]+\.\w+\.\w+)`")
+
+# Column aggregations of a profile query (see `profiles.profile_query`).
+PROFILE_COLUMN_PATTERN = re.compile(r"STRUCT\(COUNTIF\(`([^`]+)` IS NULL\).*? AS (c\d+)")
+
+
+class CallCounter:
+    """Thread-safe call counters of a fake client."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, count=1):
+        with self._lock:
+            self._counts[name] += count
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class SyntheticDataset:
+    """A dataset of `num_tables` tables of `num_columns` columns each.
+
+    Table `table_{i}` has an `id` key, a `table_{i-1}_id` foreign key to the
+    previous table and value columns of every type of COLUMN_TYPES. Tables of
+    even index are partitioned by their first DATE column, and all tables
+    are clustered by `id`.
+    """
+
+    def __init__(self, num_tables=20, num_columns=12, sample_rows=5):
+        self.num_tables = num_tables
+        self.num_columns = max(num_columns, 2)
+        self.sample_rows = sample_rows
+        self.tables = [f"table_{i:04d}" for i in range(num_tables)]
+
+    def columns(self, table_index):
+        """Returns (name, data_type, description) of the columns of a table."""
+        columns = [("id", "INT64", f"Key of table {table_index}")]
+        previous = (table_index - 1) % self.num_tables
+        columns.append((f"table_{previous:04d}_id", "INT64", "Foreign key"))
+        for j in range(self.num_columns - 2):
+            columns.append((
+                f"col_{j:03d}",
+                COLUMN_TYPES[j % len(COLUMN_TYPES)],
+                f"Value {j} of table {table_index}, with a long description "
+                "that is repeated in every prompt" if j % 3 == 0 else None,
+            ))
+        return columns
+
+    def partition_column(self, table_index):
+        """Returns the partition column of a table, or None."""
+        if table_index % 2:
+            return None
+        for name, data_type, _ in self.columns(table_index):
+            if data_type == "DATE":
+                return name
+        return None
+
+    def sample_value(self, data_type, row):
+        if data_type == "STRING":
+            return f"value {row} " + "lorem ipsum " * (row + 1)
+        if data_type in ("INT64", "NUMERIC(10, 2)"):
+            return row * 7
+        if data_type == "FLOAT64":
+            return row * 1.5
+        if data_type == "DATE":
+            return datetime.date(2024, 1, row + 1)
+        if data_type == "TIMESTAMP":
+            return datetime.datetime(2024, 1, row + 1, 12, 0)
+        if data_type == "BOOL":
+            return row % 2 == 0
+        if data_type.startswith("ARRAY"):
+            return [f"tag_{row}", "common"]
+        if data_type.startswith("STRUCT"):
+            return {"code": f"C{row}", "score": row / 10}
+        return None
+
+    def sample_frame(self, table_index):
+        columns = self.columns(table_index)
+        return pd.DataFrame({
+            name: [self.sample_value(data_type, row) for row in range(self.sample_rows)]
+            for name, data_type, _ in columns
+        })
+
+
+class FakeQueryJob:
+    """A finished query job returning fixed rows."""
+
+    def __init__(self, rows, schema=None, total_bytes_processed=0,
+                 referenced_tables=None, statement_type="SELECT"):
+        self.rows = rows
+        self.schema = schema or []
+        self.statement_type = statement_type
+        self.total_bytes_processed = total_bytes_processed
+        self.referenced_tables = referenced_tables or []
+
+    def result(self, max_results=None, page_size=None, **kwargs):
+        rows = self.rows if max_results is None else self.rows[:max_results]
+        return FakeRowIterator(rows, self.schema, total_rows=len(self.rows))
+
+    def done(self):
+        return True
+
+    def cancel(self):
+        return True
+
+
+class FakeRowIterator(list):
+
+    def __init__(self, rows, schema, total_rows=None):
+        super().__init__(rows)
+        self.schema = schema
+        self.total_rows = len(rows) if total_rows is None else total_rows
+
+    def to_arrow(self, **kwargs):
+        return pa.Table.from_pylist(list(self))
+
+
+class FakeRows:
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def to_dataframe(self):
+        return self.frame
+
+
+class FakeBigQueryClient:
+    """Answers the BigQuery calls of the agent from a SyntheticDataset.
+
+    Args:
+        dataset (SyntheticDataset): The data of the dataset.
+        project_id (str): Project of the dataset.
+        dataset_id (str): ID of the dataset.
+        latency (dict): Seconds slept per call kind: `metadata`, `list_rows`,
+          `dry_run`, `query`, `profile` and `get_table`.
+        result_rows (int): Rows returned by executed queries.
+        fail_pattern (str): Queries containing it fail in the dry run.
+    """
+
+    def __init__(self, dataset, project_id="bench-project", dataset_id="bench_dataset",
+                 latency=None, result_rows=100, fail_pattern="__fail__"):
+        self.dataset = dataset
+        self.project = project_id
+        self.dataset_id = dataset_id
+        self.latency = latency or {}
+        self.result_rows = result_rows
+        self.fail_pattern = fail_pattern
+        self.calls = CallCounter()
+        self.modified = int(time.time() * 1000)
+
+    def _sleep(self, kind):
+        self.calls.add(kind)
+        seconds = self.latency.get(kind, 0)
+        if seconds:
+            time.sleep(seconds)
+
+    def query(self, sql, job_config=None, **kwargs):
+        if "INFORMATION_SCHEMA" in sql:
+            self._sleep("metadata")
+            return FakeQueryJob(self._column_rows(job_config))
+        if "__TABLES__" in sql:
+            self._sleep("metadata")
+            return FakeQueryJob([
+                {"table_id": table_id, "last_modified_time": self.modified}
+                for table_id in self.dataset.tables
+            ])
+
+        referenced = [
+            bigquery.TableReference.from_string(name)
+            for name in sorted(set(TABLE_PATTERN.findall(sql)))
+        ]
+        if job_config is not None and job_config.dry_run:
+            self._sleep("dry_run")
+            if self.fail_pattern and self.fail_pattern in sql:
+                raise exceptions.BadRequest(f"Unrecognized name: {self.fail_pattern}")
+            total_bytes = 1_000_000 * max(len(referenced), 1)
+            # Recent-window partition filters and samples read fewer blocks
+            if "_SUB(CURRENT_" in sql:
+                total_bytes //= 10
+            if "TABLESAMPLE" in sql:
+                total_bytes //= 100
+            return FakeQueryJob(
+                [],
+                total_bytes_processed=total_bytes,
+                referenced_tables=referenced,
+                statement_type="SCRIPT" if ";" in sql.strip().rstrip(";") else "SELECT",
+            )
+
+        if "APPROX_TOP_COUNT" in sql or "APPROX_COUNT_DISTINCT" in sql:
+            self._sleep("profile")
+            return FakeQueryJob([self._profile_row(sql, referenced[0].table_id)])
+
+        self._sleep("query")
+        schema = [
+            bigquery.SchemaField("label", "STRING"),
+            bigquery.SchemaField("value", "INTEGER"),
+            bigquery.SchemaField("day", "DATE"),
+        ]
+        rows = [
+            {"label": f"label {i}", "value": i, "day": datetime.date(2024, 1, 1 + i % 28)}
+            for i in range(self.result_rows)
+        ]
+        return FakeQueryJob(rows, schema=schema, referenced_tables=referenced)
+
+    def _column_rows(self, job_config):
+        parameters = {p.name: p for p in job_config.query_parameters}
+        table_names = None
+        if not parameters["all_tables"].value:
+            table_names = set(parameters["table_names"].values)
+        rows = []
+        for i, table_id in enumerate(self.dataset.tables):
+            if table_names is not None and table_id not in table_names:
+                continue
+            partition_column = self.dataset.partition_column(i)
+            for name, data_type, description in self.dataset.columns(i):
+                rows.append({
+                    "table_name": table_id,
+                    "column_name": name,
+                    "data_type": data_type,
+                    "is_partitioning_column": "YES" if name == partition_column else "NO",
+                    "clustering_ordinal_position": 1 if name == "id" else None,
+                    "description": description,
+                    "partition_by": partition_column,
+                    "require_partition_filter": False,
+                })
+        return rows
+
+    def _profile_row(self, sql, table_id):
+        """Profiles the sample rows of a table, as BigQuery would the table."""
+        frame = self.dataset.sample_frame(self.dataset.tables.index(table_id))
+        row = {"row_count": len(frame)}
+        for name, alias in PROFILE_COLUMN_PATTERN.findall(sql):
+            values = [v for v in frame[name].tolist() if v is not None]
+            counts = Counter(values).most_common()
+            row[alias] = {
+                "nulls": len(frame) - len(values),
+                "distinct_count": len(counts),
+                "top": [{"value": v, "count": c} for v, c in counts]
+                if f"APPROX_TOP_COUNT(`{name}`" in sql else None,
+                "min": str(min(values)) if f"MIN(`{name}`)" in sql else None,
+                "max": str(max(values)) if f"MAX(`{name}`)" in sql else None,
+            }
+        return row
+
+    def list_rows(self, table_ref, max_results=None, selected_fields=None):
+        self._sleep("list_rows")
+        index = self.dataset.tables.index(table_ref.table_id)
+        return FakeRows(self.dataset.sample_frame(index).head(max_results))
+
+    def get_table(self, table_name):
+        self._sleep("get_table")
+        return SimpleNamespace(
+            modified=datetime.datetime.fromtimestamp(self.modified / 1000),
+            streaming_buffer=None,
+        )
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+class FakeModels:
+    """`client.models` of FakeGenAIClient."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        self.client.calls.add("generate_content")
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        return self.client.respond(contents, config or {})
+
+
+class FakeAsyncModels:
+    """`client.aio.models` of FakeGenAIClient."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def generate_content(self, model, contents, config=None):
+        self.client.calls.add("generate_content")
+        if self.client.latency:
+            await asyncio.sleep(self.client.latency)
+        return self.client.respond(contents, config or {})
+
+
+class FakeCaches:
+    """`client.caches` of FakeGenAIClient, keeping the cached token counts."""
+
+    def __init__(self, client):
+        self.client = client
+        self.tokens = {}
+
+    def create(self, model, config):
+        self.client.calls.add("caches.create")
+        name = f"cachedContents/{len(self.tokens) + 1}"
+        self.tokens[name] = sum(estimate_tokens(str(c)) for c in config["contents"])
+        return SimpleNamespace(name=name)
+
+    def update(self, name, config):
+        self.client.calls.add("caches.update")
+        if name not in self.tokens:
+            raise exceptions.NotFound(name)
+
+    def delete(self, name):
+        self.client.calls.add("caches.delete")
+        self.tokens.pop(name, None)
+
+
+class FakeGenAIClient:
+    """Answers tool model calls with scripted responses.
+
+    Args:
+        script (callable): Returns the response text of a prompt (str) and
+          the temperature of the call.
+        latency (float): Seconds slept per call.
+    """
+
+    def __init__(self, script, latency=0.0):
+        self.script = script
+        self.latency = latency
+        self.calls = CallCounter()
+        self.models = FakeModels(self)
+        self.caches = FakeCaches(self)
+        self.aio = SimpleNamespace(models=FakeAsyncModels(self))
+
+    def respond(self, contents, config):
+        prompt = contents if isinstance(contents, str) else str(contents)
+        cached_tokens = self.caches.tokens.get(config.get("cached_content"), 0)
+        uncached_tokens = estimate_tokens(prompt)
+        self.calls.add("input_tokens", cached_tokens + uncached_tokens)
+        self.calls.add("cached_input_tokens", cached_tokens)
+        return SimpleNamespace(
+            text=self.script(prompt, config.get("temperature")),
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=cached_tokens + uncached_tokens,
+                cached_content_token_count=cached_tokens,
+            ),
+        )
+
+
+class FakeRootModel(BaseLlm):
+    """Root model calling the SQL tools once per question, then answering.
+
+    The fused `generate_and_validate_sql` tool is used when the agent has
+    it; otherwise `bq_nl2sql` is followed by `run_bigquery_validation`.
+    """
+
+    model: str = "fake-root-model"
+    latency: float = 0.0
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        last = llm_request.contents[-1]
+        responses = [p.function_response for p in last.parts if p.function_response]
+        if not responses:
+            question = "".join(p.text or "" for p in last.parts)
+            if "generate_and_validate_sql" in llm_request.tools_dict:
+                call = types.FunctionCall(
+                    name="generate_and_validate_sql", args={"question": question}
+                )
+            else:
+                call = types.FunctionCall(name="bq_nl2sql", args={"question": question})
+        elif responses[0].name == "bq_nl2sql":
+            call = types.FunctionCall(
+                name="run_bigquery_validation",
+                args={"sql_string": responses[0].response["result"]},
+            )
+        else:
+            yield LlmResponse(content=types.Content(
+                role="model", parts=[types.Part(text="Here are the results.")]
+            ))
+            return
+
+        yield LlmResponse(content=types.Content(
+            role="model", parts=[types.Part(function_call=call)]
+        ))
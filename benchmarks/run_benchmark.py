@@ -0,0 +1,512 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline benchmark of the data assistant.
+
+Runs the schema build, the tool functions and `root_agent` turns against the
+fake clients of `fakes.py` and writes the results as JSON, to be diffed
+between commits:
+
+    python -m benchmarks.run_benchmark --tables 50 --columns 20 \\
+        --output bench.json
+    python -m benchmarks.run_benchmark --compare bench.json
+
+Reported: p50/p95 latency per stage, schema build time by table count,
+prompt token counts, peak memory, BigQuery/LLM call counts and the calls
+saved by coalescing a burst of sessions asking the same question.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# The agent reads these on import and first use; the fakes ignore them.
+for name, value in {
+    "BQ_PROJECT_ID": "bench-project",
+    "BQ_DATASET_ID": "bench_dataset",
+    "AGENT_ROOT_MODEL": "fake-root-model",
+    "AGENT_TOOL_MODEL": "fake-tool-model",
+    "GOOGLE_CLOUD_LOCATION": "us-central1",
+}.items():
+    os.environ.setdefault(name, value)
+
+from google.adk.runners import InMemoryRunner  # pylint: disable=wrong-import-position
+from google.genai import types  # pylint: disable=wrong-import-position
+
+from data_assistant import agent  # pylint: disable=wrong-import-position
+from data_assistant import retrieval  # pylint: disable=wrong-import-position
+from data_assistant import schema  # pylint: disable=wrong-import-position
+from data_assistant import snapshot  # pylint: disable=wrong-import-position
+from data_assistant import tools  # pylint: disable=wrong-import-position
+from data_assistant.utils import get_config  # pylint: disable=wrong-import-position
+
+from . import fakes  # pylint: disable=wrong-import-position
+
+
+QUESTION_PATTERN = re.compile(
+    r"\*\*(?:Natural language question|Question):\*\*\s*```\s*(.*?)\s*```", re.DOTALL
+)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary (milliseconds) of a list of durations in seconds."""
+    millis = [s * 1000 for s in samples]
+    return {
+        "count": len(millis),
+        "p50_ms": round(percentile(millis, 50), 3),
+        "p95_ms": round(percentile(millis, 95), 3),
+        "mean_ms": round(statistics.mean(millis), 3),
+    }
+
+
+class Scenario:
+    """Questions of the benchmark and the scripted tool model answers.
+
+    Every `fail_every`-th question is first answered with SQL using an
+    unknown column, and with valid SQL once the prompt carries the repair
+    context of the rejected attempt, or when it is sampled with a higher
+    temperature (as speculative candidates are).
+    """
+
+    def __init__(self, dataset, project_id, dataset_id, fail_every=3):
+        self.dataset = dataset
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.fail_every = fail_every
+
+    def question(self, run):
+        table_id = self.dataset.tables[run % len(self.dataset.tables)]
+        return f"What is the total col_001 of {table_id} by col_000? (run {run})"
+
+    def metadata_question(self, run):
+        """A metadata question answered from the schema, without the model."""
+        table_id = self.dataset.tables[run % len(self.dataset.tables)]
+        return f"Describe table {table_id}"
+
+    def script(self, prompt, temperature=None):
+        match = QUESTION_PATTERN.search(prompt)
+        question = match.group(1) if match else ""
+        if "**Answer:**" in prompt:
+            return "The data is in the tables listed in the schema."
+
+        table_id = re.search(r"table_\d{4}", question).group(0)
+        run = int(re.search(r"run (\d+)", question).group(1))
+        value_column = "col_001"
+        if (
+            self.fail_every
+            and run % self.fail_every == 0
+            and "**Previous attempt:**" not in prompt
+            and (temperature or 0) <= 0.1
+        ):
+            value_column = "col_missing"
+        return (
+            "```sql\n"
+            f"SELECT col_000 AS label, SUM({value_column}) AS value\n"
+            f"FROM `{self.project_id}.{self.dataset_id}.{table_id}`\n"
+            "GROUP BY label\n"
+            "```"
+        )
+
+
+def tool_context(database_settings):
+    """A stand-in of ToolContext: the tools only use its state."""
+    return SimpleNamespace(
+        state={"schema_ref": tools.schema_reference(database_settings)}
+    )
+
+
+def clear_caches():
+    tools.get_sql_cache().clear()
+    tools.get_result_cache().clear()
+
+
+def configure(args):
+    """Applies the benchmark settings to the agent config."""
+    config = get_config()
+    # No files and no refresh thread
+    config.setdefault("snapshot", {}).update(store="memory", ttl_seconds=0)
+    config.setdefault("schema", {})["render_mode"] = args.render_mode
+    config.setdefault("context_cache", {})["enabled"] = not args.no_context_cache
+    config.setdefault("speculation", {}).update(
+        enabled=args.speculation > 0, candidates=args.speculation
+    )
+    config.setdefault("routing", {})["enabled"] = args.routing
+
+
+def install_clients(bq_client, llm_client, project_id, dataset_id):
+    tools.bq_client = bq_client
+    tools.llm_client = llm_client
+    tools.project_id = project_id
+    tools.dataset_id = dataset_id
+    tools.schema_registry = None
+    tools.snapshot_store = None
+    tools.context_cache_manager = None
+
+
+def bench_schema_build(args, latency):
+    """Times full and unchanged schema builds by number of tables."""
+    builds = []
+    for num_tables in args.table_counts:
+        dataset = fakes.SyntheticDataset(num_tables, args.columns)
+        client = fakes.FakeBigQueryClient(dataset, latency=latency)
+        render_config = get_config().get("schema", {})
+        profile_config = get_config().get("profiles", {})
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        built = snapshot.refresh_snapshot(
+            client, client.project, client.dataset_id,
+            max_workers=args.max_workers, render_config=render_config,
+            profile_config=profile_config,
+        )
+        build_seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        snapshot.refresh_snapshot(
+            client, client.project, client.dataset_id, previous=built,
+            max_workers=args.max_workers, render_config=render_config,
+            profile_config=profile_config,
+        )
+        refresh_seconds = time.perf_counter() - started
+
+        builds.append({
+            "tables": num_tables,
+            "columns": args.columns,
+            "build_ms": round(build_seconds * 1000, 3),
+            "unchanged_refresh_ms": round(refresh_seconds * 1000, 3),
+            "peak_traced_mb": round(peak / 2**20, 3),
+            "tokens": schema.token_stats(),
+            "bigquery_calls": client.calls.snapshot(),
+        })
+    return builds
+
+
+def bench_tools(args, scenario):
+    """Times the tool functions, cold (empty caches) and warm."""
+    stages = {}
+
+    def timed(stage, function, *function_args):
+        started = time.perf_counter()
+        result = function(*function_args)
+        stages.setdefault(stage, []).append(time.perf_counter() - started)
+        return result
+
+    database_settings = timed("get_database_settings", tools.get_database_settings)
+    attempts = []
+    for run in range(args.iterations):
+        question = scenario.question(run)
+
+        clear_caches()
+        context = tool_context(database_settings)
+        sql = timed("bq_nl2sql", tools.bq_nl2sql, question, context)
+        timed("run_bigquery_validation", tools.run_bigquery_validation, sql, context)
+
+        clear_caches()
+        context = tool_context(database_settings)
+        fused = timed(
+            "generate_and_validate_sql", tools.generate_and_validate_sql,
+            question, context,
+        )
+        attempts.append(fused["attempts"])
+        timed(
+            "generate_and_validate_sql_warm", tools.generate_and_validate_sql,
+            question, context,
+        )
+        timed(
+            "get_metadata_description", tools.get_metadata_description,
+            question, context,
+        )
+        timed(
+            "get_metadata_description_local", tools.get_metadata_description,
+            scenario.metadata_question(run), context,
+        )
+
+    context = tool_context(database_settings)
+    question = scenario.question(0)
+    prompt_tokens = {
+        "schema_full": retrieval.estimate_tokens(database_settings["bq_ddl_schema"]),
+        "nl2sql_inline": retrieval.estimate_tokens(
+            tools.build_nl2sql_prompt(question, context)
+        ),
+        "metadata_inline": retrieval.estimate_tokens(
+            tools.build_metadata_prompt(question, context)
+        ),
+    }
+    return stages, attempts, prompt_tokens
+
+
+async def bench_agent(args, scenario, root_model):
+    """Times `root_agent` turns through an ADK runner with in-memory sessions.
+
+    Returns:
+        tuple: The turn durations and the JSON size of the session state
+          after each turn.
+    """
+    agent.root_agent.model = root_model
+    runner = InMemoryRunner(agent=agent.root_agent, app_name="benchmark")
+    turns = []
+    state_bytes = []
+    for run in range(args.agent_turns):
+        clear_caches()
+        session = runner.session_service.create_session(
+            app_name="benchmark", user_id="bench_user"
+        )
+        message = types.Content(
+            role="user", parts=[types.Part(text=scenario.question(run))]
+        )
+        started = time.perf_counter()
+        async for _ in runner.run_async(
+            user_id="bench_user", session_id=session.id, new_message=message
+        ):
+            pass
+        turns.append(time.perf_counter() - started)
+        session = runner.session_service.get_session(
+            app_name="benchmark", user_id="bench_user", session_id=session.id
+        )
+        state_bytes.append(len(json.dumps(session.state, default=str)))
+    return turns, state_bytes
+
+
+def bench_burst(args, scenario, bq_client, llm_client):
+    """Runs concurrent cold-start sessions asking the same question.
+
+    Every session loads the schema, generates the SQL and runs it; the
+    identical work is coalesced, so the calls do not grow with the sessions.
+    """
+    clear_caches()
+    tools.schema_registry = None
+    tools.snapshot_store = None
+    bq_before = bq_client.calls.snapshot()
+    llm_before = llm_client.calls.snapshot()
+    question = scenario.question(1)
+
+    def session(_):
+        context = tool_context(tools.get_database_settings())
+        sql = tools.bq_nl2sql(question, context)
+        return tools.run_bigquery_validation(sql, context)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.burst_sessions) as executor:
+        list(executor.map(session, range(args.burst_sessions)))
+    wall_seconds = time.perf_counter() - started
+
+    bq_calls = bq_client.calls.snapshot()
+    llm_calls = llm_client.calls.snapshot()
+    return {
+        "sessions": args.burst_sessions,
+        "wall_ms": round(wall_seconds * 1000, 3),
+        "schema_metadata_calls": (
+            bq_calls.get("metadata", 0) - bq_before.get("metadata", 0)
+        ),
+        "query_calls": bq_calls.get("query", 0) - bq_before.get("query", 0),
+        "llm_calls": (
+            llm_calls.get("generate_content", 0) - llm_before.get("generate_content", 0)
+        ),
+        "coalesced": {
+            name: stats["coalesced"]
+            for name, stats in tools.get_coalescing_stats().items()
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    configure(args)
+    latency = {
+        "metadata": args.bq_latency_ms / 1000,
+        "list_rows": args.bq_latency_ms / 1000,
+        "dry_run": args.bq_latency_ms / 1000,
+        "query": args.bq_latency_ms / 1000,
+        "profile": args.bq_latency_ms / 1000,
+        "get_table": args.bq_latency_ms / 1000,
+    }
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        schema_builds = bench_schema_build(args, latency)
+
+        dataset = fakes.SyntheticDataset(args.tables, args.columns)
+        bq_client = fakes.FakeBigQueryClient(
+            dataset, latency=latency, result_rows=args.result_rows
+        )
+        scenario = Scenario(
+            dataset, bq_client.project, bq_client.dataset_id, args.fail_every
+        )
+        llm_client = fakes.FakeGenAIClient(
+            scenario.script, latency=args.llm_latency_ms / 1000
+        )
+        install_clients(bq_client, llm_client, bq_client.project, bq_client.dataset_id)
+
+        stages, attempts, prompt_tokens = bench_tools(args, scenario)
+        root_model = fakes.FakeRootModel(latency=args.root_latency_ms / 1000)
+        stages["agent_turn"], state_bytes = asyncio.run(
+            bench_agent(args, scenario, root_model)
+        )
+        burst = bench_burst(args, scenario, bq_client, llm_client)
+
+    llm_calls = llm_client.calls.snapshot()
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "parameters": vars(args),
+        },
+        "schema_build": schema_builds,
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+        "prompt_tokens": dict(
+            prompt_tokens,
+            llm_input_per_call=round(
+                llm_calls.get("input_tokens", 0)
+                / max(llm_calls.get("generate_content", 1), 1), 1
+            ),
+        ),
+        "repair": {
+            "questions": len(attempts),
+            "mean_attempts": round(statistics.mean(attempts), 3) if attempts else 0,
+        },
+        "burst": burst,
+        "calls": {
+            "bigquery": bq_client.calls.snapshot(),
+            "llm": llm_calls,
+            "root_llm": root_model.calls,
+            "context_cache": tools.get_context_cache().stats(),
+            "speculation": tools.get_speculation_stats(),
+            "routing": tools.get_routing_stats(),
+        },
+        "memory": {
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            "peak_rss_mb": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / (2**20 if sys.platform == "darwin" else 2**10), 1
+            ),
+            "session_state_bytes": max(state_bytes, default=0),
+        },
+    }
+
+
+def flatten(value, prefix=""):
+    """Flattens the numeric leaves of nested results into dotted keys."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = ((item.get("tables", i), item) for i, item in enumerate(value))
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) else {}
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def compare(baseline, results):
+    """Prints the metrics that changed between two result files."""
+    before = flatten({k: v for k, v in baseline.items() if k != "meta"})
+    after = flatten({k: v for k, v in results.items() if k != "meta"})
+    print(f"{'metric':60} {'baseline':>12} {'current':>12} {'change':>9}")
+    for key in sorted(set(before) | set(after)):
+        old, new = before.get(key), after.get(key)
+        if old == new:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else ""
+        print(f"{key:60} {str(old):>12} {str(new):>12} {change:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tables", type=int, default=20, help="Tables of the dataset")
+    parser.add_argument("--columns", type=int, default=12, help="Columns per table")
+    parser.add_argument(
+        "--table-counts", type=int, nargs="+", default=[10, 50, 100, 200],
+        help="Table counts of the schema build benchmark",
+    )
+    parser.add_argument("--iterations", type=int, default=20, help="Questions per tool")
+    parser.add_argument("--agent-turns", type=int, default=10, help="Agent turns")
+    parser.add_argument("--bq-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--root-latency-ms", type=float, default=20.0)
+    parser.add_argument("--result-rows", type=int, default=100)
+    parser.add_argument(
+        "--burst-sessions", type=int, default=16,
+        help="Concurrent sessions asking the same question",
+    )
+    parser.add_argument(
+        "--fail-every", type=int, default=3,
+        help="Every n-th question first gets invalid SQL (0 for none)",
+    )
+    parser.add_argument("--max-workers", type=int, default=schema.DEFAULT_MAX_WORKERS)
+    parser.add_argument("--render-mode", default="compact", choices=["compact", "ddl"])
+    parser.add_argument("--no-context-cache", action="store_true")
+    parser.add_argument(
+        "--speculation", type=int, default=0,
+        help="Speculative SQL candidates per question (0 to disable)",
+    )
+    parser.add_argument(
+        "--routing", action="store_true",
+        help="Route the SQL generations between the tool models of routing.tiers",
+    )
+    parser.add_argument("--output", help="Results JSON file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON file to compare with")
+    args = parser.parse_args(argv)
+    args.columns = max(args.columns, 4)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.ERROR)
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True, default=str)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True, default=str))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,4 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from . import startup
 from . import agent
+
+startup.record("import_seconds", startup.since_start())
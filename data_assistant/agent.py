@@ -15,27 +15,26 @@
 """BQ Data Assistant: get data from database (BigQuery) using NL2SQL."""
 
 import logging
-import yaml
-from pathlib import Path
+from typing import Optional
 
 from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
 from google.genai import types
 
+from . import async_tools
+from . import output
+from . import telemetry
 from . import tools
 from .prompts import build_prompt
-from .utils import get_env_var
+from .utils import get_config, get_env_var
 
 # Env Variables
 from dotenv import load_dotenv
 load_dotenv()
 
 # Load agent config
-script_dir = Path(__file__).parent.absolute()
-config_path = script_dir / 'config.yaml'
-
-with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)
+config = get_config()
 
 # Print settings 
 metadata_mode = config['settings']['metadata_mode']
@@ -44,30 +43,93 @@ logging.info(F"Metadata Mode: {metadata_mode}")
 output_mode = config['settings']['output_mode']
 logging.info(F"Output Mode: {output_mode}")
 
+workflow_mode = config['settings'].get('workflow_mode', 'STEPWISE')
+logging.info(F"Workflow Mode: {workflow_mode}")
+
 
 # Build the prompt instructions based on the modes selected
-prompt_instructions = build_prompt(metadata_mode, output_mode)
+prompt_instructions = build_prompt(metadata_mode, output_mode, workflow_mode)
+
+# asyncio variants let concurrent sessions overlap their LLM and BigQuery calls
+tool_module = (
+    async_tools
+    if config.get('async_tools', {}).get('enabled', False)
+    else tools
+)
+
+# FUSED runs the generate/validate/repair loop inside one tool call
+if workflow_mode == "FUSED":
+    SQL_TOOLS = [tool_module.generate_and_validate_sql]
+else:
+    SQL_TOOLS = [
+        tool_module.bq_nl2sql,
+        tool_module.run_bigquery_validation
+        ]
 
 # Selecting the tools based on metadata mode 
 # This reinforce the Agent not use the metadata_description when metadata is disabled
 if metadata_mode == "ON":
-    TOOLS = [
-        tools.get_metadata_description, 
-        tools.bq_nl2sql, 
-        tools.run_bigquery_validation
-        ]
+    TOOLS = [tool_module.get_metadata_description] + SQL_TOOLS
 else: 
-    TOOLS = [
-        tools.bq_nl2sql,
-        tools.run_bigquery_validation
-        ]
+    TOOLS = SQL_TOOLS
 
 def setup_before_agent_call(callback_context: CallbackContext) -> None:
     """Setup the agent."""
 
-    if "database_settings" not in callback_context.state:
-        callback_context.state["database_settings"] = \
-            tools.get_database_settings() 
+    # Repair context, SQL and results of a previous question do not apply to
+    # a new one (the previous result stays readable by its handle)
+    for key in (
+        "last_validation", "sql_query", "query_result_handle", "sql_check", "sql_route",
+    ):
+        if callback_context.state.get(key):
+            callback_context.state[key] = None
+    telemetry.reset_turn(callback_context.state)
+
+    # Sessions pick their dataset with the "bq_project_id" and "bq_dataset_id"
+    # state keys, set when the session is created (default: the env dataset)
+    with telemetry.span("schema_load", callback_context.state) as stage:
+        database_settings = tools.get_database_settings(
+            callback_context.state.get("bq_project_id"),
+            callback_context.state.get("bq_dataset_id"),
+        )
+        stage.set(
+            dataset=database_settings["bq_project_id"] + "."
+            + database_settings["bq_dataset_id"],
+            schema_version=database_settings["bq_schema_version"],
+        )
+    # The session keeps a reference, the tools resolve the DDL in the registry
+    schema_ref = tools.schema_reference(database_settings)
+    if callback_context.state.get("schema_ref") != schema_ref:
+        callback_context.state["schema_ref"] = schema_ref
+    # Schema and rows copied into sessions by previous versions of the agent
+    for key in ("database_settings", "query_result"):
+        if callback_context.state.get(key):
+            callback_context.state[key] = None
+
+def assemble_detailed_output(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> Optional[LlmResponse]:
+    """Builds the DETAILED output of the final response from the state.
+
+    The model writes the `explain` and `final_answer`; the `sql` and
+    `sql_results` of the turn are taken from the session state.
+    """
+    text = output.final_text(llm_response)
+    if text is None:
+        return None
+
+    state = callback_context.state
+    with telemetry.span("assemble_output", state) as stage:
+        answer = output.parse_model_answer(text)
+        sql_results = tools.get_query_result(state.get("query_result_handle"))
+        stage.set(
+            explained=answer["explain"] is not None,
+            rows=len(sql_results) if sql_results is not None else None,
+        )
+        detailed = output.build_detailed_output(
+            answer, state.get("sql_query"), sql_results
+        )
+    return output.replace_text(llm_response, detailed)
 
 root_agent = Agent(
     model=get_env_var("AGENT_ROOT_MODEL"),
@@ -75,5 +137,8 @@ root_agent = Agent(
     instruction=prompt_instructions,
     tools=TOOLS,
     before_agent_callback=setup_before_agent_call,
+    after_model_callback=(
+        assemble_detailed_output if output_mode == "DETAILED" else None
+    ),
     generate_content_config=types.GenerateContentConfig(temperature=0.01),
 )
\ No newline at end of file
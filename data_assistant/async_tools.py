@@ -0,0 +1,339 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""asyncio variants of the tools in tools.py.
+
+The functions keep the names and contracts of their blocking counterparts, so
+the agent instructions are the same. Gemini is called through `client.aio`,
+blocking BigQuery calls run in worker threads and query jobs are polled with
+`asyncio.sleep`, so concurrent sessions sharing an event loop overlap their
+I/O. Timeouts come from the `async_tools` section of config.yaml; a query job
+is cancelled when its tool call times out or is cancelled.
+"""
+
+import asyncio
+import logging
+import time
+
+from google.adk.tools import ToolContext
+
+from . import cache
+from . import results
+from . import singleflight
+from . import telemetry
+from . import tools
+from .utils import get_config, get_env_var
+
+
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 1.0
+
+
+def _timeout(name):
+    return get_config().get("async_tools", {}).get(name) or None
+
+
+async def _generate_content(model, contents, config):
+    """Calls a tool model without blocking the event loop."""
+    return await asyncio.wait_for(
+        tools.get_llm_client().aio.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config,
+        ),
+        timeout=_timeout("llm_timeout_seconds"),
+    )
+
+
+async def _generate_tool_content(kind, question, tool_context, temperature, model=None):
+    """Calls the tool model with the prompt of a kind, cached when possible.
+
+    See `tools.generate_tool_content`.
+    """
+    model = model or get_env_var("AGENT_TOOL_MODEL")
+    contents, cached_content = await asyncio.to_thread(
+        tools.prompt_request, kind, question, tool_context, False, model
+    )
+    started = time.monotonic()
+    try:
+        with telemetry.span("llm_call", tool_context.state, kind=kind, model=model) as stage:
+            try:
+                response = await _generate_content(
+                    model, contents, tools.generation_config(temperature, cached_content)
+                )
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if cached_content is None:
+                    raise
+                logging.warning("Cached prompt failed, retrying inline: %s", e)
+                tools.get_context_cache().invalidate(cached_content)
+                stage.set(retried_inline=True)
+                contents, _ = await asyncio.to_thread(
+                    tools.prompt_request, kind, question, tool_context, True, model
+                )
+                response = await _generate_content(
+                    model, contents, tools.generation_config(temperature, None)
+                )
+            stage.set(**telemetry.llm_usage(response))
+    except Exception:
+        tools.model_stats.record_call(model, time.monotonic() - started, ok=False)
+        raise
+    tools.model_stats.record_call(model, time.monotonic() - started)
+    tools.record_llm_usage(response)
+    return response
+
+
+async def _coalesce(flight, key, tool_context, function, *args):
+    """Awaits `function(*args)`, or shares the result of the same running call.
+
+    See `tools.coalesce`.
+    """
+    with telemetry.span("coalesce", tool_context.state, group=flight.name) as stage:
+        result, shared = await flight.do_async(key, function, *args)
+        stage.set(shared=shared)
+    return result, shared
+
+
+async def _wait_for_job(query_job):
+    """Polls a query job until it is done, backing off up to POLL_MAX_DELAY."""
+    delay = POLL_INITIAL_DELAY
+    while not await asyncio.to_thread(query_job.done):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+async def _execute_query(sql_string):
+    """Executes a query, cancelling its job on timeout or cancellation.
+
+    See `tools.execute_query`.
+    """
+    query_job = await asyncio.to_thread(tools.start_query, sql_string)
+    try:
+        await asyncio.wait_for(
+            _wait_for_job(query_job), timeout=_timeout("query_timeout_seconds")
+        )
+    except asyncio.TimeoutError:
+        await asyncio.to_thread(query_job.cancel)
+        raise
+    except asyncio.CancelledError:
+        query_job.cancel()
+        raise
+    result_schema, table = await asyncio.to_thread(
+        results.fetch_arrow, query_job, tools.MAX_NUM_ROWS
+    )
+    return result_schema, table, telemetry.job_attributes(query_job)
+
+
+async def get_metadata_description(
+    question: str,
+    tool_context: ToolContext,
+) -> str:
+    """
+    Analyzes the database schema to answer natural language questions about
+    data location and structure (e.g., "Which table has X?", "Describe table Y.").
+    It does NOT generate SQL.
+
+    Args:
+        question (str): The natural language metadata question.
+        tool_context (ToolContext): The tool context containing the schema.
+
+    Returns:
+        str: A natural language answer to the metadata question.
+    """
+    answer = await asyncio.to_thread(
+        tools.local_metadata_answer, question, tool_context
+    )
+    if answer is not None:
+        return tools.save_metadata_answer(question, answer, tool_context)
+
+    response = await _generate_tool_content(
+        "metadata", question, tool_context, temperature=0.0
+    )
+    return tools.save_metadata_answer(question, response.text, tool_context)
+
+
+async def bq_nl2sql(
+    question: str,
+    tool_context: ToolContext,
+) -> str:
+    """Generates an initial SQL query from a natural language question.
+
+    Args:
+        question (str): Natural language question.
+        tool_context (ToolContext): The tool context to use for generating the SQL
+          query.
+
+    Returns:
+        str: An SQL statement to answer this question.
+    """
+    cached_sql = tools.get_cached_sql(question, tool_context)
+    if cached_sql is not None:
+        return cached_sql
+
+    model = await asyncio.to_thread(tools.route_sql_model, question, tool_context)
+    if tools.speculation_config().get("enabled", False):
+        speculation, _ = await _coalesce(
+            tools.nl2sql_flight,
+            ("speculation",) + tools.nl2sql_flight_key(tool_context, model),
+            tool_context, _speculate_sql, question, tool_context, model,
+        )
+        if speculation is not None:
+            return tools.save_speculation(question, speculation, tool_context)
+
+    response, _ = await _coalesce(
+        tools.nl2sql_flight, tools.nl2sql_flight_key(tool_context, model), tool_context,
+        _generate_tool_content, "nl2sql", question, tool_context, 0.1, model,
+    )
+    return tools.save_generated_sql(question, response.text, tool_context)
+
+
+async def _sql_candidate(index, question, temperature, tool_context, checks, model):
+    """Generates and checks a SQL candidate. See `tools._sql_candidate`."""
+    context = tools.candidate_context(tool_context)
+    response = await _generate_tool_content(
+        "nl2sql", question, context, temperature, model
+    )
+    sql = tools.clean_generated_sql(response.text or "")
+    settings = await asyncio.to_thread(tools.session_settings, context)
+    check, duplicate = await checks.do_async(
+        cache.canonicalize_sql(sql),
+        asyncio.to_thread, tools.check_sql_candidate, sql, settings,
+    )
+    return tools.candidate_result(index, sql, check, duplicate, context)
+
+
+async def _speculate_sql(question, tool_context, model=None):
+    """Generates SQL candidates concurrently and selects one.
+
+    See `tools.speculate_sql`. The candidates that are not needed are
+    cancelled, including their running model calls.
+    """
+    temperatures = tools.candidate_temperatures()
+    select = tools.speculation_config().get("select", "first")
+    checks = singleflight.SingleFlight("sql_candidate")
+    with telemetry.span(
+        "speculation", tool_context.state, candidates=len(temperatures), select=select
+    ) as stage:
+        tasks = [
+            asyncio.create_task(
+                _sql_candidate(
+                    index, question, temperature, tool_context, checks, model
+                )
+            )
+            for index, temperature in enumerate(temperatures)
+        ]
+        candidates = []
+        try:
+            for next_candidate in asyncio.as_completed(tasks):
+                try:
+                    candidates.append(await next_candidate)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.warning("SQL candidate failed: %s", e)
+                    continue
+                if select == "first" and candidates[-1]["valid"]:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        speculation = tools.select_candidate(candidates, select, len(temperatures))
+        if speculation is not None:
+            stage.set(**speculation["summary"])
+    return speculation
+
+
+async def run_bigquery_validation(
+    sql_string: str,
+    tool_context: ToolContext,
+) -> dict:
+    """Validates BigQuery SQL syntax and functionality.
+
+    Dry runs the SQL (rejecting DML/DDL, invalid or over-budget queries),
+    executes it and returns its first rows. See
+    `tools.run_bigquery_validation` for the checks and the result format.
+
+    Args:
+        sql_string (str): The SQL query string to validate.
+        tool_context (ToolContext): The tool context to use for validation.
+
+    Returns:
+        dict: The validation result with the `query_result` rows (the first
+          rows and a `result_summary` of large results) or an `error_message`.
+    """
+    final_result, plan = await asyncio.to_thread(
+        tools.prepare_validation, sql_string, tool_context
+    )
+    if plan is None:
+        return final_result
+
+    try:
+        with telemetry.span("execute", tool_context.state) as stage:
+            # Sessions running the same query at the same time share one job
+            (result_schema, table, job), shared = await tools.query_flight.do_async(
+                plan["result_key"], _execute_query, plan["sql_string"]
+            )
+            stage.set(shared=shared, **({} if shared else job))
+        await asyncio.to_thread(
+            tools.save_query_results,
+            final_result, plan, result_schema, table, tool_context,
+        )
+
+    except asyncio.TimeoutError:
+        final_result["error_message"] = (
+            "Invalid SQL: Query did not finish within "
+            f"{_timeout('query_timeout_seconds')} seconds and was cancelled."
+        )
+        tools.reject_sql(
+            plan["sql_string"], tools.bigquery_errors(final_result), tool_context
+        )
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        final_result["error_message"] = f"Invalid SQL: {e}"
+        tools.reject_sql(
+            plan["sql_string"], tools.bigquery_errors(final_result), tool_context
+        )
+
+    logging.debug("run_bigquery_validation result: %s", final_result)
+
+    return final_result
+
+
+async def generate_and_validate_sql(
+    question: str,
+    tool_context: ToolContext,
+) -> dict:
+    """Generates, validates and executes the SQL of a question, repairing it.
+
+    See `tools.generate_and_validate_sql`.
+
+    Args:
+        question (str): Natural language question.
+        tool_context (ToolContext): The tool context.
+
+    Returns:
+        dict: The final `sql`, `query_result`, `error_message`, `attempts`
+          and `repair_history`.
+    """
+    final_result = None
+    history = []
+    for attempt in range(1, tools.max_repair_attempts() + 1):
+        with telemetry.span("repair_attempt", tool_context.state, attempt=attempt) as stage:
+            sql = await bq_nl2sql(question, tool_context)
+            final_result = await run_bigquery_validation(sql, tool_context)
+            history.append(tools.repair_step(attempt, sql, final_result))
+            stage.set(failed=tools.validation_failed(final_result))
+        if not tools.validation_failed(final_result):
+            break
+
+    return tools.fused_result(history, final_result)
+
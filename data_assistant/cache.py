@@ -0,0 +1,222 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process caches shared by all sessions of the agent."""
+
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+SQL_TOKEN_PATTERN = re.compile(
+    r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)"""
+    r"""|(--[^\n]*|#[^\n]*|/\*.*?\*/)"""
+    r"""|([^'"`\-#/]+|.)""",
+    re.DOTALL,
+)
+
+# Words, comparison operators and arithmetic signs of a question
+QUESTION_TOKEN_PATTERN = re.compile(r"\w+|[<>=!]+|[-+*/%]")
+
+
+def fingerprint_question(question):
+    """Normalizes a question so that trivial variations map to the same key.
+
+    Case, accents, punctuation and whitespace are ignored, e.g.
+    "Quantos   pedidos em São Paulo?" and "quantos pedidos em sao paulo"
+    have the same fingerprint. Comparison operators and signs are kept, so
+    "amount > 100" and "amount < 100" do not.
+
+    Args:
+        question (str): Natural language question.
+
+    Returns:
+        str: The question fingerprint.
+    """
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(QUESTION_TOKEN_PATTERN.findall(text))
+
+
+def schema_key(database_settings):
+    """Returns the cache key of a dataset schema: `project.dataset:version`.
+
+    Data derived from a schema is keyed by the dataset as well as by the
+    schema version, so that datasets never share entries.
+    """
+    return (
+        f"{database_settings.get('bq_project_id')}."
+        f"{database_settings.get('bq_dataset_id')}:"
+        f"{database_settings.get('bq_schema_version')}"
+    )
+
+
+def canonicalize_sql(sql):
+    """Normalizes a SQL string so that equivalent texts map to the same key.
+
+    Comments are removed, whitespace is collapsed and keywords are lowercased.
+    String literals and backtick-quoted identifiers are kept as they are,
+    whitespace included.
+
+    Args:
+        sql (str): SQL query.
+
+    Returns:
+        str: The canonical SQL.
+    """
+    parts = []
+    code = []  # SQL text since the last literal
+    for match in SQL_TOKEN_PATTERN.finditer(sql):
+        literal, comment, other = match.groups()
+        if literal is not None:
+            parts.append(re.sub(r"\s+", " ", "".join(code)))
+            parts.append(literal)
+            code = []
+        elif comment is None:
+            code.append(other.lower())
+        else:
+            code.append(" ")
+    parts.append(re.sub(r"\s+", " ", "".join(code)))
+    canonical = "".join(parts).strip()
+    return canonical.rstrip(";").strip()
+
+
+def approximate_size(value):
+    """Approximates the memory footprint of a cached value in bytes."""
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            approximate_size(k) + approximate_size(v) for k, v in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+class CacheStore:
+    """Interface of a key-value cache backend.
+
+    The in-process `LRUCache` is the default. A client of an external store
+    (e.g. Memorystore) implementing the same methods can replace it to share
+    entries between replicas.
+    """
+
+    def get_entry(self, key):
+        """Returns (value, age in seconds) of a key, or None."""
+        raise NotImplementedError
+
+    def put(self, key, value):
+        """Stores a value."""
+        raise NotImplementedError
+
+    def pop(self, key):
+        """Removes a key if present."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Returns usage counters."""
+        return {}
+
+
+class LRUCache(CacheStore):
+    """Thread-safe LRU cache with a TTL and entry count and size bounds.
+
+    Args:
+        max_entries (int): Maximum number of entries.
+        max_bytes (int): Maximum approximate size of all values.
+        ttl_seconds (float): Entry lifetime. Entries never expire when 0.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=10_000_000, ttl_seconds=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the value of a key, or `default` if missing or expired."""
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """Returns (value, age in seconds) of a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], time.time() - entry[2]
+
+    def put(self, key, value):
+        """Stores a value, evicting the least recently used entries if needed.
+
+        Values larger than `max_bytes` are not stored.
+        """
+        size = approximate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.time())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def pop(self, key):
+        """Removes a key if present."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry):
+        return self.ttl_seconds > 0 and time.time() - entry[2] > self.ttl_seconds
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
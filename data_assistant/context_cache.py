@@ -0,0 +1,235 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Gemini context cache handles of the stable prompt prefixes.
+
+The tool prompts start with a prefix (instructions and full schema) that only
+changes with the schema version. The prefix is stored once as an explicit
+cached content per (prompt kind, dataset, schema version, model), and the calls only
+send the question. Handles are refreshed before they expire, deleted when a
+new schema version replaces them, and callers fall back to inline prompts
+whenever no handle is available.
+
+Only `client.caches.create`, `update` and `delete` are used, so the manager
+can be exercised with a local fake of `google.genai.Client`.
+"""
+
+import logging
+import threading
+import time
+
+from . import retrieval
+from . import singleflight
+
+
+class ContextCacheManager:
+    """Creates, reuses, refreshes and expires cached content handles.
+
+    Args:
+        client (google.genai.Client): The Gemini client.
+        enabled (bool): Whether handles are created at all.
+        ttl_seconds (int): Lifetime of a cached content.
+        refresh_margin_seconds (int): A handle is extended when it expires in
+          less than this.
+        min_tokens (int): Prefixes estimated below this are sent inline, as
+          the API rejects small cached contents.
+        retry_seconds (int): Time before retrying a prefix whose creation
+          failed.
+        clock (callable): Returns the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        enabled=True,
+        ttl_seconds=3600,
+        refresh_margin_seconds=300,
+        min_tokens=4096,
+        retry_seconds=300,
+        clock=time.time,
+    ):
+        self.client = client
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.min_tokens = min_tokens
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self._handles = {}  # (kind, scope, version, model) -> (name, expires_at)
+        self._failed_until = {}
+        # Guards the handles and counters, never held during remote calls
+        self._lock = threading.Lock()
+        # One creation or refresh per key at a time
+        self._flight = singleflight.SingleFlight("context_cache")
+        self._stats = {
+            "created": 0,
+            "refreshed": 0,
+            "deleted": 0,
+            "failures": 0,
+            "calls": 0,
+            "cached_calls": 0,
+            "cached_input_tokens": 0,
+            "uncached_input_tokens": 0,
+        }
+
+    def get(self, kind, version, model, prefix, scope=None):
+        """Returns the cached content name of a prompt prefix, or None.
+
+        The remote calls creating or refreshing a handle are made without
+        holding the manager lock: the callers needing the same handle share
+        one call, and the other handles stay available meanwhile.
+
+        Args:
+            kind (str): The prompt kind, e.g. "nl2sql".
+            version (str): The schema version the prefix was built from.
+            model (str): The model the handle is created for.
+            prefix (str): The prompt prefix.
+            scope (str): The dataset of the schema, e.g. "project.dataset".
+              Only the handles of other versions of the same scope are
+              expired.
+
+        Returns:
+            str: The cached content name to pass as `cached_content`, or None
+              when the prompt must be sent inline.
+        """
+        if not self.enabled or retrieval.estimate_tokens(prefix) < self.min_tokens:
+            return None
+
+        key = (kind, scope, version, model)
+        with self._lock:
+            now = self.clock()
+            if self._failed_until.get(key, 0) > now:
+                return None
+            expired = self._pop_other_versions(key)
+            handle = self._handles.get(key)
+        for name in expired:
+            self._delete(name)
+        if handle is not None and handle[1] - now > self.refresh_margin_seconds:
+            return handle[0]
+
+        name, _ = self._flight.do(key, self._renew, key, prefix)
+        return name
+
+    def _renew(self, key, prefix):
+        """Refreshes the handle of a key if it is still valid, or creates it."""
+        with self._lock:
+            now = self.clock()
+            handle = self._handles.get(key)
+        if handle is not None:
+            name, expires_at = handle
+            # Renewed by a call that finished since `get` looked
+            if expires_at - now > self.refresh_margin_seconds:
+                return name
+            if expires_at > now and self._refresh(key, name, now):
+                return name
+            with self._lock:
+                if self._handles.get(key) == handle:
+                    del self._handles[key]
+        return self._create(key, prefix, now)
+
+    def _create(self, key, prefix, now):
+        kind, _, version, model = key
+        try:
+            cached = self.client.caches.create(
+                model=model,
+                config={
+                    "contents": [prefix],
+                    "ttl": f"{self.ttl_seconds}s",
+                    "display_name": f"data-assistant-{kind}-{version}",
+                },
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.warning("Context cache creation failed, using inline prompts: %s", e)
+            with self._lock:
+                self._stats["failures"] += 1
+                self._failed_until[key] = now + self.retry_seconds
+            return None
+        with self._lock:
+            self._stats["created"] += 1
+            self._handles[key] = (cached.name, now + self.ttl_seconds)
+        return cached.name
+
+    def _refresh(self, key, name, now):
+        try:
+            self.client.caches.update(name=name, config={"ttl": f"{self.ttl_seconds}s"})
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.warning("Context cache refresh of %s failed: %s", name, e)
+            return False
+        with self._lock:
+            self._stats["refreshed"] += 1
+            self._handles[key] = (name, now + self.ttl_seconds)
+        return True
+
+    def _pop_other_versions(self, current):
+        """Forgets the handles of previous schema versions of a prompt.
+
+        Called with the lock held; returns the names to delete.
+        """
+        kind, scope, version, model = current
+        return [
+            self._handles.pop(key)[0]
+            for key in list(self._handles)
+            if key[:2] == (kind, scope) and key[3] == model and key[2] != version
+        ]
+
+    def _delete(self, name):
+        try:
+            self.client.caches.delete(name=name)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # It expires on its own
+            logging.info("Context cache deletion of %s failed: %s", name, e)
+            return
+        with self._lock:
+            self._stats["deleted"] += 1
+
+    def invalidate(self, name):
+        """Forgets a handle the API no longer knows (e.g. expired early)."""
+        with self._lock:
+            for key, handle in list(self._handles.items()):
+                if handle[0] == name:
+                    self._handles.pop(key)
+
+    def clear(self):
+        """Deletes every handle."""
+        with self._lock:
+            names = [name for name, _ in self._handles.values()]
+            self._handles.clear()
+        for name in names:
+            self._delete(name)
+
+    def record_usage(self, response):
+        """Records the cached and uncached input tokens of a model response.
+
+        Returns:
+            dict: The `cached_input_tokens` and `uncached_input_tokens` of the
+              call.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        call_usage = {
+            "cached_input_tokens": cached_tokens,
+            "uncached_input_tokens": max(prompt_tokens - cached_tokens, 0),
+        }
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["cached_calls"] += 1 if cached_tokens else 0
+            for name, tokens in call_usage.items():
+                self._stats[name] += tokens
+        return call_usage
+
+    def stats(self):
+        """Returns the handle and token counters."""
+        with self._lock:
+            return dict(self._stats, handles=len(self._handles))
@@ -0,0 +1,394 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local answers to metadata questions, without a model call.
+
+The schema (any render mode of `schema_render.py`) is parsed back into
+tables and columns, and an inverted index maps the terms of table names,
+column names and descriptions to them. Terms are normalized like the
+retrieval index (accents, case, plurals) and question terms missing from the
+index are matched fuzzily (typos, prefixes such as "addr" -> "address").
+
+Three kinds of questions are answered locally:
+
+- listing the tables ("which tables are there?");
+- describing a table ("describe table orders"), formatted from the parsed
+  columns;
+- finding where information is ("which table has the customer email?").
+
+Each answer comes with a confidence; below `metadata.min_confidence` the
+tool falls back to the model.
+"""
+
+import difflib
+import math
+import re
+
+from . import cache
+from . import retrieval
+
+
+# Index term weights by the field they come from
+TABLE_NAME_WEIGHT = 3.0
+COLUMN_NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Minimum similarity of a fuzzy match of a question term
+FUZZY_CUTOFF = 0.8
+# Similarity of a prefix match, e.g. "addr" for "address"
+PREFIX_SIMILARITY = 0.85
+MIN_PREFIX_CHARS = 4
+
+# Columns listed per table in a lookup answer
+MAX_COLUMNS_PER_TABLE = 5
+
+DESCRIBE_PATTERN = re.compile(
+    r"\b(describe|description of|structure|schema of|columns? (of|in)|fields? (of|in)"
+    r"|what columns|which columns|descreva|descrever|estrutura|colunas? d[aoe]"
+    r"|campos? d[aoe]|quais colunas|quais campos)\b",
+    re.IGNORECASE,
+)
+LIST_TABLES_PATTERN = re.compile(
+    r"\b(list|show|what|which|available|quais|liste|mostre|existem)\b.*\btables\b"
+    r"|\btables\b.*\b(available|exist|are there)\b"
+    r"|\b(quais|liste|mostre)\b.*\btabelas\b|\btabelas\b.*\b(existem|disponiveis)\b",
+    re.IGNORECASE,
+)
+
+# Question words of lookups that do not name the information itself
+LOOKUP_STOPWORDS = {
+    "table", "column", "colum", "field", "has", "have", "having", "contain",
+    "where", "can", "could", "we", "my", "our", "find", "located", "locate",
+    "stored", "store", "kept", "information", "info", "data", "about",
+    "database", "schema", "describe", "description", "structure",
+    "it", "be", "would", "should", "look", "need", "want", "know",
+    "tem", "possui", "contem", "onde", "encontro", "encontrar", "acho",
+    "achar", "fica", "ficam", "esta", "estao", "campo", "coluna", "informacao",
+    "informacoe", "dado", "sobre", "descreva", "estrutura", "banco",
+    "guardado", "armazenado", "se",
+    # Listing tables
+    "available", "exist", "existem", "disponivei", "dataset",
+}
+
+# Indexes of the most recently used schemas, keyed by dataset and version.
+_index_cache = cache.LRUCache(max_entries=retrieval.MAX_CACHED_SCHEMAS)
+
+
+class SchemaColumn:
+    """A column line of a rendered table."""
+
+    def __init__(self, name, data_type, description=None, examples=None):
+        self.name = name
+        self.data_type = data_type
+        self.description = description
+        self.examples = examples
+
+
+class SchemaTable:
+    """A table of a rendered schema."""
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.table_id = name.rsplit(".", 1)[-1]
+        self.columns = columns
+
+
+def unquote_string(literal):
+    """Reverses `schema_render.quote_string`."""
+    escapes = {"n": "\n", "r": "\r"}
+    return re.sub(
+        r"\\(.)", lambda match: escapes.get(match.group(1), match.group(1)),
+        literal[1:-1],
+    )
+
+
+def parse_column(line):
+    """Parses a column line of the DDL or compact rendering, or returns None."""
+    match = re.match(r"^  `([^`]+)` (.*?),?$", line)
+    if match is None:
+        return None
+    name, rest = match.groups()
+
+    # DDL: `col` TYPE [ARRAY] [COMMENT '...']
+    data_type, comment, literal = rest.partition(" COMMENT '")
+    if comment:
+        return SchemaColumn(name, data_type, unquote_string("'" + literal))
+
+    # Compact: `col` TYPE [-- description. e.g. examples]
+    data_type, separator, comment = rest.partition(" -- ")
+    if not separator:
+        return SchemaColumn(name, data_type)
+    if comment.startswith("e.g. "):
+        return SchemaColumn(name, data_type, examples=comment[len("e.g. "):])
+    description, separator, examples = comment.rpartition(". e.g. ")
+    if not separator:
+        return SchemaColumn(name, data_type, description=comment)
+    return SchemaColumn(name, data_type, description, examples)
+
+
+def parse_schema(ddl_schema):
+    """Parses a rendered schema into SchemaTable objects."""
+    tables = []
+    for name, ddl in retrieval.split_tables(ddl_schema).items():
+        lines = ddl.split("\n);", 1)[0].split("\n")[1:]
+        columns = [column for column in map(parse_column, lines) if column]
+        tables.append(SchemaTable(name, columns))
+    return tables
+
+
+def lookup_terms(question):
+    """Returns the distinct question terms naming the information looked up."""
+    return [
+        term for term in dict.fromkeys(index_terms(question))
+        if term not in LOOKUP_STOPWORDS
+    ]
+
+
+def index_terms(text):
+    """Splits identifiers and text into normalized index terms."""
+    # camelCase and dotted STRUCT paths
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).replace(".", " ")
+    return retrieval.tokenize(text)
+
+
+class MetadataIndex:
+    """Inverted index over the table names, column names and descriptions.
+
+    Args:
+        ddl_schema (str): The rendered schema of the dataset.
+    """
+
+    def __init__(self, ddl_schema):
+        self.tables = parse_schema(ddl_schema)
+        # term -> {(table index, column index or None): weight}
+        self.postings = {}
+        for i, table in enumerate(self.tables):
+            self._add(index_terms(table.table_id), (i, None), TABLE_NAME_WEIGHT)
+            for j, column in enumerate(table.columns):
+                self._add(index_terms(column.name), (i, j), COLUMN_NAME_WEIGHT)
+                if column.description:
+                    self._add(
+                        index_terms(column.description), (i, j), DESCRIPTION_WEIGHT
+                    )
+        self.vocabulary = sorted(self.postings)
+        self.num_entries = sum(len(t.columns) + 1 for t in self.tables)
+
+    def _add(self, terms, entry, weight):
+        for term in terms:
+            entries = self.postings.setdefault(term, {})
+            entries[entry] = max(entries.get(entry, 0), weight)
+
+    def match(self, term):
+        """Returns the index terms matching a question term and their similarity."""
+        if term in self.postings:
+            return {term: 1.0}
+        matches = {
+            candidate: difflib.SequenceMatcher(None, term, candidate).ratio()
+            for candidate in difflib.get_close_matches(
+                term, self.vocabulary, n=3, cutoff=FUZZY_CUTOFF
+            )
+        }
+        if len(term) >= MIN_PREFIX_CHARS:
+            for candidate in self.vocabulary:
+                if candidate.startswith(term) or (
+                    len(candidate) >= MIN_PREFIX_CHARS and term.startswith(candidate)
+                ):
+                    matches.setdefault(candidate, PREFIX_SIMILARITY)
+        return matches
+
+    def answer(self, question, max_tables=5):
+        """Answers a metadata question from the schema.
+
+        Args:
+            question (str): Natural language metadata question.
+            max_tables (int): Maximum number of tables in a lookup answer.
+
+        Returns:
+            tuple: The answer (str, None when there is no local answer), its
+              confidence between 0 and 1 and the question intent
+              ("list_tables", "describe" or "lookup").
+        """
+        if DESCRIBE_PATTERN.search(question):
+            table, confidence = self.find_table(question)
+            if table is not None:
+                return self.describe(table), confidence, "describe"
+        terms = lookup_terms(question)
+        if LIST_TABLES_PATTERN.search(question) and not terms:
+            return self.list_tables(), 1.0, "list_tables"
+        return self.lookup(terms, max_tables)
+
+    def find_table(self, question):
+        """Returns the table named in a question and the match confidence.
+
+        A table is named when every term of its id matches a question term.
+        The table with the most id terms wins (e.g. "order items" names
+        `order_items` rather than `orders`); ties lower the confidence.
+        """
+        question_terms = index_terms(question)
+        candidates = []
+        for table in self.tables:
+            table_terms = index_terms(table.table_id)
+            if not table_terms:
+                continue
+            similarities = []
+            for table_term in table_terms:
+                similarity = max(
+                    (self.similarity(term, table_term) for term in question_terms),
+                    default=0.0,
+                )
+                if similarity < FUZZY_CUTOFF:
+                    break
+                similarities.append(similarity)
+            else:
+                candidates.append((len(table_terms), min(similarities), table))
+        if not candidates:
+            return None, 0.0
+
+        candidates.sort(key=lambda candidate: candidate[:2], reverse=True)
+        best_terms, confidence, table = candidates[0]
+        if len(candidates) > 1 and candidates[1][:2] == (best_terms, confidence):
+            confidence /= 2
+        return table, confidence
+
+    @staticmethod
+    def similarity(term, other):
+        if term == other:
+            return 1.0
+        if len(term) >= MIN_PREFIX_CHARS and (
+            term.startswith(other) or other.startswith(term)
+        ):
+            return PREFIX_SIMILARITY
+        return difflib.SequenceMatcher(None, term, other).ratio()
+
+    def lookup(self, terms, max_tables=5):
+        """Finds the tables and columns holding the information of a question.
+
+        Args:
+            terms (list): The terms of the question (see `lookup_terms`).
+            max_tables (int): Maximum number of tables in the answer.
+
+        Returns:
+            tuple: (answer, confidence, "lookup"). The confidence is the share
+              of the question terms the best table covers, weighted by the
+              similarity of the fuzzy matches.
+        """
+        if not terms or not self.tables:
+            return None, 0.0, "lookup"
+
+        scores = {}  # (table, column) -> score
+        matched = {}  # (table, column) -> question terms it matches
+        best_scores = {}  # table -> best score of the table or its columns
+        coverage = {}  # table -> {question term: similarity}
+        for term in terms:
+            for index_term, similarity in self.match(term).items():
+                entries = self.postings[index_term]
+                idf = math.log(1 + self.num_entries / len(entries))
+                for (i, j), weight in entries.items():
+                    scores[(i, j)] = scores.get((i, j), 0.0) + weight * similarity * idf
+                    best_scores[i] = max(best_scores.get(i, 0.0), scores[(i, j)])
+                    matched.setdefault((i, j), set()).add(term)
+                    table_terms = coverage.setdefault(i, {})
+                    table_terms[term] = max(table_terms.get(term, 0.0), similarity)
+        if not coverage:
+            return None, 0.0, "lookup"
+
+        covered = {i: sum(table_terms.values()) for i, table_terms in coverage.items()}
+        ranked = sorted(
+            coverage, key=lambda i: (covered[i], best_scores[i]), reverse=True
+        )
+        best = covered[ranked[0]]
+        matches = [i for i in ranked if covered[i] == best][:max_tables]
+        confidence = best / len(terms)
+        return self.format_lookup(matches, scores, matched), confidence, "lookup"
+
+    def format_lookup(self, matches, scores, matched):
+        """Lists the matched tables and their best columns.
+
+        Columns only matching terms of the table name (e.g. every column
+        described as "... of the customer" for "customer email") are left out.
+        """
+        lines = ["The information seems to be in the following tables and columns:"]
+        for i in matches:
+            table = self.tables[i]
+            table_terms = matched.get((i, None), set())
+            columns = sorted(
+                (
+                    (score, j) for (t, j), score in scores.items()
+                    if t == i and j is not None and matched[(t, j)] - table_terms
+                ),
+                reverse=True,
+            )[:MAX_COLUMNS_PER_TABLE]
+            if not columns:
+                lines.append(
+                    f"- Table `{table.name}` ({len(table.columns)} columns)."
+                )
+                continue
+            lines.append(f"- Table `{table.name}`:")
+            for _, j in columns:
+                lines.append("  " + self.format_column(table.columns[j]))
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_column(column):
+        text = f"- `{column.name}` ({column.data_type})"
+        if column.description:
+            text += f": {column.description}"
+        if column.examples:
+            text += f" (e.g. {column.examples})"
+        return text
+
+    def describe(self, table):
+        """Formats the columns of a table."""
+        lines = [f"Table `{table.name}` has {len(table.columns)} columns:"]
+        lines.extend(self.format_column(column) for column in table.columns)
+        return "\n".join(lines)
+
+    def list_tables(self):
+        lines = [f"The dataset has {len(self.tables)} tables:"]
+        lines.extend(
+            f"- `{table.name}` ({len(table.columns)} columns)" for table in self.tables
+        )
+        return "\n".join(lines)
+
+
+def get_index(database_settings):
+    """Returns the metadata index of a schema, built once per dataset and version."""
+    key = cache.schema_key(database_settings)
+    index = _index_cache.get(key)
+    if index is None:
+        index = MetadataIndex(database_settings["bq_ddl_schema"])
+        _index_cache.put(key, index)
+    return index
+
+
+def answer_question(question, database_settings, config):
+    """Answers a metadata question locally when confident enough.
+
+    Args:
+        question (str): Natural language metadata question.
+        database_settings (dict): The database settings of the session.
+        config (dict): The `metadata` section of config.yaml.
+
+    Returns:
+        tuple: The answer (None when the model should answer), its confidence
+          and the question intent.
+    """
+    if not config.get("local_answers", True):
+        return None, 0.0, None
+    answer, confidence, intent = get_index(database_settings).answer(
+        question, max_tables=config.get("max_tables", 5)
+    )
+    if answer is None or confidence < config.get("min_confidence", 0.75):
+        return None, confidence, intent
+    return answer, confidence, intent
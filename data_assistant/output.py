@@ -0,0 +1,92 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Assembly of the DETAILED output from the session state.
+
+In `output_mode: DETAILED` the root model only writes the `explain` and
+`final_answer` of its answer. The `sql` and `sql_results` are already in the
+session state (`sql_query` and `query_result_handle`, set by the tools), so
+they are added here instead of being generated again by the model, and the
+final response is always valid JSON.
+"""
+
+import json
+
+from google.genai import types
+
+
+def parse_model_answer(text):
+    """Returns the `explain` and `final_answer` written by the model.
+
+    The model is asked for a JSON object, but fences, surrounding text or
+    plain text answers are accepted: text that is not a JSON object is used
+    as the final answer.
+
+    Args:
+        text (str): The final response text of the model.
+
+    Returns:
+        dict: The `explain` and `final_answer` (str or None).
+    """
+    text = text.strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            answer = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            answer = None
+        if isinstance(answer, dict):
+            return {
+                "explain": answer.get("explain"),
+                "final_answer": answer.get("final_answer"),
+            }
+    return {"explain": None, "final_answer": text or None}
+
+
+def build_detailed_output(answer, sql, sql_results):
+    """Returns the DETAILED output (JSON string) of an answer.
+
+    Args:
+        answer (dict): The `explain` and `final_answer` of the model.
+        sql (str): The final SQL of the turn, or None.
+        sql_results (list): The result rows of the SQL, or None.
+    """
+    output = {
+        "explain": answer["explain"],
+        "sql": sql,
+        "sql_results": sql_results,
+        "final_answer": answer["final_answer"],
+    }
+    return json.dumps(output, ensure_ascii=False, default=str)
+
+
+def final_text(llm_response):
+    """Returns the text of a final model response, or None.
+
+    Partial (streamed) responses and responses calling tools are not final.
+    """
+    content = llm_response.content
+    if llm_response.partial or content is None or not content.parts:
+        return None
+    if any(part.function_call for part in content.parts):
+        return None
+    text = "".join(part.text or "" for part in content.parts if not part.thought)
+    return text or None
+
+
+def replace_text(llm_response, text):
+    """Returns a copy of a model response with a single text part."""
+    return llm_response.model_copy(
+        update={"content": types.Content(role="model", parts=[types.Part(text=text)])}
+    )
@@ -0,0 +1,377 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Column value profiles, to ground the literals of generated SQL.
+
+Five sample rows rarely show the values a filter needs ('SP' rather than
+'São Paulo', status codes). With the schema snapshot, each table is profiled
+by a single query aggregating all of its columns: null ratio, approximate
+distinct count, approximate top values (`APPROX_TOP_COUNT`, every value of
+low-cardinality columns) and min/max. Partitioned tables are profiled on
+their recent partitions, and tables over the bytes cap are sampled.
+
+A profile is stored with its table in the snapshot:
+
+    {
+        "rows": 1200,
+        "window_days": 30,          # only for partitioned tables
+        "sample_percent": 2.5,      # only for sampled tables
+        "columns": {
+            "state": {"type": "STRING", "nulls": 0.0, "distinct": 27,
+                      "complete": true, "top": [["SP", 410], ["RJ", 160]]},
+            "amount": {"type": "NUMERIC", "nulls": 0.02, "distinct": 950,
+                       "min": "0.5", "max": "9800"},
+        },
+    }
+
+`bq_nl2sql` adds the profiles of the columns related to the question to the
+question part of its prompt (see `relevant_columns`).
+"""
+
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import bigquery
+
+from . import query_guard
+from . import retrieval
+from . import schema
+from . import schema_render
+
+
+# Types profiled, by GoogleSQL base type (other types are skipped).
+TOP_VALUE_TYPES = {"STRING", "INT64", "BOOL"}
+MIN_MAX_TYPES = {
+    "INT64", "NUMERIC", "BIGNUMERIC", "FLOAT64", "DATE", "DATETIME", "TIMESTAMP",
+    "TIME",
+}
+
+# Tables of the question ranked by the schema index whose complete value
+# lists are shown even when no column matches the question terms.
+RELEVANT_TABLES = 3
+
+
+def base_type(data_type):
+    """Returns the base GoogleSQL type, e.g. 'NUMERIC' for 'NUMERIC(10, 2)'."""
+    return re.match(r"[A-Z0-9_]+", data_type).group(0)
+
+
+def profile_query(table_name, columns, layout, config):
+    """Builds the query profiling every column of a table.
+
+    Each column is aggregated into a STRUCT named `c<i>`, so column names
+    need no escaping in aliases.
+
+    Args:
+        table_name (str): The full table name.
+        columns (list[dict]): Column dicts of the table (see
+          `schema.fetch_dataset_schema`).
+        layout (dict): Partitioning of the table (see `schema.table_layout`),
+          or None.
+        config (dict): The `profiles` section of config.yaml.
+
+    Returns:
+        tuple: The SQL (with a `{sample}` placeholder for the TABLESAMPLE
+          clause), the profiled column dicts and the partition window in
+          days (None when the whole table is read). The SQL is None when no
+          column can be profiled, or the table requires a partition filter
+          that has no recent window.
+    """
+    profiled = [
+        column for column in columns
+        if column["mode"] != "REPEATED"
+        and base_type(column["data_type"]) in TOP_VALUE_TYPES | MIN_MAX_TYPES
+    ]
+    if not profiled:
+        return None, [], None
+
+    select = ["COUNT(*) AS row_count"]
+    for i, column in enumerate(profiled):
+        name = f"`{column['name']}`"
+        column_type = base_type(column["data_type"])
+        fields = [
+            f"COUNTIF({name} IS NULL) AS nulls",
+            f"APPROX_COUNT_DISTINCT({name}) AS distinct_count",
+        ]
+        if column_type in TOP_VALUE_TYPES:
+            fields.append(
+                f"APPROX_TOP_COUNT({name}, {int(config.get('max_distinct', 20))}) AS top"
+            )
+        if column_type in MIN_MAX_TYPES:
+            fields.append(f"CAST(MIN({name}) AS STRING) AS min")
+            fields.append(f"CAST(MAX({name}) AS STRING) AS max")
+        select.append(f"STRUCT({', '.join(fields)}) AS c{i}")
+
+    where, window_days = "", None
+    if layout and layout.get("partition_column"):
+        start = query_guard.window_start(
+            layout["partition_type"], config.get("window_days", 30)
+        )
+        if start is not None:
+            window_days = int(config.get("window_days", 30))
+            where = (
+                f"\nWHERE `{layout['partition_column']}` >= "
+                f"{start.sql(dialect=query_guard.DIALECT)}"
+            )
+        elif layout["require_partition_filter"]:
+            return None, [], None
+
+    sql = (
+        "SELECT\n  " + ",\n  ".join(select)
+        + f"\nFROM `{table_name}`{{sample}}" + where
+    )
+    return sql, profiled, window_days
+
+
+def _json_value(value, max_chars):
+    """Converts a profiled value to a short JSON-serializable value."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+
+def parse_profile(row, profiled, config):
+    """Builds the compact profile of a table from the row of its query."""
+    rows = row["row_count"] or 0
+    max_chars = config.get("max_value_chars", 40)
+    max_distinct = config.get("max_distinct", 20)
+    columns = {}
+    for i, column in enumerate(profiled):
+        stats = row[f"c{i}"]
+        column_profile = {
+            "type": base_type(column["data_type"]),
+            "nulls": round(stats["nulls"] / rows, 3) if rows else 0.0,
+            "distinct": stats["distinct_count"],
+        }
+        # Long values (free text) are not filter literals and are dropped
+        top = [
+            item for item in stats.get("top") or []
+            if item["value"] is not None and len(str(item["value"])) <= max_chars
+        ]
+        if top:
+            complete = (
+                stats["distinct_count"] <= max_distinct
+                and len(top) == len(stats["top"])
+            )
+            if not complete:
+                top = top[:config.get("top_k", 5)]
+            column_profile["complete"] = complete
+            column_profile["top"] = [
+                [_json_value(item["value"], max_chars), item["count"]] for item in top
+            ]
+        if stats.get("min") is not None:
+            column_profile["min"] = _json_value(stats["min"], max_chars)
+            column_profile["max"] = _json_value(stats["max"], max_chars)
+        columns[column["name"]] = column_profile
+    return {"rows": rows, "columns": columns}
+
+
+def profile_table(client, table_name, columns, layout, config, maximum_bytes_billed=None):
+    """Profiles the columns of a table with one query.
+
+    The query is dry run first: a table whose profile would process more
+    than `max_bytes_per_table` is sampled with TABLESAMPLE to about that size.
+
+    Returns:
+        dict: The profile of the table, or None when it has no profiled
+          column or its query failed.
+    """
+    sql, profiled, window_days = profile_query(table_name, columns, layout, config)
+    if sql is None:
+        return None
+
+    try:
+        bytes_processed = query_guard.dry_run(client, sql.format(sample=""))[
+            "bytes_processed"
+        ]
+        max_bytes = config.get("max_bytes_per_table", 0)
+        sample_percent = None
+        if max_bytes and bytes_processed > max_bytes:
+            sample_percent = max(round(100 * max_bytes / bytes_processed, 3), 0.001)
+            sql = sql.format(sample=f" TABLESAMPLE SYSTEM ({sample_percent} PERCENT)")
+        else:
+            sql = sql.format(sample="")
+        job_config = bigquery.QueryJobConfig(
+            maximum_bytes_billed=maximum_bytes_billed or None
+        )
+        row = next(iter(client.query(sql, job_config=job_config).result()))
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("Profile of %s failed: %s", table_name, e)
+        return None
+
+    profile = parse_profile(row, profiled, config)
+    if window_days is not None:
+        profile["window_days"] = window_days
+    if sample_percent is not None:
+        profile["sample_percent"] = sample_percent
+    return profile
+
+
+def profile_tables(
+    client,
+    project_id,
+    dataset_id,
+    table_ids,
+    config,
+    max_workers=schema.DEFAULT_MAX_WORKERS,
+    maximum_bytes_billed=None,
+    dataset_schema=None,
+):
+    """Profiles several tables of a dataset concurrently.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        project_id (str): The ID of your Google Cloud Project.
+        dataset_id (str): The ID of the BigQuery dataset.
+        table_ids (list[str]): The tables to profile.
+        config (dict): The `profiles` section of config.yaml.
+        max_workers (int): Maximum number of concurrent profile queries.
+        maximum_bytes_billed (int): Limit of the bytes billed per query.
+        dataset_schema (tuple): The columns and layouts of the tables, as
+          returned by `schema.fetch_dataset_schema`, when already read.
+
+    Returns:
+        dict: Table id -> profile (None for the tables that could not be
+          profiled).
+    """
+    if not table_ids:
+        return {}
+    if dataset_schema is None:
+        dataset_schema = schema.fetch_dataset_schema(
+            client, project_id, dataset_id, table_ids=list(table_ids)
+        )
+    columns, layouts = dataset_schema
+
+    def profile(table_id):
+        if table_id not in columns:
+            return None
+        return profile_table(
+            client,
+            f"{project_id}.{dataset_id}.{table_id}",
+            columns[table_id],
+            layouts[table_id],
+            config,
+            maximum_bytes_billed=maximum_bytes_billed,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        profiles = dict(zip(table_ids, executor.map(profile, table_ids)))
+    logging.info(
+        "Profiled %d of %d tables of %s.%s",
+        sum(p is not None for p in profiles.values()), len(table_ids),
+        project_id, dataset_id,
+    )
+    return profiles
+
+
+def relevant_columns(question, database_settings, max_columns=8):
+    """Selects the profiled columns related to a question.
+
+    Only the columns of the tables ranked first by the schema index are
+    considered (all tables when none ranks). A column is related when its
+    name or one of its top values shares a term with the question. The
+    complete value lists (low-cardinality columns) of the ranked tables
+    follow, so that a value written differently in the question ('São Paulo'
+    for 'SP') is still shown.
+
+    Args:
+        question (str): Natural language question.
+        database_settings (dict): The database settings of the session.
+        max_columns (int): Maximum number of columns returned.
+
+    Returns:
+        list: (full table name, column name, column profile, table rows)
+          tuples, most related first.
+    """
+    profiles = database_settings.get("bq_column_profiles") or {}
+    terms = set(retrieval.tokenize(question))
+    if not profiles or not terms:
+        return []
+
+    index = retrieval.get_index(database_settings)
+    scores, _ = index.score(question)
+    ranked = [
+        index.names[i]
+        for i in sorted(range(len(index.names)), key=lambda i: -scores[i])[:RELEVANT_TABLES]
+        if scores[i] > 0
+    ]
+
+    scored = []
+    for rank, table_name in enumerate(ranked or list(profiles)):
+        profile = profiles.get(table_name)
+        if profile is None:
+            continue
+        for column, column_profile in profile["columns"].items():
+            if "top" not in column_profile and "min" not in column_profile:
+                continue
+            name_hits = len(terms & set(retrieval.tokenize(column)))
+            value_hits = len(terms & {
+                term
+                for value, _ in column_profile.get("top", [])
+                for term in retrieval.tokenize(str(value))
+            })
+            score = 2 * name_hits + value_hits
+            if not score and ranked and column_profile.get("complete"):
+                score = 0.5
+            if score:
+                scored.append(
+                    (score, rank, table_name, column, column_profile, profile["rows"])
+                )
+
+    # Best score first, then the best ranked table
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [item[2:] for item in scored[:max_columns]]
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return schema_render.quote_string(value)
+    return str(value)
+
+
+def render_columns(columns):
+    """Renders the profiles of columns as one line per column, e.g.:
+
+        - `project.dataset.customers`.`state` STRING, all 27 values: 'SP' (34%), ...
+        - `project.dataset.orders`.`amount` NUMERIC, from 0.5 to 9800, 2% null
+    """
+    lines = []
+    for table_name, column, column_profile, rows in columns:
+        line = f"- `{table_name}`.`{column}` {column_profile['type']}"
+        top = column_profile.get("top")
+        if top:
+            if column_profile["complete"]:
+                line += f", all {len(top)} values: "
+            else:
+                line += (
+                    f", ~{column_profile['distinct']} distinct values, most frequent: "
+                )
+            line += ", ".join(
+                f"{_format_value(value)} ({_share(count, rows)})" for value, count in top
+            )
+        if "min" in column_profile:
+            line += f", from {column_profile['min']} to {column_profile['max']}"
+        if column_profile["nulls"]:
+            line += f", {_share(column_profile['nulls'], 1)} null"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _share(count, total):
+    if not total:
+        return "0%"
+    percent = 100 * count / total
+    return "<1%" if 0 < percent < 1 else f"{percent:.0f}%"
@@ -17,14 +17,14 @@ This module defines functions that return instruction prompts for the bigquery a
 These instructions guide the agent's behavior, workflow, and tool usage.
 """
 
-def build_prompt(metadata_mode, output_mode):
+def build_prompt(metadata_mode, output_mode, workflow_mode="STEPWISE"):
 
   if metadata_mode == "ON" :
       metadata_instruction =  """
                 2.  **If it's a Metadata Question:**
                     a. Call the `get_metadata_description` tool with the user's question.
                     b. The output from this tool is the direct answer.
-                    c. Proceed to step 4 (Generate Final Result). For metadata answers, "sql" and "sql_results" will be null. 
+                    c. Proceed to step 4 (Generate Final Result).
                 """    
   else:
       metadata_instruction =  """
@@ -34,19 +34,13 @@ def build_prompt(metadata_mode, output_mode):
       
   if output_mode == "DETAILED":
      output_instructions = """ 
-          4.  **Generate the final result in JSON format with four keys: "explain", "sql", "sql_results", "final_answer".**
+          4.  **Generate the final result in JSON format with two keys: "explain", "final_answer".** Do NOT repeat the SQL or its results: the validated SQL and its results are added to your answer automatically.
             * **"explain"**: (string) Provide a step-by-step reasoning.
               * For Data Retrieval: Explain how you identified the tables/columns, any joins, filters, and how the SQL was constructed and validated.
               * For Metadata: Explain how you analyzed the schema and used table/column names and descriptions to answer the question about data location/structure.
-            * **"sql"**: (string or null)
-              * For Data Retrieval: The final, validated SQL query.
-              * For Metadata: `null`.
-            * **"sql_results"**: (object/array or null)
-              * For Data Retrieval: The raw query_result from `run_bigquery_validation` if the query was valid and executed successfully (even if it returned no rows).
-              * For Metadata: `null`.
             * **"final_answer"**: (string or null)
               * ALLWAYS in Portuguese (BR)
-              * For Data Retrieval (successful query): A natural language summary of the SQL results or a statement if no data was found (e.g., "The query ran successfully and found 15 customers.").
+              * For Data Retrieval (successful query): A natural language summary of the SQL results or a statement if no data was found (e.g., "The query ran successfully and found 15 customers."). For large results the query_result holds only the first rows and the `result_summary` describes the fetched rows: `total_rows` is the row count of the query, and when `truncated` is true its statistics do not cover the whole result, so do not present them as totals (compute totals with an aggregating query instead) and do not invent the missing rows.
               * For Data Retrieval (failed query): A natural language statement about the SQL error (e.g., "The SQL query is invalid due to a syntax error near 'SELECT'.").
               * For Metadata: The natural language answer from `get_metadata_description` (e.g., "User email addresses can be found in the `users` table, specifically in the `email_address` column which is described as 'The primary email for the user'."). 
           """
@@ -55,6 +49,36 @@ def build_prompt(metadata_mode, output_mode):
       4. Generate the final result explaining the reasoning how you got the results and present the final anwswer for the queries. 
      """
 
+  if workflow_mode == "FUSED":
+     sql_tool_descriptions = """
+      * `generate_and_validate_sql`: Use this tool ONLY when the user's question requires **fetching data** from the database. It generates the BigQuery SQL, validates and executes it, and repairs it automatically when it fails. It returns the final `sql`, the `query_result` (or an `error_message`) and the `repair_history`. For large results, `query_result` holds only the first rows, and `result_summary` gives per-column statistics (min/max, nulls, most frequent values) of the fetched rows (`row_count`, capped by the row limit of the queries), the `total_rows` of the query and whether the fetched rows are `truncated`. If it returns a `partition_rewrite`, the SQL was restricted to a recent window (or a sample) of a partitioned table: state that limit in the answer, as described in its `note`.
+     """
+     data_retrieval_instruction = """
+      3.  **If it's a Data Retrieval Question:**
+          a. Call the `generate_and_validate_sql` tool once with the user's question. It already retries and repairs the SQL, so do NOT call it again for the same question.
+          b. If it returns an `error_message`, report the last error. Otherwise use its `sql` and `query_result`, and proceed to step 4.
+     """
+  else:
+     sql_tool_descriptions = """
+      * `bq_nl2sql` (e.g., bq_nl2sql): Use this tool ONLY when the user's question requires **fetching data** from the database. It generates an initial BigQuery SQL query.
+      * `run_bigquery_validation`: After `bq_nl2sql` generates SQL, use this tool to validate the SQL syntax and functional correctness. If there are errors, you should analyze the error and call `bq_nl2sql` again with the original question and the error context to generate a corrected SQL query. For large results, `query_result` holds only the first rows, and `result_summary` gives per-column statistics (min/max, nulls, most frequent values) of the fetched rows (`row_count`, capped by the row limit of the queries), the `total_rows` of the query and whether the fetched rows are `truncated`. If it returns a `partition_rewrite`, the SQL was restricted to a recent window (or a sample) of a partitioned table: state that limit in the answer, as described in its `note`.
+     """
+     data_retrieval_instruction = """
+      3.  **If it's a Data Retrieval Question:**
+          a. Call the `bq_nl2sql` tool to generate an initial SQL query.
+          b. Call the `run_bigquery_validation` tool to validate the generated SQL.
+          c. If `run_bigquery_validation` reports errors:
+              i.  Analyze the error.
+              ii. Call `bq_nl2sql` again. In your call to `bq_nl2sql`, provide the original question AND a clear instruction to fix the previous SQL based on the error. For example: "The previous query failed with error: [error message]. Please regenerate the SQL to address this."
+              iii. Repeat step 3b (validation). Iterate a maximum of 2-3 times to fix SQL. If it still fails, report the last error.
+          d. Once a valid SQL is generated (and optionally executed by `run_bigquery_validation` if it returns results directly), proceed to step 4.
+     """
+
+  sql_tools = (
+      "`generate_and_validate_sql`" if workflow_mode == "FUSED"
+      else "`bq_nl2sql` and `run_bigquery_validation`"
+  )
+
   instructions = f"""
       You are an AI assistant serving as an expert for BigQuery.
       Your job is to help users with their questions about a BigQuery database.
@@ -67,8 +91,7 @@ def build_prompt(metadata_mode, output_mode):
       You have the following tools available. Use them appropriately based on the user's question:
 
       **Tool Descriptions:**
-      * `bq_nl2sql` (e.g., bq_nl2sql): Use this tool ONLY when the user's question requires **fetching data** from the database. It generates an initial BigQuery SQL query.
-      * `run_bigquery_validation`: After `bq_nl2sql` generates SQL, use this tool to validate the SQL syntax and functional correctness. If there are errors, you should analyze the error and call `bq_nl2sql` again with the original question and the error context to generate a corrected SQL query.
+      {sql_tool_descriptions}
       * `get_metadata_description`: Use this tool ONLY when the user's question is a **metadata question** (e.g., "Which table has X?", "Describe table Y.", "Where is Z stored?"). This tool will directly provide a textual answer based on the schema and does NOT involve SQL execution.
 
       **Workflow:**
@@ -77,14 +100,7 @@ def build_prompt(metadata_mode, output_mode):
 
       {metadata_instruction}
 
-      3.  **If it's a Data Retrieval Question:**
-          a. Call the `bq_nl2sql` tool to generate an initial SQL query.
-          b. Call the `run_bigquery_validation` tool to validate the generated SQL.
-          c. If `run_bigquery_validation` reports errors:
-              i.  Analyze the error.
-              ii. Call `bq_nl2sql` again. In your call to `bq_nl2sql`, provide the original question AND a clear instruction to fix the previous SQL based on the error. For example: "The previous query failed with error: [error message]. Please regenerate the SQL to address this."
-              iii. Repeat step 3b (validation). Iterate a maximum of 2-3 times to fix SQL. If it still fails, report the last error.
-          d. Once a valid SQL is generated (and optionally executed by `run_bigquery_validation` if it returns results directly), proceed to step 4.
+      {data_retrieval_instruction}
 
       {output_instructions}
 
@@ -92,7 +108,7 @@ def build_prompt(metadata_mode, output_mode):
 
       NOTE: You are an orchestration agent. **YOU MUST USE THE TOOLS** as described.
       * Do NOT generate SQL directly if the question is for metadata; use `get_metadata_description`.
-      * Do NOT answer metadata questions directly if the question is for data retrieval; use `bq_nl2sql` and `run_bigquery_validation`.
+      * Do NOT answer metadata questions directly if the question is for data retrieval; use {sql_tools}.
       Your primary role is to correctly identify the question type and invoke the appropriate tool.
 
       IMPORTANT Allways anwser in the same language that user used to question. 
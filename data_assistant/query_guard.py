@@ -0,0 +1,292 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-execution checks of generated SQL: dry run, bytes budget and partitions.
+
+Scans of partitioned tables without a filter on the partition column read
+every partition. `guard_partitions` rewrites them to read only the partitions
+of a recent window, or, for exploratory queries (rows, no aggregation), to
+sample the tables with TABLESAMPLE. The rewrites are made on the sqlglot AST,
+so only table nodes are touched.
+"""
+
+import re
+
+import sqlglot
+from google.cloud import bigquery
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+
+DIALECT = "bigquery"
+
+# Dry run error of a table with `require_partition_filter` queried without one.
+PARTITION_FILTER_ERROR_PATTERN = re.compile(
+    r"(?i)without a filter over column\(s\).*partition elimination"
+)
+
+# Functions computing the start of the recent window of a partition column
+# (e.g. `DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)`), by column type.
+RECENT_WINDOW_FUNCTIONS = {
+    "DATE": ("DATE_SUB", "CURRENT_DATE"),
+    "TIMESTAMP": ("TIMESTAMP_SUB", "CURRENT_TIMESTAMP"),
+    "DATETIME": ("DATETIME_SUB", "CURRENT_DATETIME"),
+}
+
+
+def dry_run(client, sql_string):
+    """Dry runs a query to get its cost without executing it.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        sql_string (str): The SQL query.
+
+    Returns:
+        dict: `bytes_processed` (int) and `referenced_tables` (list of full
+          table names).
+
+    Raises:
+        google.api_core.exceptions.GoogleAPIError: If the query is invalid.
+        ValueError: If the query is not a single SELECT statement (e.g. a
+          script or DML), so it must not be executed.
+    """
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    query_job = client.query(sql_string, job_config=job_config)
+    if query_job.statement_type != "SELECT":
+        raise ValueError(
+            "Only a single SELECT query is allowed, got a "
+            f"{query_job.statement_type or 'unknown'} statement."
+        )
+    return {
+        "bytes_processed": query_job.total_bytes_processed or 0,
+        "referenced_tables": sorted(
+            str(table) for table in query_job.referenced_tables or []
+        ),
+    }
+
+
+def apply_tablesample(sql_string, percent):
+    """Adds a TABLESAMPLE clause to every table read by a query.
+
+    Tables already sampled and references to CTEs are left as is.
+
+    Args:
+        sql_string (str): The SQL query.
+        percent (float): Percentage of the table blocks to read.
+
+    Returns:
+        str: The sampled SQL query, or `sql_string` if it cannot be parsed.
+    """
+    try:
+        ast = sqlglot.parse_one(sql_string, read=DIALECT)
+    except SqlglotError:
+        return sql_string
+    ctes = {cte.alias_or_name.lower() for cte in ast.find_all(exp.CTE)}
+    for table in ast.find_all(exp.Table):
+        if table.args.get("sample") or (
+            not table.db and table.name.lower() in ctes
+        ):
+            continue
+        table.set(
+            "sample",
+            exp.TableSample(
+                method=exp.var("SYSTEM"), percent=exp.Literal.number(percent)
+            ),
+        )
+    return ast.sql(dialect=DIALECT, pretty=True)
+
+
+def format_bytes(num_bytes):
+    """Formats a number of bytes for error messages (e.g. '1.5 GB')."""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if num_bytes < 1000 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1000
+
+
+def is_partition_filter_error(error):
+    """Whether a dry run failed for a missing required partition filter."""
+    return bool(PARTITION_FILTER_ERROR_PATTERN.search(str(error)))
+
+
+def _filters_column(select, qualifier, column):
+    """Whether the WHERE or a JOIN condition of a SELECT uses a column."""
+    conditions = [select.args.get("where")] + [
+        join.args.get("on") for join in select.args.get("joins") or []
+    ]
+    return any(
+        found.name.lower() == column.lower()
+        and found.table.lower() in ("", qualifier.lower())
+        for condition in conditions
+        if condition is not None
+        for found in condition.find_all(exp.Column)
+    )
+
+
+def unfiltered_partition_scans(ast, layouts, project_id, dataset_id):
+    """Finds the partitioned tables read without a partition column filter.
+
+    Args:
+        ast (sqlglot.exp.Expression): The parsed query.
+        layouts (dict): Full table name -> layout of the partitioned tables
+          (see `schema.table_layout`).
+        project_id (str): Default project of unqualified table names.
+        dataset_id (str): Default dataset of unqualified table names.
+
+    Returns:
+        list: (table node, SELECT node reading it, full table name, layout)
+          tuples.
+    """
+    scans = []
+    for table in ast.find_all(exp.Table):
+        table_name = f"{table.catalog or project_id}.{table.db or dataset_id}.{table.name}"
+        layout = layouts.get(table_name)
+        select = table.find_ancestor(exp.Select)
+        if layout is None or select is None:
+            continue
+        if not _filters_column(select, table.alias_or_name, layout["partition_column"]):
+            scans.append((table, select, table_name, layout))
+    return scans
+
+
+def is_null_extended(table, select):
+    """Whether an outer join of a SELECT can extend the rows of a table with NULLs.
+
+    A filter on such a table in the WHERE clause would drop the unmatched
+    rows of the outer join, turning it into an inner join.
+    """
+    joins = select.args.get("joins") or []
+    if isinstance(table.parent, exp.Join) and table.parent in joins:
+        position = joins.index(table.parent)
+        if table.parent.side in ("LEFT", "FULL"):
+            return True
+    elif isinstance(table.parent, exp.From):
+        position = -1
+    else:
+        return False
+    return any(join.side in ("RIGHT", "FULL") for join in joins[position + 1:])
+
+
+def window_start(partition_type, days):
+    """Returns the start of the recent window of a partition column, or None.
+
+    The functions are built as is, since sqlglot writes the intervals of
+    parsed ones as strings (`INTERVAL '30' DAY`).
+    """
+    if partition_type not in RECENT_WINDOW_FUNCTIONS:
+        return None
+    subtract, current = RECENT_WINDOW_FUNCTIONS[partition_type]
+    return exp.Anonymous(
+        this=subtract,
+        expressions=[
+            exp.Anonymous(this=current, expressions=[]),
+            exp.Interval(this=exp.Literal.number(int(days)), unit=exp.var("DAY")),
+        ],
+    )
+
+
+def is_exploratory(ast):
+    """Whether a query only lists rows (no aggregation, DISTINCT or ordering)."""
+    return not any(
+        ast.find_all(exp.AggFunc, exp.Group, exp.Distinct, exp.Window, exp.Order)
+    )
+
+
+def guard_partitions(
+    sql_string, layouts, project_id, dataset_id, window_days, sample_percent=0
+):
+    """Rewrites the scans of partitioned tables missing a partition filter.
+
+    Each scan gets a `<partition column> >= <start of the window>` filter,
+    in the WHERE clause, or in a subquery replacing the table when an outer
+    join extends its rows with NULLs, except in exploratory queries, which are sampled with TABLESAMPLE instead
+    when `sample_percent` is set and no table requires a partition filter.
+    Integer range partitions have no recent window and are left as is.
+
+    Args:
+        sql_string (str): The SQL query.
+        layouts (dict): Full table name -> layout of the partitioned tables.
+        project_id (str): Default project of unqualified table names.
+        dataset_id (str): Default dataset of unqualified table names.
+        window_days (int): Days of the recent window.
+        sample_percent (float): Percentage of the table blocks read by
+          sampled exploratory queries, 0 to always add the window filter.
+
+    Returns:
+        dict: The rewritten `sql`, the `method` ("window" or "sample"), the
+          rewritten `tables` and a `note` for the agent, or None when there
+          is nothing to rewrite.
+    """
+    if not layouts:
+        return None
+    try:
+        ast = sqlglot.parse_one(sql_string, read=DIALECT)
+    except SqlglotError:
+        return None
+    scans = unfiltered_partition_scans(ast, layouts, project_id, dataset_id)
+    if not scans:
+        return None
+    tables = sorted({table_name for _, _, table_name, _ in scans})
+
+    if (
+        sample_percent
+        and is_exploratory(ast)
+        and not any(layout["require_partition_filter"] for *_, layout in scans)
+    ):
+        return {
+            "sql": apply_tablesample(sql_string, sample_percent),
+            "method": "sample",
+            "tables": tables,
+            "note": (
+                f"Rows were sampled from {sample_percent}% of the blocks of "
+                + ", ".join(f"`{table_name}`" for table_name in tables)
+                + " instead of reading the whole tables."
+            ),
+        }
+
+    filtered = []
+    for table, select, table_name, layout in scans:
+        start = window_start(layout["partition_type"], window_days)
+        if start is None:
+            continue
+        if is_null_extended(table, select):
+            # Filter the table in a subquery, keeping the outer join
+            alias = table.alias_or_name
+            table.set("alias", None)
+            scan = exp.select("*").from_(table.copy()).where(
+                exp.GTE(
+                    this=exp.column(layout["partition_column"], quoted=True),
+                    expression=start,
+                )
+            )
+            table.replace(scan.subquery(exp.to_identifier(alias)))
+        else:
+            column = exp.column(
+                layout["partition_column"], table=table.alias_or_name, quoted=True
+            )
+            select.where(exp.GTE(this=column, expression=start), copy=False)
+        if table_name not in filtered:
+            filtered.append(table_name)
+    if not filtered:
+        return None
+    return {
+        "sql": ast.sql(dialect=DIALECT, pretty=True),
+        "method": "window",
+        "tables": filtered,
+        "note": (
+            f"Only the last {int(window_days)} days of "
+            + ", ".join(f"`{table_name}`" for table_name in filtered)
+            + " were read, since the query did not filter on their partition column."
+        ),
+    }
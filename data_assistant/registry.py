@@ -0,0 +1,317 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Schema settings of many BigQuery datasets served from one process.
+
+Each session picks its dataset (see `setup_before_agent_call`), and the
+registry loads the snapshot and settings of a dataset on its first use
+(once, however many sessions start with it at the same time). The
+resident datasets are kept in least recently used order and evicted beyond
+`max_datasets` or `max_bytes`, so a long tail of datasets used once does not
+grow the process without limit; an evicted dataset is loaded again from the
+snapshot store when a session uses it. A single background thread refreshes
+the resident datasets whose snapshot is older than `ttl_seconds`.
+
+Loading and refreshing are done by the callables the registry is created
+with, so it does not depend on the BigQuery client.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from . import cache
+from . import singleflight
+
+
+# Entry of `allowed_datasets` allowing any dataset
+ANY_DATASET = "*"
+
+
+class DatasetEntry:
+    """Snapshot and settings of a resident dataset."""
+
+    def __init__(self, snapshot, settings, checked_at):
+        self.snapshot = snapshot
+        self.settings = settings
+        self.checked_at = checked_at
+        self.size = cache.approximate_size(snapshot) + cache.approximate_size(settings)
+
+
+class SchemaRegistry:
+    """Lazily loaded, memory-bounded settings of (project, dataset) pairs.
+
+    Args:
+        load_snapshot (callable): Called with (project_id, dataset_id), returns
+          (source, snapshot) of the stored snapshot, or (None, None).
+        refresh_snapshot (callable): Called with (project_id, dataset_id,
+          previous snapshot or None), returns an up to date snapshot.
+        build_settings (callable): Returns the database settings of a snapshot.
+        max_datasets (int): Maximum number of resident datasets.
+        max_bytes (int): Maximum approximate size of the resident snapshots and
+          settings. The most recently used dataset is kept even above it.
+        allowed_datasets (list): "project.dataset" names sessions may select,
+          besides the datasets added with `allow`. "*" allows any dataset.
+        ttl_seconds (float): Snapshot age before a resident dataset is
+          refreshed in background (0 disables the refresh).
+        clock (callable): Returns the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        load_snapshot,
+        refresh_snapshot,
+        build_settings,
+        max_datasets=20,
+        max_bytes=200_000_000,
+        allowed_datasets=(),
+        ttl_seconds=0,
+        clock=time.time,
+    ):
+        self.load_snapshot = load_snapshot
+        self.refresh_snapshot = refresh_snapshot
+        self.build_settings = build_settings
+        self.max_datasets = max_datasets
+        self.max_bytes = max_bytes
+        self.allowed_datasets = set(allowed_datasets or ())
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()  # (project_id, dataset_id) -> DatasetEntry
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Loads of different datasets run in parallel, concurrent loads (or
+        # refreshes) of the same dataset once
+        self._loads = singleflight.SingleFlight("schema_load")
+        self._refreshes = singleflight.SingleFlight("schema_refresh")
+        self._wake = threading.Event()
+        self._refresh_thread = None
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0, "evictions": 0}
+        self._sources = {}
+
+    def allow(self, project_id, dataset_id):
+        """Adds a dataset to the allowed datasets, e.g. the default dataset."""
+        self.allowed_datasets.add(f"{project_id}.{dataset_id}")
+
+    def get_settings(self, project_id, dataset_id):
+        """Returns the database settings of a dataset, loading it if needed.
+
+        A stored snapshot is served even when stale, while the background
+        refresh updates it. The dataset is introspected synchronously only
+        when there is no snapshot at all.
+
+        Returns:
+            tuple: The settings (dict) and the source they were loaded from:
+              "registry" when resident, else "store", "bundle" or "bigquery".
+
+        Raises:
+            ValueError: If the dataset is not in `allowed_datasets`.
+        """
+        self._check_allowed(project_id, dataset_id)
+        key = (project_id, dataset_id)
+        entry = self._get(key)
+        if entry is not None:
+            return entry.settings, "registry"
+
+        (settings, source), shared = self._loads.do(key, self._load, key)
+        if shared:
+            # Loaded by a concurrent session
+            return settings, "registry"
+        return settings, source
+
+    def refresh(self, project_id, dataset_id, resident_only=False):
+        """Refreshes a dataset now and returns its new settings.
+
+        Args:
+            project_id (str): The project of the dataset.
+            dataset_id (str): The dataset.
+            resident_only (bool): Whether to skip the dataset (returning None)
+              when it is not resident, as background refreshes do.
+        """
+        key = (project_id, dataset_id)
+        settings, _ = self._refreshes.do(
+            (key, resident_only), self._refresh, key, resident_only
+        )
+        return settings
+
+    def refresh_stale(self):
+        """Refreshes the resident datasets whose snapshot is stale.
+
+        Returns:
+            float: Seconds until the next resident snapshot becomes stale.
+        """
+        with self._lock:
+            due = [
+                (key, entry.checked_at) for key, entry in self._entries.items()
+            ]
+
+        next_due = self.ttl_seconds
+        now = self.clock()
+        for key, checked_at in due:
+            remaining = checked_at + self.ttl_seconds - now
+            if remaining > 0:
+                next_due = min(next_due, remaining)
+                continue
+            try:
+                self.refresh(*key, resident_only=True)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.warning("Background schema refresh of %s.%s failed: %s",
+                                key[0], key[1], e)
+                # Retried after another TTL instead of on every wake-up
+                with self._lock:
+                    if key in self._entries:
+                        self._entries[key].checked_at = now
+        return max(next_due, 1)
+
+    def start_refresh(self):
+        """Starts the background refresh thread, unless disabled or running."""
+        if self._refresh_thread is not None or self.ttl_seconds <= 0:
+            return
+
+        def refresh_loop():
+            delay = self.ttl_seconds
+            while True:
+                # Woken early when a stale snapshot is loaded
+                self._wake.wait(timeout=delay)
+                self._wake.clear()
+                delay = self.refresh_stale()
+
+        self._refresh_thread = threading.Thread(
+            target=refresh_loop, name="schema-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def datasets(self):
+        """Returns the resident (project_id, dataset_id) pairs, least recent first."""
+        with self._lock:
+            return list(self._entries)
+
+    def evict(self, project_id, dataset_id):
+        """Removes a dataset from memory, e.g. after it was deleted."""
+        with self._lock:
+            if (project_id, dataset_id) in self._entries:
+                self._remove((project_id, dataset_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns the load counters and the current size of the registry."""
+        with self._lock:
+            stats = dict(
+                self._stats,
+                sources=dict(self._sources),
+                datasets=len(self._entries),
+                bytes=self._bytes,
+            )
+        stats["coalesced"] = (
+            self._loads.stats()["coalesced"] + self._refreshes.stats()["coalesced"]
+        )
+        return stats
+
+    def flight_stats(self):
+        """Returns the executed and coalesced loads and refreshes."""
+        return {
+            flight.name: flight.stats() for flight in (self._loads, self._refreshes)
+        }
+
+    def _check_allowed(self, project_id, dataset_id):
+        if (
+            ANY_DATASET not in self.allowed_datasets
+            and f"{project_id}.{dataset_id}" not in self.allowed_datasets
+        ):
+            raise ValueError(
+                f"Dataset {project_id}.{dataset_id} is not in registry.allowed_datasets"
+            )
+
+    def _stale(self, created_at):
+        return self.ttl_seconds > 0 and self.clock() - created_at >= self.ttl_seconds
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+            return entry
+
+    def _load(self, key):
+        """Loads a dataset that is not resident, returns (settings, source)."""
+        # Loaded by a call that finished after the lookup of get_settings
+        entry = self._get(key)
+        if entry is not None:
+            return entry.settings, "registry"
+
+        source, loaded = self.load_snapshot(*key)
+        if loaded is None:
+            source = "bigquery"
+            loaded = self.refresh_snapshot(*key, None)
+        settings = self._put(key, loaded)
+        with self._lock:
+            self._stats["misses"] += 1
+            self._sources[source] = self._sources.get(source, 0) + 1
+
+        if self._stale(loaded["created_at"]):
+            self._wake.set()
+        return settings, source
+
+    def _refresh(self, key, resident_only):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and resident_only:
+            return None
+        new_snapshot = self.refresh_snapshot(
+            *key, entry.snapshot if entry else None
+        )
+        settings = self._put(key, new_snapshot, touch=entry is None)
+        with self._lock:
+            self._stats["refreshes"] += 1
+        return settings
+
+    def _put(self, key, new_snapshot, touch=True):
+        """Stores a snapshot, evicts the least recently used datasets and
+        returns the settings of the snapshot.
+
+        A refresh of a resident dataset replaces it in place (`touch=False`),
+        so background refreshes do not keep unused datasets resident.
+        """
+        entry = DatasetEntry(
+            new_snapshot,
+            self.build_settings(new_snapshot),
+            checked_at=new_snapshot["created_at"],
+        )
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is None and not touch:
+                # Evicted while it was refreshed
+                return entry.settings
+            if previous is not None:
+                self._bytes -= previous.size
+            # Assigning an existing key keeps its position in the recency order
+            self._entries[key] = entry
+            self._bytes += entry.size
+            if touch:
+                self._entries.move_to_end(key)
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_datasets or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return entry.settings
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
@@ -0,0 +1,398 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded fetching, JSON-friendly conversion and storage of query results.
+
+Large results are not sent to the model: they are kept in a result store
+under a handle, and the model receives a summary (row counts and per-column
+statistics) with the first rows. Clients read the fetched rows by their
+handle. At most MAX_NUM_ROWS rows of a query are fetched: the total row count
+of the query and whether the rows are `truncated` are kept in the metadata of
+the Arrow table.
+"""
+
+import base64
+import glob
+import logging
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from . import cache
+
+
+# Arrow schema metadata keys of a fetched result
+TOTAL_ROWS_KEY = b"total_rows"
+TRUNCATED_KEY = b"truncated"
+
+
+def fetch_arrow(query_job, max_rows):
+    """Fetches at most `max_rows` rows of a query as an Arrow table.
+
+    Only the pages needed for `max_rows` rows are requested, so memory use
+    does not depend on the size of the full result. The row count of the
+    query and whether rows were left out (or may have been, when `max_rows`
+    rows were fetched, e.g. by the LIMIT added to the query) are kept in the
+    table metadata (see `result_rows`).
+
+    Args:
+        query_job (bigquery.QueryJob): A started query job.
+        max_rows (int): Maximum number of rows to fetch.
+
+    Returns:
+        tuple: The result schema (list of SchemaField, empty for statements
+          without results) and a pyarrow.Table with up to `max_rows` rows.
+    """
+    row_iterator = query_job.result(max_results=max_rows, page_size=max_rows)
+    if not row_iterator.schema:
+        return [], None
+    table = row_iterator.to_arrow(create_bqstorage_client=False).slice(0, max_rows)
+    total_rows = row_iterator.total_rows
+    if total_rows is None:
+        total_rows = table.num_rows
+    truncated = total_rows > table.num_rows or table.num_rows >= max_rows
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        TOTAL_ROWS_KEY: str(total_rows),
+        TRUNCATED_KEY: str(truncated).lower(),
+    })
+    return row_iterator.schema, table
+
+
+def result_rows(table):
+    """Returns the query row count and the truncation flag of a fetched table.
+
+    See `fetch_arrow`. Tables without the metadata are complete.
+    """
+    metadata = table.schema.metadata or {}
+    if TOTAL_ROWS_KEY not in metadata:
+        return table.num_rows, False
+    return int(metadata[TOTAL_ROWS_KEY]), metadata.get(TRUNCATED_KEY) == b"true"
+
+
+def _json_type(arrow_type):
+    """Returns the Arrow type a column is cast to before conversion.
+
+    Dates, times and timestamps become ISO strings and decimals become
+    floats, including inside lists and structs. Other types, including
+    intervals and bytes (converted by `_json_value_of`), are unchanged.
+    """
+    if pa.types.is_interval(arrow_type):
+        return arrow_type
+    if pa.types.is_temporal(arrow_type):
+        return pa.string()
+    if pa.types.is_decimal(arrow_type):
+        return pa.float64()
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return pa.list_(_json_type(arrow_type.value_type))
+    if pa.types.is_struct(arrow_type):
+        return pa.struct(
+            [field.with_type(_json_type(field.type)) for field in arrow_type]
+        )
+    return arrow_type
+
+
+def _format_interval(value):
+    """Formats a month-day-nano interval as BigQuery does ('Y-M D H:M:S[.F]')."""
+    months, days, nanoseconds = value
+    year_sign = "-" if months < 0 else ""
+    time_sign = "-" if nanoseconds < 0 else ""
+    seconds, nanoseconds = divmod(abs(nanoseconds), 10**9)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    fraction = f".{nanoseconds:09d}".rstrip("0") if nanoseconds else ""
+    return (
+        f"{year_sign}{abs(months) // 12}-{abs(months) % 12} {days} "
+        f"{time_sign}{hours}:{minutes}:{seconds}{fraction}"
+    )
+
+
+def _json_value_of(value):
+    """Converts a Python value of an Arrow column the casts do not handle.
+
+    Intervals become BigQuery interval strings and bytes base64 strings,
+    inside lists and structs too, and other values that are not JSON types
+    their string form.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, pa.MonthDayNano):
+        return _format_interval(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, dict):
+        return {key: _json_value_of(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_json_value_of(item) for item in value]
+    return str(value)
+
+
+def _needs_value_conversion(arrow_type):
+    """Whether a type has intervals or bytes, at any nesting level."""
+    if (
+        pa.types.is_interval(arrow_type)
+        or pa.types.is_binary(arrow_type)
+        or pa.types.is_large_binary(arrow_type)
+        or pa.types.is_fixed_size_binary(arrow_type)
+    ):
+        return True
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return _needs_value_conversion(arrow_type.value_type)
+    if pa.types.is_struct(arrow_type):
+        return any(_needs_value_conversion(field.type) for field in arrow_type)
+    return False
+
+
+def arrow_to_rows(table):
+    """Converts an Arrow table to JSON-serializable row dicts.
+
+    Each column is converted in one pass: temporal values to ISO strings
+    (dates as 'YYYY-MM-DD') and decimals to floats. Bytes become base64
+    strings and intervals BigQuery interval strings ('Y-M D H:M:S'), inside
+    lists and structs too, and columns of types Arrow cannot cast are
+    converted value by value.
+
+    Args:
+        table (pyarrow.Table): Query results.
+
+    Returns:
+        list[dict]: One dict per row, keyed by column name.
+    """
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        json_type = _json_type(column.type)
+        if json_type != column.type:
+            try:
+                column = column.cast(json_type)
+            except pa.ArrowNotImplementedError:
+                columns[name] = [_json_value_of(v) for v in column.to_pylist()]
+                continue
+        values = column.to_pylist()
+        if _needs_value_conversion(column.type):
+            values = [_json_value_of(value) for value in values]
+        columns[name] = values
+
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def _json_value(scalar):
+    """Converts an Arrow scalar to a JSON-serializable value."""
+    return arrow_to_rows(pa.table({"value": pa.array([scalar])}))[0]["value"]
+
+
+def summarize(table, top_k=3):
+    """Summarizes a result with vectorized Arrow compute kernels.
+
+    Args:
+        table (pyarrow.Table): Query results.
+        top_k (int): Most frequent values reported per string/boolean column.
+
+    Returns:
+        dict: The `row_count` of the table, the `total_rows` of its query,
+          whether the rows are `truncated` (the statistics then describe only
+          the fetched rows) and, per column, its `type`, `nulls`, the
+          `min`/`max` of numeric and temporal columns and the `distinct`
+          count and `top` values (with their counts) of string and boolean
+          columns.
+    """
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        summary = {"type": str(column.type), "nulls": column.null_count}
+        column_type = column.type
+        if column.null_count < len(column):
+            if (
+                pa.types.is_integer(column_type)
+                or pa.types.is_floating(column_type)
+                or pa.types.is_decimal(column_type)
+                or (
+                    pa.types.is_temporal(column_type)
+                    and not pa.types.is_interval(column_type)
+                )
+            ):
+                min_max = pc.min_max(column)
+                summary["min"] = _json_value(min_max["min"])
+                summary["max"] = _json_value(min_max["max"])
+            elif pa.types.is_string(column_type) or pa.types.is_boolean(column_type):
+                counts = pc.value_counts(column.drop_null())
+                values, value_counts = counts.field("values"), counts.field("counts")
+                top = pc.array_sort_indices(value_counts, order="descending")[:top_k]
+                summary["distinct"] = len(counts)
+                summary["top"] = [
+                    [values[i].as_py(), value_counts[i].as_py()]
+                    for i in top.to_pylist()
+                ]
+        columns[name] = summary
+    total_rows, truncated = result_rows(table)
+    return {
+        "row_count": table.num_rows,
+        "total_rows": total_rows,
+        "truncated": truncated,
+        "columns": columns,
+    }
+
+
+def table_to_bytes(table):
+    """Serializes an Arrow table in the Arrow IPC stream format."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def table_from_bytes(data):
+    """Deserializes an Arrow table written by `table_to_bytes`."""
+    return pa.ipc.open_stream(data).read_all()
+
+
+class ResultStore:
+    """Interface of a backend keeping query results by handle."""
+
+    def save(self, handle, table):
+        """Stores the Arrow table of a result."""
+        raise NotImplementedError
+
+    def load(self, handle):
+        """Returns the Arrow table of a handle, or None if unknown or expired."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Returns usage counters."""
+        return {}
+
+
+class MemoryResultStore(ResultStore):
+    """Keeps results in an LRU cache of the process, serialized as Arrow IPC.
+
+    Args:
+        max_entries (int): Maximum number of results.
+        max_bytes (int): Maximum size of all serialized results.
+        ttl_seconds (float): Result lifetime (0 for no expiry).
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=100_000_000, ttl_seconds=3600):
+        self._cache = cache.LRUCache(
+            max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds
+        )
+
+    def save(self, handle, table):
+        self._cache.put(handle, table_to_bytes(table))
+
+    def load(self, handle):
+        data = self._cache.get(handle)
+        return None if data is None else table_from_bytes(data)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class ParquetResultStore(ResultStore):
+    """Writes one Parquet file per result in a local directory.
+
+    Other processes of the host (e.g. a download endpoint) can read the
+    results. The oldest files are deleted beyond `max_entries` or after
+    `ttl_seconds`.
+
+    Args:
+        directory (str): Directory of the result files.
+        max_entries (int): Maximum number of files kept.
+        ttl_seconds (float): File lifetime (0 for no expiry).
+    """
+
+    def __init__(self, directory, max_entries=1000, ttl_seconds=3600):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.saved = 0
+        self.misses = 0
+
+    def path(self, handle):
+        return os.path.join(self.directory, f"{handle}.parquet")
+
+    def save(self, handle, table):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written to a temporary file and renamed, like the schema snapshots
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pq.write_table(table, f)
+            os.replace(tmp_path, self.path(handle))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.saved += 1
+        try:
+            self._cleanup()
+        except OSError as e:  # e.g. a file deleted by another process meanwhile
+            logging.info("Result files cleanup failed: %s", e)
+
+    def load(self, handle):
+        path = self.path(os.path.basename(handle))
+        try:
+            if not self._expired(path, time.time()):
+                return pq.read_table(path)
+        except FileNotFoundError:
+            pass
+        self.misses += 1
+        return None
+
+    def _expired(self, path, now):
+        if not self.ttl_seconds:
+            return False
+        return now - os.path.getmtime(path) > self.ttl_seconds
+
+    def _cleanup(self):
+        files = glob.glob(os.path.join(self.directory, "*.parquet"))
+        files.sort(key=os.path.getmtime)
+        now = time.time()
+        for i, path in enumerate(files):
+            if len(files) - i > self.max_entries or self._expired(path, now):
+                os.unlink(path)
+
+    def stats(self):
+        return {"saved": self.saved, "misses": self.misses}
+
+
+STORES = {
+    "memory": lambda config: MemoryResultStore(
+        max_entries=config.get("max_entries", 1000),
+        max_bytes=config.get("max_bytes", 100_000_000),
+        ttl_seconds=config.get("ttl_seconds", 3600),
+    ),
+    "local": lambda config: ParquetResultStore(
+        config.get("path")
+        or os.path.join(tempfile.gettempdir(), "data_assistant_results"),
+        max_entries=config.get("max_entries", 1000),
+        ttl_seconds=config.get("ttl_seconds", 3600),
+    ),
+}
+
+
+def create_store(config):
+    """Creates the result store selected in the `results` config section.
+
+    Args:
+        config (dict): The `results` section of config.yaml.
+
+    Returns:
+        ResultStore: The configured store.
+    """
+    store = config.get("store", "memory")
+    if store not in STORES:
+        raise ValueError(f"Unknown result store: {store}")
+    return STORES[store](config)
@@ -0,0 +1,253 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Relevance-ranked schema pruning.
+
+The DDL of each table (name, columns, COMMENT descriptions and example values)
+is indexed with BM25. For a question, the best tables and the tables that
+share a key column with them are kept, up to a token budget. The full schema
+is used when the index is not confident about the selection.
+"""
+
+import logging
+import re
+import unicodedata
+
+import numpy as np
+
+from . import cache
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Table names are repeated in the document to weight them over sample values.
+TABLE_NAME_BOOST = 3
+
+CHARS_PER_TOKEN = 4
+
+TABLE_START = "CREATE OR REPLACE TABLE `"
+COLUMN_PATTERN = re.compile(r"^  `([^`]+)` ", re.MULTILINE)
+KEY_COLUMN_PATTERN = re.compile(r"(^id$|_id$|_key$|_code$)")
+
+STOPWORDS = {
+    # DDL keywords and types
+    "create", "or", "replace", "table", "insert", "into", "values", "comment",
+    "null", "array", "example", "string", "integer", "float", "boolean",
+    "numeric", "bignumeric", "timestamp", "datetime", "date", "time", "bytes",
+    "record", "json", "geography", "interval", "range", "nan", "none", "true",
+    "false",
+    # English
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "is", "are",
+    "what", "which", "who", "how", "many", "much", "list", "show", "give", "me",
+    "all", "per", "with", "from", "that", "this", "each", "do", "does", "there",
+    "find", "get", "last", "top", "tables",
+    # Portuguese
+    "o", "os", "as", "um", "uma", "de", "da", "do", "das", "dos", "no", "na",
+    "nos", "nas", "em", "por", "para", "com", "e", "que", "qual", "quais",
+    "quantos", "quantas", "quanto", "mostre", "liste", "todos", "todas", "tabela",
+    "tabelas",
+}
+
+# Indexes of the most recently used schemas (one per dataset served), keyed
+# by dataset and version.
+MAX_CACHED_SCHEMAS = 16
+_index_cache = cache.LRUCache(max_entries=MAX_CACHED_SCHEMAS)
+
+
+def estimate_tokens(text):
+    """Roughly estimates the number of LLM tokens of a text."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def tokenize(text):
+    """Lowercases, strips accents and splits a text into index terms."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text):
+        if term in STOPWORDS or len(term) < 2:
+            continue
+        # Light plural stemming ("orders" -> "order", "clientes" -> "cliente")
+        if len(term) > 3 and term.endswith("s"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def split_tables(ddl_schema):
+    """Splits a DDL schema into the statements of each table.
+
+    Args:
+        ddl_schema (str): The DDL built by `tools.get_bigquery_schema`.
+
+    Returns:
+        dict: Full table name -> DDL (with example values) of the table.
+    """
+    tables = {}
+    for chunk in ddl_schema.split(TABLE_START)[1:]:
+        table_name = chunk[:chunk.index("`")]
+        tables[table_name] = TABLE_START + chunk
+    return tables
+
+
+class SchemaIndex:
+    """BM25 index over the tables of a DDL schema."""
+
+    def __init__(self, ddl_schema):
+        self.tables = split_tables(ddl_schema)
+        self.names = list(self.tables)
+        self.columns = [
+            set(COLUMN_PATTERN.findall(self.tables[name].split("\n);", 1)[0]))
+            for name in self.names
+        ]
+
+        # term -> (document indexes, term frequencies)
+        postings = {}
+        self.doc_lengths = np.zeros(len(self.names))
+        for i, name in enumerate(self.names):
+            table_id = name.rsplit(".", 1)[-1]
+            terms = tokenize(self.tables[name]) + tokenize(table_id) * TABLE_NAME_BOOST
+            self.doc_lengths[i] = len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(i)
+                postings[term][1].append(count)
+
+        self.postings = {
+            term: (np.array(docs), np.array(tfs, dtype=float))
+            for term, (docs, tfs) in postings.items()
+        }
+        self.avg_doc_length = self.doc_lengths.mean() if self.names else 0.0
+
+    def score(self, question):
+        """Returns the BM25 score of every table and the known question terms."""
+        scores = np.zeros(len(self.names))
+        known_terms = []
+        n_docs = len(self.names)
+        length_norm = BM25_K1 * (
+            1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_doc_length, 1.0)
+        )
+        for term in set(tokenize(question)):
+            if term not in self.postings:
+                continue
+            known_terms.append(term)
+            docs, tfs = self.postings[term]
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + length_norm[docs])
+        return scores, known_terms
+
+    def join_neighbours(self, i):
+        """Returns the tables sharing a key-like column with table `i`."""
+        keys = {c for c in self.columns[i] if KEY_COLUMN_PATTERN.search(c.lower())}
+        return [
+            j for j in range(len(self.names))
+            if j != i and keys & self.columns[j]
+        ]
+
+    def select(self, question, top_k=5, token_budget=8000, min_coverage=0.6):
+        """Selects the part of the schema relevant to a question.
+
+        Args:
+            question (str): Natural language question.
+            top_k (int): Maximum number of tables ranked by relevance.
+            token_budget (int): Maximum estimated tokens of the selection.
+            min_coverage (float): Minimum share of the question terms found in
+              the schema that the selection must contain. Below it the full
+              schema is returned.
+
+        Returns:
+            tuple: The selected DDL and the list of selected table names, or
+              None when the full schema should be used.
+        """
+        scores, known_terms = self.score(question)
+        if not known_terms or scores.max() <= 0:
+            return None
+
+        ranked = [i for i in np.argsort(-scores, kind="stable")[:top_k] if scores[i] > 0]
+        candidates = []
+        for i in ranked:
+            for j in [i] + self.join_neighbours(i):
+                if j not in candidates:
+                    candidates.append(j)
+
+        selected = []
+        used_tokens = 0
+        for i in candidates:
+            tokens = estimate_tokens(self.tables[self.names[i]])
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append(i)
+            used_tokens += tokens
+        if not selected:
+            return None
+
+        covered = {
+            term for term in known_terms
+            if np.isin(self.postings[term][0], selected).any()
+        }
+        if len(covered) / len(known_terms) < min_coverage:
+            return None
+
+        selected.sort()
+        names = [self.names[i] for i in selected]
+        return "".join(self.tables[name] for name in names), names
+
+
+def get_index(database_settings):
+    """Returns the index of a schema, building it once per dataset and version."""
+    key = cache.schema_key(database_settings)
+    index = _index_cache.get(key)
+    if index is None:
+        index = SchemaIndex(database_settings["bq_ddl_schema"])
+        _index_cache.put(key, index)
+    return index
+
+
+def relevant_schema(question, database_settings, config):
+    """Returns the part of the schema to send in a prompt for a question.
+
+    Args:
+        question (str): Natural language question.
+        database_settings (dict): The database settings of the session.
+        config (dict): The `retrieval` section of config.yaml.
+
+    Returns:
+        str: The pruned DDL, or the full DDL when pruning is disabled, not
+          needed (the schema fits the budget) or not confident.
+    """
+    ddl_schema = database_settings["bq_ddl_schema"]
+    token_budget = config.get("token_budget", 8000)
+    if not config.get("enabled", False) or estimate_tokens(ddl_schema) <= token_budget:
+        return ddl_schema
+
+    selection = get_index(database_settings).select(
+        question,
+        top_k=config.get("top_k", 5),
+        token_budget=token_budget,
+        min_coverage=config.get("min_coverage", 0.6),
+    )
+    if selection is None:
+        logging.info("Schema pruning not confident, using the full schema")
+        return ddl_schema
+
+    pruned_ddl, names = selection
+    logging.info(
+        "Schema pruned to %d tables (%d of %d tokens): %s",
+        len(names), estimate_tokens(pruned_ddl), estimate_tokens(ddl_schema), names,
+    )
+    return pruned_ddl
@@ -0,0 +1,212 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Routing of the SQL generation between tool models.
+
+The complexity of a question is estimated locally, without a model call: the
+number of tables needed to cover its terms (from the schema index) and the
+joins, aggregations, window computations and nested conditions it asks for
+(English and Portuguese keywords). The routing tiers of config.yaml map it to
+a model, cheapest first. `ModelStats` keeps the latency and validation
+outcome of each model, to tune the tiers.
+"""
+
+import re
+import statistics
+import threading
+import unicodedata
+from collections import deque
+
+import numpy as np
+
+from . import retrieval
+
+
+# Keywords of the question (lowercase, without accents) hinting at each part
+# of a query
+JOIN_PATTERN = re.compile(
+    r"\b(join\w*|combin\w*|together with|along with|match\w*|related to|"
+    r"for each|between|compar\w*|versus|vs|"
+    r"cruza\w*|junt\w*|relacionad\w*|para cada|entre)\b"
+)
+AGGREGATION_PATTERN = re.compile(
+    r"\b(count|how many|number of|totals?|sum|average|avg|mean|median|"
+    r"maximum|minimum|highest|lowest|most|least|top \d+|percent\w*|share|"
+    r"ratio|rate|distinct|unique|group\w*|"
+    r"quant[oa]s|numero de|soma|media|mediana|maxim[oa]|minim[oa]|maior|"
+    r"menor|mais|menos|proporcao|taxa|distint[oa]s|agrup\w*)\b"
+)
+WINDOW_PATTERN = re.compile(
+    r"\b(rank\w*|running|cumulative|moving|rolling|previous|prior|growth|"
+    r"change|trend|over time|year over year|month over month|"
+    r"acumulad[oa]|movel|anterior|crescimento|variacao|tendencia|"
+    r"ao longo do tempo)\b"
+)
+NESTING_PATTERN = re.compile(
+    r"\b(never|without|not in|no \w+ at all|above average|below average|"
+    r"more than (the )?average|less than (the )?average|"
+    r"nunca|sem|acima da media|abaixo da media)\b"
+)
+
+# Default complexity points per feature (`routing.weights` in config.yaml)
+WEIGHTS = {
+    "extra_tables": 2,  # per table needed beyond the first
+    "joins": 1,
+    "aggregations": 1,
+    "windows": 2,
+    "nesting": 2,
+    "long_question": 1,  # more than LONG_QUESTION_TERMS terms
+}
+LONG_QUESTION_TERMS = 20
+
+# Latency samples kept per model for the percentiles
+LATENCY_SAMPLES = 1000
+
+
+def normalize(question):
+    """Lowercases a question and strips its accents."""
+    text = unicodedata.normalize("NFKD", question.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tables_needed(index, question):
+    """Returns the tables needed to cover the question terms the schema knows.
+
+    Tables are taken by decreasing relevance while they cover a term not yet
+    covered, so a term found in many tables (e.g. a common column name) does
+    not count them all.
+    """
+    scores, known_terms = index.score(question)
+    uncovered = set(known_terms)
+    tables = []
+    for i in np.argsort(-scores, kind="stable"):
+        if not uncovered or scores[i] <= 0:
+            break
+        covered = {term for term in uncovered if i in index.postings[term][0]}
+        if covered:
+            tables.append(index.names[i])
+            uncovered -= covered
+    return tables
+
+
+def estimate_complexity(question, database_settings, weights=None):
+    """Estimates the complexity of the SQL answering a question.
+
+    Args:
+        question (str): Natural language question.
+        database_settings (dict): The database settings of the session.
+        weights (dict): Points per feature, overriding WEIGHTS.
+
+    Returns:
+        dict: The `complexity` score and its features: the `tables` needed
+          and the number of `joins`, `aggregations`, `windows` and
+          `nesting` keywords.
+    """
+    weights = dict(WEIGHTS, **(weights or {}))
+    text = normalize(question)
+    tables = tables_needed(retrieval.get_index(database_settings), question)
+    features = {
+        "joins": len(JOIN_PATTERN.findall(text)),
+        "aggregations": len(AGGREGATION_PATTERN.findall(text)),
+        "windows": len(WINDOW_PATTERN.findall(text)),
+        "nesting": len(NESTING_PATTERN.findall(text)),
+    }
+    complexity = (
+        weights["extra_tables"] * max(len(tables) - 1, 0)
+        + sum(weights[name] * count for name, count in features.items())
+        + weights["long_question"] * (len(text.split()) > LONG_QUESTION_TERMS)
+    )
+    return dict(features, complexity=complexity, tables=tables)
+
+
+def select_tier(tiers, complexity):
+    """Returns the index of the first tier accepting a complexity.
+
+    A tier without `max_complexity` accepts any complexity; the last tier
+    is used when none accepts it.
+    """
+    for i, tier in enumerate(tiers):
+        max_complexity = tier.get("max_complexity")
+        if max_complexity is None or complexity <= max_complexity:
+            return i
+    return len(tiers) - 1
+
+
+class ModelStats:
+    """Latency and validation outcome of the calls of each model."""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model):
+        return self._models.setdefault(model, {
+            "calls": 0,
+            "errors": 0,
+            "latencies": deque(maxlen=LATENCY_SAMPLES),
+            "routed": 0,
+            "escalated_to": 0,
+            "validated": 0,
+            "rejected": 0,
+        })
+
+    def record_call(self, model, seconds, ok=True):
+        """Records a model call and its latency."""
+        with self._lock:
+            stats = self._model(model)
+            stats["calls"] += 1
+            if ok:
+                stats["latencies"].append(seconds)
+            else:
+                stats["errors"] += 1
+
+    def record_route(self, model, escalated):
+        """Records a question routed (or escalated) to a model."""
+        with self._lock:
+            stats = self._model(model)
+            stats["routed"] += 1
+            stats["escalated_to"] += escalated
+
+    def record_outcome(self, model, valid):
+        """Records whether the SQL generated by a model passed validation."""
+        with self._lock:
+            self._model(model)["validated" if valid else "rejected"] += 1
+
+    def snapshot(self):
+        """Returns the stats of each model.
+
+        `latency_p50` and `latency_p95` are in seconds; `success_rate` is the
+        share of the SQL generations that passed validation.
+        """
+        with self._lock:
+            models = {
+                model: dict(stats, latencies=list(stats["latencies"]))
+                for model, stats in self._models.items()
+            }
+        report = {}
+        for model, stats in models.items():
+            latencies = sorted(stats.pop("latencies"))
+            checked = stats["validated"] + stats["rejected"]
+            stats["latency_p50"] = (
+                round(statistics.median(latencies), 3) if latencies else None
+            )
+            stats["latency_p95"] = (
+                round(latencies[int(0.95 * (len(latencies) - 1))], 3)
+                if latencies else None
+            )
+            stats["success_rate"] = (
+                round(stats["validated"] / checked, 3) if checked else None
+            )
+            report[model] = stats
+        return report
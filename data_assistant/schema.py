@@ -0,0 +1,385 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Schema introspection for a BigQuery dataset.
+
+Column metadata for every table (with its partitioning and clustering) is
+read with a single INFORMATION_SCHEMA query, and sample rows are fetched
+concurrently through a bounded thread pool. The tables are then rendered by
+a renderer of `schema_render.py`.
+"""
+
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import bigquery
+
+from . import retrieval
+from . import schema_render
+
+
+DEFAULT_MAX_WORKERS = 8
+SAMPLE_ROWS = 5
+
+# Table types returned by `get_table` as "TABLE" (views are skipped).
+BASE_TABLE_TYPES = ("BASE TABLE", "CLONE")
+
+# GoogleSQL type names mapped to the legacy names returned by the tables API.
+LEGACY_TYPE_NAMES = {
+    "INT64": "INTEGER",
+    "FLOAT64": "FLOAT",
+    "BOOL": "BOOLEAN",
+    "STRUCT": "RECORD",
+}
+
+COLUMNS_QUERY = """
+SELECT
+  c.table_name,
+  c.column_name,
+  c.data_type,
+  c.is_partitioning_column,
+  c.clustering_ordinal_position,
+  p.description,
+  REGEXP_EXTRACT(t.ddl, r'\\nPARTITION BY ([^\\n]+)') AS partition_by,
+  REGEXP_CONTAINS(t.ddl, r'require_partition_filter\\s*=\\s*true') AS require_partition_filter
+FROM `{project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS` AS c
+JOIN `{project_id}.{dataset_id}.INFORMATION_SCHEMA.TABLES` AS t
+  ON t.table_name = c.table_name
+LEFT JOIN `{project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS` AS p
+  ON p.table_name = c.table_name AND p.field_path = c.column_name
+WHERE t.table_type IN UNNEST(@table_types)
+  AND c.is_hidden = 'NO'
+  AND (@all_tables OR c.table_name IN UNNEST(@table_names))
+ORDER BY c.table_name, c.ordinal_position
+"""
+
+# __TABLES__ type 1 is a table (2 is a view, 3 an external table).
+MODIFIED_TIMES_QUERY = """
+SELECT table_id, last_modified_time
+FROM `{project_id}.{dataset_id}.__TABLES__`
+WHERE type = 1
+ORDER BY table_id
+"""
+
+# Timing breakdown (seconds) of the last call to `introspect_dataset`.
+last_timings = {}
+
+# Renderer inputs of the last call to `introspect_dataset`, rendered again in
+# every mode only when `token_stats` is called.
+_last_render_inputs = []
+
+
+def to_legacy_type(data_type):
+    """Converts an INFORMATION_SCHEMA data type to a (field_type, mode) pair.
+
+    Args:
+        data_type (str): GoogleSQL type, e.g. 'ARRAY<STRUCT<a INT64>>' or
+          'NUMERIC(10, 2)'.
+
+    Returns:
+        tuple: The legacy field type (e.g. 'RECORD') and the field mode
+          ('REPEATED' or 'NULLABLE').
+    """
+    mode = "NULLABLE"
+    if data_type.startswith("ARRAY<"):
+        mode = "REPEATED"
+        data_type = data_type[len("ARRAY<"):-1]
+
+    base_type = re.match(r"[A-Z0-9_]+", data_type).group(0)
+    return LEGACY_TYPE_NAMES.get(base_type, base_type), mode
+
+
+def fetch_table_modified_times(client, project_id, dataset_id):
+    """Reads the last modified time of every base table in one query.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        project_id (str): The ID of your Google Cloud Project.
+        dataset_id (str): The ID of the BigQuery dataset.
+
+    Returns:
+        dict: Table id -> last modified time (milliseconds since epoch).
+    """
+    query = MODIFIED_TIMES_QUERY.format(project_id=project_id, dataset_id=dataset_id)
+    return {
+        row["table_id"]: row["last_modified_time"]
+        for row in client.query(query).result()
+    }
+
+
+def table_layout(partition_by, require_partition_filter, columns):
+    """Builds the partitioning and clustering layout of a table.
+
+    Args:
+        partition_by (str): The PARTITION BY expression of the table DDL,
+          e.g. 'DATE(created_at)' or '_PARTITIONDATE', or None.
+        require_partition_filter (bool): Whether queries must filter on the
+          partition column.
+        columns (list[dict]): Column dicts of the table, with their
+          `partitioning` flag and `clustering_position`.
+
+    Returns:
+        dict: The `partition_by` expression, the `partition_column` and its
+          `partition_type` (GoogleSQL type, `_PARTITIONTIME`/`_PARTITIONDATE`
+          for ingestion-time partitioning), `require_partition_filter` and the
+          `clustering` columns in order, or None for a table that is neither
+          partitioned nor clustered.
+    """
+    clustering = [
+        c["name"]
+        for c in sorted(
+            (c for c in columns if c["clustering_position"]),
+            key=lambda c: c["clustering_position"],
+        )
+    ]
+    partition_by = (partition_by or "").strip() or None
+    if partition_by is None and not clustering:
+        return None
+
+    partition_column = partition_type = None
+    for column in columns:
+        if column["partitioning"]:
+            partition_column, partition_type = column["name"], column["data_type"]
+    if partition_column is None and partition_by:
+        # Ingestion-time partitioning on a pseudo column
+        for pseudo_column, pseudo_type in (
+            ("_PARTITIONDATE", "DATE"), ("_PARTITIONTIME", "TIMESTAMP")
+        ):
+            if pseudo_column in partition_by.upper():
+                partition_column, partition_type = pseudo_column, pseudo_type
+                break
+
+    return {
+        "partition_by": partition_by,
+        "partition_column": partition_column,
+        "partition_type": partition_type,
+        "require_partition_filter": bool(require_partition_filter),
+        "clustering": clustering,
+    }
+
+
+def fetch_dataset_schema(client, project_id, dataset_id, table_ids=None):
+    """Reads the top-level columns and layout of every base table in one query.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        project_id (str): The ID of your Google Cloud Project.
+        dataset_id (str): The ID of the BigQuery dataset.
+        table_ids (list[str]): Restricts the query to these tables. All base
+          tables are read when None.
+
+    Returns:
+        tuple: Table id -> list of column dicts with the keys `name`,
+          `data_type` (GoogleSQL type), `field_type`, `mode`, `description`,
+          `partitioning` and `clustering_position`, in table id order; and
+          table id -> partitioning and clustering layout (see `table_layout`).
+    """
+    query = COLUMNS_QUERY.format(project_id=project_id, dataset_id=dataset_id)
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("table_types", "STRING", BASE_TABLE_TYPES),
+            bigquery.ScalarQueryParameter("all_tables", "BOOL", table_ids is None),
+            bigquery.ArrayQueryParameter("table_names", "STRING", table_ids or []),
+        ]
+    )
+
+    tables = {}
+    table_options = {}
+    for row in client.query(query, job_config=job_config).result():
+        field_type, mode = to_legacy_type(row["data_type"])
+        tables.setdefault(row["table_name"], []).append(
+            {
+                "name": row["column_name"],
+                "data_type": row["data_type"],
+                "field_type": field_type,
+                "mode": mode,
+                "description": row["description"],
+                "partitioning": row["is_partitioning_column"] == "YES",
+                "clustering_position": row["clustering_ordinal_position"],
+            }
+        )
+        table_options[row["table_name"]] = (
+            row["partition_by"], row["require_partition_filter"]
+        )
+
+    layouts = {
+        table_id: table_layout(*table_options[table_id], columns)
+        for table_id, columns in tables.items()
+    }
+    return tables, layouts
+
+
+def fetch_dataset_columns(client, project_id, dataset_id, table_ids=None):
+    """Reads the top-level columns of every base table in one query.
+
+    Returns:
+        dict: Table id -> list of column dicts (see `fetch_dataset_schema`).
+    """
+    return fetch_dataset_schema(client, project_id, dataset_id, table_ids)[0]
+
+
+def fetch_sample_rows(client, table_refs, columns, max_workers=DEFAULT_MAX_WORKERS):
+    """Fetches the first rows of several tables concurrently.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        table_refs (list[bigquery.TableReference]): Tables to sample.
+        columns (dict): Table id -> column dicts, as returned by
+          `fetch_dataset_columns`. Used to skip the `get_table` call that
+          `list_rows` would otherwise make for each table.
+        max_workers (int): Maximum number of concurrent `list_rows` calls.
+
+    Returns:
+        dict: Table id -> pandas.DataFrame with up to SAMPLE_ROWS rows.
+    """
+
+    def fetch(table_ref):
+        table_columns = columns.get(table_ref.table_id, [])
+        selected_fields = None
+        # Nested and RANGE fields need their sub-schema to be decoded, so only
+        # flat tables can skip the schema lookup.
+        if table_columns and all(
+            c["field_type"] not in ("RECORD", "RANGE") for c in table_columns
+        ):
+            selected_fields = [
+                bigquery.SchemaField(c["name"], c["field_type"], mode=c["mode"])
+                for c in table_columns
+            ]
+        return client.list_rows(
+            table_ref, max_results=SAMPLE_ROWS, selected_fields=selected_fields
+        ).to_dataframe()
+
+    if not table_refs:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        frames = executor.map(fetch, table_refs)
+        return {
+            table_ref.table_id: frame for table_ref, frame in zip(table_refs, frames)
+        }
+
+
+def introspect_dataset(
+    client,
+    project_id,
+    dataset_id,
+    max_workers=DEFAULT_MAX_WORKERS,
+    table_ids=None,
+    renderer=None,
+    dataset_schema=None,
+):
+    """Builds the schema rendering of every base table of a dataset.
+
+    The estimated token count of the rendered tables is recorded in
+    `last_timings["tokens"]`; `token_stats` compares it to the other render
+    modes.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        project_id (str): The ID of your Google Cloud Project.
+        dataset_id (str): The ID of the BigQuery dataset.
+        max_workers (int): Maximum number of concurrent sample row fetches.
+        table_ids (list[str]): Only introspect these tables. All base tables
+          are introspected when None.
+        renderer (schema_render.SchemaRenderer): Renderer of the tables.
+          Defaults to the DDL renderer.
+        dataset_schema (tuple): The columns and layouts of the tables, as
+          returned by `fetch_dataset_schema`, when already read.
+
+    Returns:
+        dict: Table id -> dict with the `ddl` rendering, the minimal `ddl_min`
+          rendering, the `columns` (see `fetch_dataset_schema`) and the
+          partitioning and clustering `layout` of the table (see
+          `table_layout`), in table id order.
+    """
+    global last_timings, _last_render_inputs
+    start = time.perf_counter()
+
+    dataset_ref = bigquery.DatasetReference(project_id, dataset_id)
+    if dataset_schema is None:
+        dataset_schema = fetch_dataset_schema(
+            client, project_id, dataset_id, table_ids=table_ids
+        )
+    columns, layouts = dataset_schema
+    metadata_done = time.perf_counter()
+
+    table_refs = [dataset_ref.table(table_id) for table_id in columns]
+    samples = fetch_sample_rows(client, table_refs, columns, max_workers=max_workers)
+    samples_done = time.perf_counter()
+
+    if renderer is None:
+        renderer = schema_render.DDLRenderer()
+    ddl = {}
+    for table_ref in table_refs:
+        table_id = table_ref.table_id
+        rendered, minimal = renderer.render(
+            table_ref, columns[table_id], samples[table_id], layout=layouts[table_id]
+        )
+        ddl[table_id] = {
+            "ddl": rendered,
+            "ddl_min": minimal,
+            "columns": columns[table_id],
+            "layout": layouts[table_id],
+        }
+    render_done = time.perf_counter()
+
+    tokens = {
+        "selected": sum(
+            retrieval.estimate_tokens(table["ddl"]) for table in ddl.values()
+        )
+    }
+    _last_render_inputs = [
+        (table_ref, columns[table_ref.table_id], samples[table_ref.table_id],
+         layouts[table_ref.table_id])
+        for table_ref in table_refs
+    ]
+
+    last_timings = {
+        "tables": len(table_refs),
+        "max_workers": max_workers,
+        "metadata_query_s": round(metadata_done - start, 4),
+        "sample_rows_s": round(samples_done - metadata_done, 4),
+        "render_s": round(render_done - samples_done, 4),
+        "total_s": round(render_done - start, 4),
+        "tokens": tokens,
+    }
+    logging.info("Schema introspection timings: %s", last_timings)
+    return ddl
+
+
+def token_stats():
+    """Estimates the tokens of the last introspected tables in every render mode.
+
+    The tables are rendered again in each mode, so this is meant for reports
+    (e.g. the benchmark), not for the request path.
+
+    Returns:
+        dict: Render mode -> estimated tokens, and the tokens of the
+          `selected` renderer of `introspect_dataset`.
+    """
+    tokens = {
+        mode: sum(
+            retrieval.estimate_tokens(
+                renderer_class().render_levels(
+                    table_ref, columns, sample, layout=layout
+                )[0]
+            )
+            for table_ref, columns, sample, layout in _last_render_inputs
+        )
+        for mode, renderer_class in schema_render.RENDERERS.items()
+    }
+    tokens.update(last_timings.get("tokens", {}))
+    return tokens
@@ -0,0 +1,362 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Renderers of the table schemas sent to the models.
+
+Every renderer starts a table with `CREATE OR REPLACE TABLE `<table>` (`,
+writes one line per column starting with the backquoted column name and
+closes the column list with `);`, so the retrieval index and the local SQL
+validator read every format. The partitioning and clustering of a table
+follow as `--` comment lines after the `);`. Two renderings of a table are produced: the most
+detailed one that fits the per-table token budget and a minimal one (columns
+and descriptions only) used to fit the global budget of the whole schema.
+"""
+
+import base64
+import datetime
+import json
+import logging
+import math
+
+import numpy as np
+
+from . import retrieval
+
+
+class SchemaRenderer:
+    """Interface of a table schema renderer.
+
+    Args:
+        table_token_budget (int): Maximum estimated tokens of a table. Example
+          values are dropped above it; column lines are always kept, since the
+          generated SQL may only use listed columns. 0 for no budget.
+    """
+
+    def __init__(self, table_token_budget=0, **options):
+        self.table_token_budget = table_token_budget
+
+    def render_levels(self, table_ref, columns, rows, layout=None):
+        """Returns the renderings of a table, from the most to the least detailed.
+
+        Args:
+            table_ref (bigquery.TableReference): The table reference.
+            columns (list[dict]): Column dicts of the table (see
+              `schema.fetch_dataset_schema`).
+            rows (pandas.DataFrame): Sample rows of the table.
+            layout (dict): Partitioning and clustering of the table (see
+              `schema.table_layout`), or None.
+        """
+        raise NotImplementedError
+
+    def render(self, table_ref, columns, rows, layout=None):
+        """Renders a table within the per-table token budget.
+
+        Returns:
+            tuple: The rendering used in prompts and the minimal rendering.
+        """
+        levels = self.render_levels(table_ref, columns, rows, layout=layout)
+        for text in levels:
+            if (
+                not self.table_token_budget
+                or retrieval.estimate_tokens(text) <= self.table_token_budget
+            ):
+                return text, levels[-1]
+        return levels[-1], levels[-1]
+
+
+def quote_string(value):
+    """Quotes a string as a GoogleSQL literal."""
+    escaped = (
+        value.replace("\\", "\\\\")
+        .replace("'", "\\'")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+    return f"'{escaped}'"
+
+
+def layout_comment(layout):
+    """Renders the partitioning and clustering of a table as comment lines.
+
+    e.g.:
+
+        -- Partitioned by DATE(created_at): filter on `created_at` (required).
+        -- Clustered by `customer_id`, `status`.
+    """
+    if not layout:
+        return ""
+    text = ""
+    if layout["partition_by"]:
+        text += f"-- Partitioned by {layout['partition_by']}"
+        if layout["partition_column"]:
+            text += f": filter on `{layout['partition_column']}`"
+            if layout["require_partition_filter"]:
+                text += " (required)"
+        text += ".\n"
+    if layout["clustering"]:
+        text += (
+            "-- Clustered by "
+            + ", ".join(f"`{column}`" for column in layout["clustering"])
+            + ".\n"
+        )
+    return text
+
+
+class DDLRenderer(SchemaRenderer):
+    """CREATE TABLE statements followed by INSERT statements of sample rows."""
+
+    def render_levels(self, table_ref, columns, rows, layout=None):
+        ddl_statement = f"CREATE OR REPLACE TABLE `{table_ref}` (\n"
+
+        for field in columns:
+            ddl_statement += f"  `{field['name']}` {field['field_type']}"
+            if field["mode"] == "REPEATED":
+                ddl_statement += " ARRAY"
+            if field["description"]:
+                ddl_statement += f" COMMENT {quote_string(field['description'])}"
+            ddl_statement += ",\n"
+
+        ddl_statement = ddl_statement[:-2] + "\n);\n" + layout_comment(layout) + "\n"
+
+        if rows.empty:
+            return [ddl_statement]
+
+        examples = f"-- Example values for table `{table_ref}`:\n"
+        for _, row in rows.iterrows():
+            examples += f"INSERT INTO `{table_ref}` VALUES\n"
+            example_row_str = "("
+            for value in row.values:
+                if isinstance(value, str):
+                    example_row_str += f"{quote_string(value)},"
+                elif value is None:
+                    example_row_str += "NULL,"
+                else:
+                    example_row_str += f"{value},"
+            example_row_str = example_row_str[:-1] + ");\n\n"
+            examples += example_row_str
+
+        return [ddl_statement + examples, ddl_statement]
+
+
+def split_type_list(text):
+    """Splits the fields of a STRUCT<...> type at its top-level commas."""
+    fields, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in "<(":
+            depth += 1
+        elif char in ">)":
+            depth -= 1
+        elif char == "," and depth == 0:
+            fields.append(text[start:i].strip())
+            start = i + 1
+    fields.append(text[start:].strip())
+    return [field for field in fields if field]
+
+
+def flatten_type(path, data_type):
+    """Flattens a GoogleSQL column type into (path, type) pairs.
+
+    STRUCT columns yield a `STRUCT` (or `ARRAY<STRUCT>`) line followed by
+    one line per nested field, named by its dotted path, e.g.
+    `items` ARRAY<STRUCT>, `items.sku` STRING, `items.qty` INT64.
+    """
+    repeated = data_type.startswith("ARRAY<")
+    inner = data_type[len("ARRAY<"):-1] if repeated else data_type
+    if not inner.startswith("STRUCT<"):
+        return [(path, data_type)]
+
+    flat = [(path, "ARRAY<STRUCT>" if repeated else "STRUCT")]
+    for field in split_type_list(inner[len("STRUCT<"):-1]):
+        if field.startswith("`"):
+            name, _, field_type = field[1:].partition("` ")
+        else:
+            name, _, field_type = field.partition(" ")
+        flat.extend(flatten_type(f"{path}.{name}", field_type.strip()))
+    return flat
+
+
+def values_at(value, fields):
+    """Returns the leaf values of a nested sample value at a field path."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [leaf for item in value for leaf in values_at(item, fields)]
+    if not fields:
+        return [value]
+    if isinstance(value, dict):
+        return values_at(value.get(fields[0]), fields[1:])
+    return []
+
+
+def format_value(value, max_chars):
+    """Formats a sample value as a short literal, or None to skip it."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            value = value[:max_chars] + "..."
+        return quote_string(value)
+    if isinstance(value, bytes):
+        text = "b'" + base64.b64encode(value).decode("ascii") + "'"
+    elif isinstance(value, (dict, list, tuple, np.ndarray)):
+        text = json.dumps(
+            value.tolist() if isinstance(value, np.ndarray) else value, default=str
+        )
+    elif isinstance(value, (datetime.date, datetime.time)):
+        text = quote_string(str(value))
+    else:
+        text = str(value)
+        if text in ("NaT", "<NA>"):
+            return None
+    return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+
+class CompactRenderer(SchemaRenderer):
+    """One line per column with its description and distinct sample values.
+
+    STRUCT fields are flattened to dotted paths and sample values are
+    truncated to `max_value_chars` characters and deduplicated per column,
+    up to `max_sample_values` values, e.g.:
+
+        CREATE OR REPLACE TABLE `project.dataset.orders` (
+          `id` INT64 -- Order key. e.g. 1, 2, 3
+          `status` STRING -- e.g. 'shipped', 'pending'
+          `items` ARRAY<STRUCT>
+          `items.sku` STRING -- e.g. 'A-1', 'B-7'
+        );
+
+    Args:
+        max_sample_values (int): Maximum distinct sample values per column.
+        max_value_chars (int): Maximum characters of a sample value.
+    """
+
+    def __init__(self, table_token_budget=0, max_sample_values=3, max_value_chars=40,
+                 **options):
+        super().__init__(table_token_budget=table_token_budget)
+        self.max_sample_values = max_sample_values
+        self.max_value_chars = max_value_chars
+
+    def sample_values(self, rows, path):
+        """Returns the distinct formatted sample values of a column path."""
+        column, *fields = path.split(".")
+        if column not in rows.columns:
+            return []
+        samples = []
+        for value in rows[column].tolist():
+            for leaf in values_at(value, fields):
+                text = format_value(leaf, self.max_value_chars)
+                if text is not None and text not in samples:
+                    samples.append(text)
+                if len(samples) >= self.max_sample_values:
+                    return samples
+        return samples
+
+    def render_levels(self, table_ref, columns, rows, layout=None):
+        lines = []
+        for column in columns:
+            data_type = column.get("data_type") or column["field_type"]
+            for i, (path, path_type) in enumerate(flatten_type(column["name"], data_type)):
+                description = column["description"] if i == 0 else None
+                samples = []
+                if path_type not in ("STRUCT", "ARRAY<STRUCT>") and not rows.empty:
+                    samples = self.sample_values(rows, path)
+                lines.append((path, path_type, description, samples))
+
+        header = f"CREATE OR REPLACE TABLE `{table_ref}` (\n"
+
+        def render(with_samples):
+            text = header
+            for path, path_type, description, samples in lines:
+                comment = []
+                if description:
+                    comment.append(" ".join(description.split()))
+                if with_samples and samples:
+                    comment.append("e.g. " + ", ".join(samples))
+                text += f"  `{path}` {path_type}"
+                if comment:
+                    text += " -- " + ". ".join(comment)
+                text += "\n"
+            return text + ");\n" + layout_comment(layout) + "\n"
+
+        return [render(True), render(False)]
+
+
+RENDERERS = {
+    "ddl": DDLRenderer,
+    "compact": CompactRenderer,
+}
+
+
+def create_renderer(config, mode=None):
+    """Creates the renderer selected in the `schema` config section.
+
+    Args:
+        config (dict): The `schema` section of config.yaml.
+        mode (str): Overrides `config["render_mode"]`.
+
+    Returns:
+        SchemaRenderer: The configured renderer.
+    """
+    mode = mode or config.get("render_mode", "ddl")
+    if mode not in RENDERERS:
+        raise ValueError(f"Unknown schema render mode: {mode}")
+    return RENDERERS[mode](
+        table_token_budget=config.get("table_token_budget", 0),
+        max_sample_values=config.get("max_sample_values", 3),
+        max_value_chars=config.get("max_value_chars", 40),
+    )
+
+
+def fit_token_budget(tables, token_budget):
+    """Picks the rendering of each table so the schema fits a token budget.
+
+    Tables are switched to their minimal rendering, largest savings first,
+    until the schema fits. The minimal renderings are kept even when they do
+    not fit, since the columns are needed to write valid SQL.
+
+    Args:
+        tables (dict): Table id -> dict with the `ddl` and `ddl_min` renderings.
+        token_budget (int): Maximum estimated tokens of the schema, 0 for none.
+
+    Returns:
+        dict: Table id -> the rendering to use.
+    """
+    chosen = {table_id: table["ddl"] for table_id, table in tables.items()}
+    if not token_budget:
+        return chosen
+
+    total = sum(retrieval.estimate_tokens(ddl) for ddl in chosen.values())
+    savings = sorted(
+        (
+            (
+                retrieval.estimate_tokens(table["ddl"])
+                - retrieval.estimate_tokens(table.get("ddl_min", table["ddl"])),
+                table_id,
+            )
+            for table_id, table in tables.items()
+        ),
+        reverse=True,
+    )
+    for saving, table_id in savings:
+        if total <= token_budget or saving <= 0:
+            break
+        chosen[table_id] = tables[table_id]["ddl_min"]
+        total -= saving
+
+    if total > token_budget:
+        logging.warning(
+            "Schema of %d tokens exceeds the budget of %d tokens without examples",
+            total, token_budget,
+        )
+    return chosen
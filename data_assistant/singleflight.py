@@ -0,0 +1,133 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coalescing of concurrent identical work ("single flight").
+
+When several sessions need the result of the same work at the same time
+(e.g. the schema of a dataset on a cold start, or the SQL of a question a
+dashboard sends to many users), the first caller runs it and the others wait
+for its result instead of running it again. Errors are raised to every
+caller of the call that failed; the next call runs the work again.
+
+A `SingleFlight` group is shared by threads and event loops: `do` runs or
+waits for a blocking call, `do_async` for a coroutine. If the caller running
+the work is cancelled (or interrupted), one of the waiters runs it instead.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+
+class _Abandoned(Exception):
+    """The caller running the work was cancelled before it finished."""
+
+
+class SingleFlight:
+    """A group of calls coalesced by key.
+
+    Args:
+        name (str): Name of the group, used in the stats.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> concurrent.futures.Future of the running call
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, function, *args, **kwargs):
+        """Runs `function(*args, **kwargs)`, or waits for the running call.
+
+        Returns:
+            tuple: The result and whether it was shared with a running call.
+
+        Raises:
+            Exception: The error of the call, whether it ran here or not.
+        """
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return future.result(), True
+                except _Abandoned:
+                    continue
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self._finish(key, future, error=e)
+                raise
+            except BaseException:
+                self._finish(key, future, error=_Abandoned())
+                raise
+            self._finish(key, future, result=result)
+            return result, False
+
+    async def do_async(self, key, function, *args, **kwargs):
+        """Awaits `function(*args, **kwargs)`, or waits for the running call.
+
+        Waiting does not block the event loop, and cancelling a waiter does
+        not cancel the running call.
+
+        Returns:
+            tuple: The result and whether it was shared with a running call.
+        """
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return await asyncio.shield(asyncio.wrap_future(future)), True
+                except _Abandoned:
+                    continue
+            try:
+                result = await function(*args, **kwargs)
+            except Exception as e:
+                self._finish(key, future, error=e)
+                raise
+            except BaseException:
+                self._finish(key, future, error=_Abandoned())
+                raise
+            self._finish(key, future, result=result)
+            return result, False
+
+    def stats(self):
+        """Returns the number of executed and coalesced calls.
+
+        `coalesced` counts the calls that shared the result of a running
+        call, i.e. the work saved.
+        """
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            self._stats["executed"] += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            if error is not None and not isinstance(error, _Abandoned):
+                self._stats["errors"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
@@ -0,0 +1,342 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Versioned schema snapshots and the stores that persist them.
+
+A snapshot is a JSON-serializable dict:
+
+    {
+        "project_id": "my-project",
+        "dataset_id": "my_dataset",
+        "version": "<sha256 of the dataset and table structures, first 16 hex chars>",
+        "created_at": 1717171717.0,
+        "render_mode": "compact",
+        "tables": {
+            "<table_id>": {
+                "modified": <last modified ms>,
+                "ddl": "<rendering>",
+                "ddl_min": "<rendering without example values>",
+                "columns": <column dicts (see schema.fetch_dataset_schema)>,
+                "layout": <partitioning and clustering, or None>,
+                "profile": <column value profile, or None (see profiles.py)>,
+            },
+        },
+    }
+
+The version covers the dataset and the structure of its tables (their
+columns and layout), not the example values of the renderings nor the
+profiles, so that the caches keyed by it survive data loads.
+
+Refreshing a snapshot re-reads the columns of the tables whose last modified
+time changed since the previous snapshot (one metadata query), and only
+re-introspects the tables whose structure changed, unless the render mode
+changed (or the previous snapshot predates the table columns). A table whose
+data only changed keeps its rendering and profile. Column value profiles,
+when enabled, are computed once per table structure: for the re-introspected
+tables and the tables without one.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from . import profiles
+from . import schema
+from . import schema_render
+
+
+class SnapshotStore:
+    """Interface of a schema snapshot backend, keyed by project and dataset."""
+
+    def load(self, project_id, dataset_id):
+        """Returns the stored snapshot, or None if there is none."""
+        raise NotImplementedError
+
+    def save(self, snapshot):
+        """Persists a snapshot, replacing the previous one."""
+        raise NotImplementedError
+
+
+class MemorySnapshotStore(SnapshotStore):
+    """Keeps the snapshots of the most recently saved datasets in memory only.
+
+    Args:
+        max_snapshots (int): Maximum number of datasets kept.
+    """
+
+    def __init__(self, max_snapshots=100):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()
+
+    def load(self, project_id, dataset_id):
+        return self._snapshots.get((project_id, dataset_id))
+
+    def save(self, snapshot):
+        key = (snapshot["project_id"], snapshot["dataset_id"])
+        self._snapshots.pop(key, None)
+        self._snapshots[key] = snapshot
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+
+
+class LocalFileSnapshotStore(SnapshotStore):
+    """Stores one JSON file per project/dataset in a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, project_id, dataset_id):
+        return os.path.join(self.directory, f"{project_id}.{dataset_id}.json")
+
+    def load(self, project_id, dataset_id):
+        try:
+            with open(self.path(project_id, dataset_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable schema snapshot: %s", e)
+            return None
+
+    def save(self, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file and rename it, so readers never see a
+        # partially written snapshot.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(
+                tmp_path, self.path(snapshot["project_id"], snapshot["dataset_id"])
+            )
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+STORES = {
+    "memory": lambda config: MemorySnapshotStore(config.get("max_snapshots", 100)),
+    "local": lambda config: LocalFileSnapshotStore(
+        config.get("path", os.path.join(tempfile.gettempdir(), "data_assistant"))
+    ),
+}
+
+
+def create_store(config):
+    """Creates the snapshot store selected in the `snapshot` config section.
+
+    Args:
+        config (dict): The `snapshot` section of config.yaml.
+
+    Returns:
+        SnapshotStore: The configured store.
+    """
+    store = config.get("store", "local")
+    if store not in STORES:
+        raise ValueError(f"Unknown snapshot store: {store}")
+    return STORES[store](config)
+
+
+def table_structure(table):
+    """Returns the structural metadata of a snapshot table.
+
+    The column names, types, modes and descriptions and the partitioning and
+    clustering layout, without example values or profiles.
+    """
+    return {"columns": table["columns"], "layout": table["layout"]}
+
+
+def schema_version(project_id, dataset_id, tables):
+    """Computes the version hash of the structure of the tables of a snapshot.
+
+    The dataset is part of the hash, so that identically structured datasets
+    (e.g. one per tenant) have different versions.
+    """
+    digest = hashlib.sha256(f"{project_id}.{dataset_id}".encode("utf-8"))
+    for table_id in sorted(tables):
+        digest.update(table_id.encode("utf-8"))
+        digest.update(
+            json.dumps(table_structure(tables[table_id]), sort_keys=True).encode("utf-8")
+        )
+    return digest.hexdigest()[:16]
+
+
+def snapshot_layouts(snapshot):
+    """Returns the layout of the partitioned tables of a snapshot.
+
+    Returns:
+        dict: Full table name (`project.dataset.table`) -> layout (see
+          `schema.table_layout`), for the tables with a partition column.
+    """
+    return {
+        f"{snapshot['project_id']}.{snapshot['dataset_id']}.{table_id}": table["layout"]
+        for table_id, table in snapshot["tables"].items()
+        if (table.get("layout") or {}).get("partition_column")
+    }
+
+
+def snapshot_profiles(snapshot):
+    """Returns full table name -> column value profile of a snapshot."""
+    return {
+        f"{snapshot['project_id']}.{snapshot['dataset_id']}.{table_id}": table["profile"]
+        for table_id, table in snapshot["tables"].items()
+        if table.get("profile")
+    }
+
+
+def snapshot_ddl(snapshot, token_budget=0):
+    """Concatenates the renderings of all tables of a snapshot.
+
+    Args:
+        snapshot (dict): A schema snapshot.
+        token_budget (int): Maximum estimated tokens of the schema (see
+          `schema_render.fit_token_budget`). 0 for no budget.
+    """
+    tables = {
+        table_id: dict(table, ddl_min=table.get("ddl_min", table["ddl"]))
+        for table_id, table in snapshot["tables"].items()
+    }
+    return "".join(schema_render.fit_token_budget(tables, token_budget).values())
+
+
+def refresh_snapshot(
+    client,
+    project_id,
+    dataset_id,
+    previous=None,
+    max_workers=schema.DEFAULT_MAX_WORKERS,
+    render_config=None,
+    profile_config=None,
+    maximum_bytes_billed=None,
+):
+    """Builds a new snapshot, reusing the unchanged tables of a previous one.
+
+    Args:
+        client (bigquery.Client): A BigQuery client.
+        project_id (str): The ID of your Google Cloud Project.
+        dataset_id (str): The ID of the BigQuery dataset.
+        previous (dict): The previous snapshot, or None for a full build.
+        max_workers (int): Maximum number of concurrent sample row fetches.
+        render_config (dict): The `schema` section of config.yaml, selecting
+          the renderer of the tables.
+        profile_config (dict): The `profiles` section of config.yaml. No
+          profiles are computed unless it is enabled.
+        maximum_bytes_billed (int): Limit of the bytes billed per profile
+          query.
+
+    Returns:
+        dict: The new snapshot. When no table structure changed it has the
+          same version as `previous`.
+    """
+    render_config = render_config or {}
+    render_mode = render_config.get("render_mode", "ddl")
+    if previous and (
+        previous.get("render_mode", "ddl") != render_mode
+        or any("columns" not in table for table in previous["tables"].values())
+    ):
+        previous = None
+
+    modified = schema.fetch_table_modified_times(client, project_id, dataset_id)
+    previous_tables = previous["tables"] if previous else {}
+
+    touched = [
+        table_id
+        for table_id, modified_time in modified.items()
+        if previous_tables.get(table_id, {}).get("modified") != modified_time
+    ]
+    columns, layouts = {}, {}
+    if touched:
+        columns, layouts = schema.fetch_dataset_schema(
+            client, project_id, dataset_id, table_ids=touched
+        )
+    # A data load changes the last modified time but not the structure
+    changed = [
+        table_id
+        for table_id in columns
+        if table_id not in previous_tables
+        or table_structure(previous_tables[table_id])
+        != table_structure({"columns": columns[table_id], "layout": layouts[table_id]})
+    ]
+    profile_config = profile_config or {}
+    unprofiled = [
+        table_id for table_id in modified
+        if profile_config.get("enabled", False)
+        and (table_id in changed or "profile" not in previous_tables.get(table_id, {}))
+    ]
+    if (
+        previous and not touched and not unprofiled
+        and set(previous_tables) == set(modified)
+    ):
+        return dict(previous, created_at=time.time())
+
+    ddl = {}
+    if changed:
+        ddl = schema.introspect_dataset(
+            client,
+            project_id,
+            dataset_id,
+            max_workers=max_workers,
+            table_ids=changed,
+            renderer=schema_render.create_renderer(render_config),
+            dataset_schema=(
+                {table_id: columns[table_id] for table_id in changed},
+                {table_id: layouts[table_id] for table_id in changed},
+            ),
+        )
+    logging.info(
+        "Schema refresh of %s.%s: %d of %d tables re-introspected, %d with "
+        "new data only",
+        project_id, dataset_id, len(changed), len(modified),
+        len(columns) - len(changed),
+    )
+
+    tables = {}
+    for table_id, modified_time in modified.items():
+        if table_id in ddl:
+            tables[table_id] = dict(ddl[table_id], modified=modified_time)
+        elif table_id in columns:
+            tables[table_id] = dict(previous_tables[table_id], modified=modified_time)
+        elif table_id not in touched:
+            tables[table_id] = previous_tables[table_id]
+
+    unprofiled = [table_id for table_id in unprofiled if table_id in tables]
+    if unprofiled:
+        table_profiles = profiles.profile_tables(
+            client,
+            project_id,
+            dataset_id,
+            unprofiled,
+            profile_config,
+            max_workers=max_workers,
+            maximum_bytes_billed=maximum_bytes_billed,
+            dataset_schema=(
+                {table_id: tables[table_id]["columns"] for table_id in unprofiled},
+                {table_id: tables[table_id]["layout"] for table_id in unprofiled},
+            ),
+        )
+        for table_id, profile in table_profiles.items():
+            tables[table_id] = dict(tables[table_id], profile=profile)
+
+    return {
+        "project_id": project_id,
+        "dataset_id": dataset_id,
+        "version": schema_version(project_id, dataset_id, tables),
+        "created_at": time.time(),
+        "render_mode": render_mode,
+        "tables": tables,
+    }
@@ -0,0 +1,249 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local validation of generated SQL against the cached schema.
+
+The SQL is parsed into a GoogleSQL AST (sqlglot, BigQuery dialect) and
+checked before any BigQuery round trip: a single read-only query, tables that
+exist in the schema and columns that exist in their tables. Column checks are
+only made where the AST resolves them without doubt (tables of the schema,
+no derived tables or UNNEST in the same scope), so that valid queries are
+never rejected locally; BigQuery's dry run remains the final check.
+"""
+
+import difflib
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import traverse_scope
+
+from . import cache
+from . import retrieval
+
+
+DIALECT = "bigquery"
+
+# Columns of the most recently used schemas, keyed by dataset and version.
+_columns_cache = cache.LRUCache(max_entries=retrieval.MAX_CACHED_SCHEMAS)
+
+
+def schema_columns(database_settings):
+    """Returns full table name -> lowercased column names of a schema."""
+    key = cache.schema_key(database_settings)
+    columns = _columns_cache.get(key)
+    if columns is None:
+        columns = {
+            table_name: {
+                column.lower()
+                for column in retrieval.COLUMN_PATTERN.findall(ddl.split("\n);", 1)[0])
+            }
+            for table_name, ddl in retrieval.split_tables(
+                database_settings["bq_ddl_schema"]
+            ).items()
+        }
+        _columns_cache.put(key, columns)
+    return columns
+
+
+def _error(code, message, **details):
+    return dict(code=code, message=message, **details)
+
+
+def _suggest(name, candidates):
+    matches = difflib.get_close_matches(name.lower(), sorted(candidates), n=3, cutoff=0.6)
+    return f" Did you mean: {', '.join(f'`{m}`' for m in matches)}?" if matches else ""
+
+
+def _resolve_table(table, columns, project_id, dataset_id):
+    """Returns the full name of a schema table, None if unknown, or an error.
+
+    Wildcard tables (`events_*`) and tables of other datasets are left to
+    the dry run.
+    """
+    if not table.db:
+        return _error(
+            "unqualified_table",
+            f"Table `{table.name}` must be fully qualified as "
+            f"`{project_id}.{dataset_id}.{table.name}`.",
+            table=table.name,
+        )
+    if table.name.endswith("*"):
+        return None
+    full_name = f"{table.catalog or project_id}.{table.db}.{table.name}"
+    if full_name in columns:
+        return full_name
+    if table.db == dataset_id and (table.catalog or project_id) == project_id:
+        known = [name.rsplit(".", 1)[-1] for name in columns]
+        return _error(
+            "unknown_table",
+            f"Table `{full_name}` does not exist.{_suggest(table.name, known)}",
+            table=full_name,
+        )
+    # Tables of other datasets are left to BigQuery.
+    return None
+
+
+def _check_columns(ast, columns, project_id, dataset_id):
+    # Aliases and qualifiers are compared lowercased, as BigQuery does
+    errors = []
+    all_aliases = {t.alias_or_name.lower() for t in ast.find_all(exp.Table)}
+    all_aliases |= {
+        node.alias.lower()
+        for node in ast.find_all(exp.Subquery, exp.Unnest, exp.CTE)
+        if node.alias
+    }
+    # Columns of every schema table of the query, for correlated subqueries
+    query_columns = set().union(*(
+        columns.get(f"{t.catalog or project_id}.{t.db}.{t.name}", set())
+        for t in ast.find_all(exp.Table)
+    ))
+
+    for scope in traverse_scope(ast):
+        table_sources = {}
+        derived_sources = False
+        for alias, source in scope.sources.items():
+            if not isinstance(source, exp.Table):
+                derived_sources = True
+                continue
+            resolved = _resolve_table(source, columns, project_id, dataset_id)
+            if isinstance(resolved, dict):
+                if resolved not in errors:
+                    errors.append(resolved)
+            elif resolved is not None:
+                table_sources[alias.lower()] = resolved
+        if len(table_sources) != len([
+            s for s in scope.sources.values() if isinstance(s, exp.Table)
+        ]):
+            # A table of another dataset (or an unknown one) is in scope
+            derived_sources = True
+
+        select_aliases = {
+            s.alias.lower() for s in getattr(scope.expression, "selects", []) if s.alias
+        }
+        scope_columns = set().union(*(columns[t] for t in table_sources.values()))
+        source_names = {alias.lower() for alias in scope.sources}
+
+        for column in scope.columns:
+            name = column.name.lower()
+            qualifier = column.table
+            if column.args.get("db"):
+                # Struct field path `alias.column.field`
+                qualifier, name = column.db, column.table.lower()
+
+            if qualifier:
+                if qualifier.lower() in table_sources:
+                    table_name = table_sources[qualifier.lower()]
+                    if name not in columns[table_name] and not name.startswith("_"):
+                        errors.append(_error(
+                            "unknown_column",
+                            f"Column `{name}` does not exist in table `{table_name}`."
+                            f"{_suggest(name, columns[table_name])}",
+                            table=table_name,
+                            column=name,
+                        ))
+                elif (
+                    qualifier.lower() not in all_aliases
+                    and qualifier.lower() not in scope_columns
+                    and not derived_sources
+                ):
+                    errors.append(_error(
+                        "unknown_qualifier",
+                        f"`{qualifier}` is not a table alias or column in "
+                        f"`{qualifier}.{column.name}`.",
+                        qualifier=qualifier,
+                    ))
+                continue
+
+            if (
+                derived_sources
+                or not table_sources
+                or name in scope_columns
+                or (not scope.is_root and name in query_columns)
+                or name in select_aliases
+                or name in source_names
+                or name.startswith("_")
+            ):
+                continue
+            errors.append(_error(
+                "unknown_column",
+                f"Column `{name}` does not exist in "
+                f"{', '.join(f'`{t}`' for t in sorted(set(table_sources.values())))}."
+                f"{_suggest(name, scope_columns)}",
+                column=name,
+            ))
+
+    unique_errors = []
+    for error in errors:
+        if error not in unique_errors:
+            unique_errors.append(error)
+    return unique_errors
+
+
+def add_limit(sql_string, max_rows, has_limit):
+    """Appends a LIMIT to the outermost query when it has none."""
+    if has_limit:
+        return sql_string
+    sql_string = sql_string.rstrip().rstrip(";").rstrip()
+    # New line, so a trailing `--` comment does not swallow the clause
+    return f"{sql_string}\nLIMIT {max_rows}"
+
+
+def validate_sql(sql_string, database_settings, max_rows):
+    """Validates a SQL query locally and adds a LIMIT to it if needed.
+
+    Args:
+        sql_string (str): The SQL query.
+        database_settings (dict): The database settings of the session.
+        max_rows (int): LIMIT added when the outermost query has none.
+
+    Returns:
+        tuple: The SQL to run (with the LIMIT) and a list of error dicts with
+          `code` and `message` keys (plus `table`/`column` details). The query
+          must not be run when the list is not empty.
+    """
+    try:
+        statements = [s for s in sqlglot.parse(sql_string, read=DIALECT) if s]
+    except SqlglotError as e:
+        # A query that cannot be parsed cannot be shown to be a single
+        # SELECT (e.g. a script hiding a DML statement), so it is not run
+        reason = str(e).split("\n", 1)[0]
+        return sql_string, [_error(
+            "parse_error",
+            f"The query could not be parsed as a single SELECT: {reason}",
+        )]
+
+    if len(statements) != 1:
+        return sql_string, [_error(
+            "multiple_statements", "Only a single SELECT query is allowed."
+        )]
+    ast = statements[0]
+    if not isinstance(ast, exp.Query):
+        return sql_string, [_error(
+            "not_select",
+            f"Only SELECT queries are allowed, got a {ast.key.upper()} statement.",
+        )]
+
+    errors = _check_columns(
+        ast,
+        schema_columns(database_settings),
+        database_settings["bq_project_id"],
+        database_settings["bq_dataset_id"],
+    )
+    return add_limit(sql_string, max_rows, ast.args.get("limit") is not None), errors
+
+
+def format_errors(errors):
+    """Formats validation errors as one message for the agent."""
+    return "Invalid SQL: " + " ".join(error["message"] for error in errors)
@@ -0,0 +1,62 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cold start report of the agent process.
+
+Records how long the package import, the client initializations and the
+first schema load took, so slow replica start-ups can be diagnosed from the
+logs (the report is logged once the first schema is available).
+"""
+
+import logging
+import time
+
+# Reference time of the report: the start of the package import.
+started_at = time.perf_counter()
+
+_report = {}
+
+
+def record(name, seconds):
+    """Records a duration in seconds, keeping the first value of a name."""
+    _report.setdefault(name, round(seconds, 4))
+
+
+def record_value(name, value):
+    """Records a non-duration value, e.g. where the first schema came from."""
+    _report.setdefault(name, value)
+
+
+def since_start():
+    """Seconds elapsed since the package import started."""
+    return time.perf_counter() - started_at
+
+
+def get_report():
+    """Returns the recorded timings, e.g.
+
+        {
+            "import_seconds": 0.85,
+            "llm_client_init_seconds": 0.12,
+            "bq_client_init_seconds": 0.05,
+            "first_schema_seconds": 0.01,
+            "time_to_first_schema_seconds": 3.2,
+            "schema_source": "bundle",
+        }
+    """
+    return dict(_report)
+
+
+def log_report():
+    logging.info("Startup report: %s", get_report())
@@ -0,0 +1,248 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-stage spans, turn summaries and metrics hooks.
+
+Every stage of a request (schema load, prompt build, LLM call, dry run,
+execution, row conversion, repair attempt) runs in a `span`, which:
+
+- opens an OpenTelemetry span with the stage attributes. The OpenTelemetry
+  API is a no-op until the application configures a tracer provider (e.g.
+  Agent Engine tracing);
+- adds the stage to a compact summary of the turn in the session state
+  (`state["telemetry"]`), reset at the start of each turn;
+- calls the registered metrics hooks, e.g. a `PrometheusMetrics` instance.
+"""
+
+import bisect
+import contextlib
+import logging
+import threading
+import time
+
+from opentelemetry import trace
+
+
+tracer = trace.get_tracer("data_assistant")
+
+STATE_KEY = "telemetry"
+
+# Stages kept in the turn summary (the totals still count the others).
+MAX_TURN_STAGES = 40
+
+# Numeric attributes summed in the turn totals and exported as counters.
+COUNTER_ATTRIBUTES = (
+    "input_tokens",
+    "output_tokens",
+    "cached_tokens",
+    "bytes_processed",
+    "bytes_saved",
+    "slot_ms",
+)
+
+_metrics_hooks = []
+
+
+def add_metrics_hook(hook):
+    """Registers a metrics hook.
+
+    Args:
+        hook (callable): Called with the stage name, its duration in seconds
+          and its attributes (dict) at the end of every span.
+    """
+    _metrics_hooks.append(hook)
+
+
+def remove_metrics_hook(hook):
+    if hook in _metrics_hooks:
+        _metrics_hooks.remove(hook)
+
+
+class Stage:
+    """Attributes of a running span, set by the code of the stage."""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = {}
+        self.set(**attributes)
+
+    def set(self, **attributes):
+        """Sets attributes of the stage, ignoring None values."""
+        self.attributes.update(
+            {key: value for key, value in attributes.items() if value is not None}
+        )
+
+
+def _span_value(value):
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+@contextlib.contextmanager
+def span(name, state=None, **attributes):
+    """Runs a stage of a request in a span.
+
+    Args:
+        name (str): The stage name, e.g. "llm_call".
+        state (State): The session state the turn summary is recorded in, or
+          None for stages outside a turn (e.g. background refreshes).
+        **attributes: Initial attributes of the stage.
+
+    Yields:
+        Stage: The stage, whose attributes can be set while it runs.
+    """
+    stage = Stage(name, attributes)
+    started = time.perf_counter()
+    with tracer.start_as_current_span(f"data_assistant.{name}") as otel_span:
+        try:
+            yield stage
+        except BaseException as e:
+            stage.set(error=type(e).__name__)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            for key, value in stage.attributes.items():
+                otel_span.set_attribute(key, _span_value(value))
+            if state is not None:
+                _record_turn_stage(state, name, seconds, stage.attributes)
+            for hook in list(_metrics_hooks):
+                try:
+                    hook(name, seconds, dict(stage.attributes))
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.warning("Metrics hook failed: %s", e)
+
+
+def reset_turn(state):
+    """Starts a new turn summary."""
+    if state.get(STATE_KEY):
+        state[STATE_KEY] = None
+
+
+def _record_turn_stage(state, name, seconds, attributes):
+    """Adds a stage to the turn summary of the session state.
+
+    The summary is reassigned rather than mutated, so the change is part of
+    the state delta of the turn.
+    """
+    summary = state.get(STATE_KEY) or {"stages": [], "totals": {}}
+    stages = list(summary["stages"])
+    totals = dict(summary["totals"])
+
+    if len(stages) < MAX_TURN_STAGES:
+        stages.append(dict(
+            {
+                key: value for key, value in attributes.items()
+                if not isinstance(value, str) or len(value) <= 100
+            },
+            stage=name,
+            ms=round(seconds * 1000, 1),
+        ))
+    totals[f"{name}_ms"] = round(totals.get(f"{name}_ms", 0) + seconds * 1000, 1)
+    for key in COUNTER_ATTRIBUTES:
+        if isinstance(attributes.get(key), (int, float)):
+            totals[key] = totals.get(key, 0) + attributes[key]
+
+    state[STATE_KEY] = {"stages": stages, "totals": totals}
+
+
+def llm_usage(response):
+    """Returns the token attributes of a Gemini response."""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "input_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+    }
+
+
+def job_attributes(query_job):
+    """Returns the attributes of a finished BigQuery query job."""
+    return {
+        "job_id": getattr(query_job, "job_id", None),
+        "bytes_processed": getattr(query_job, "total_bytes_processed", None),
+        "slot_ms": getattr(query_job, "slot_millis", None),
+        "cache_hit": getattr(query_job, "cache_hit", None),
+    }
+
+
+class PrometheusMetrics:
+    """Metrics hook aggregating the spans as Prometheus-style metrics.
+
+    Register it with `add_metrics_hook` and serve `render()` from a metrics
+    endpoint, or read the values to feed another metrics client.
+
+    Args:
+        prefix (str): Prefix of the metric names.
+        buckets (tuple): Upper bounds (seconds) of the duration histogram.
+    """
+
+    def __init__(
+        self,
+        prefix="data_assistant",
+        buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    ):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._durations = {}  # stage -> [bucket counts, count, sum]
+        self._counters = {}  # (attribute, stage) -> total
+        self._lock = threading.Lock()
+
+    def __call__(self, name, seconds, attributes):
+        with self._lock:
+            histogram = self._durations.setdefault(
+                name, [[0] * len(self.buckets), 0, 0.0]
+            )
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+            for key in COUNTER_ATTRIBUTES:
+                if isinstance(attributes.get(key), (int, float)):
+                    self._counters[(key, name)] = (
+                        self._counters.get((key, name), 0) + attributes[key]
+                    )
+            if "error" in attributes:
+                self._counters[("errors", name)] = (
+                    self._counters.get(("errors", name), 0) + 1
+                )
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        metric = f"{self.prefix}_stage_duration_seconds"
+        lines = [f"# TYPE {metric} histogram"]
+        with self._lock:
+            for stage, (counts, count, total) in sorted(self._durations.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+
+            for key in COUNTER_ATTRIBUTES + ("errors",):
+                counters = sorted(
+                    (stage, value) for (name, stage), value in self._counters.items()
+                    if name == key
+                )
+                if not counters:
+                    continue
+                lines.append(f"# TYPE {self.prefix}_{key}_total counter")
+                for stage, value in counters:
+                    lines.append(f'{self.prefix}_{key}_total{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
@@ -14,65 +14,479 @@
 
 """This file contains the tools used by the database agent."""
 
-import datetime
+import json
 import logging
-import re
-
-from .utils import get_env_var
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+
+from . import cache
+from . import context_cache
+from . import metadata
+from . import profiles
+from . import query_guard
+from . import registry
+from . import results
+from . import retrieval
+from . import routing
+from . import schema
+from . import schema_render
+from . import singleflight
+from . import snapshot
+from . import sql_validator
+from . import startup
+from . import telemetry
+from .utils import PACKAGE_DIR, get_config, get_env_var
 from google.adk.tools import ToolContext
 from google.cloud import bigquery
 from google.genai import Client
+from requests import adapters
 
 
-project_id = get_env_var("BQ_PROJECT_ID")
-dataset_id = get_env_var("BQ_DATASET_ID")
+MAX_NUM_ROWS = 80
 
-llm_client = Client(vertexai=True, project=project_id)
+# Upper bound of `speculation.candidates`
+MAX_SQL_CANDIDATES = 8
 
-MAX_NUM_ROWS = 80
+# Clients and settings are created on first use, so importing the agent
+# neither reads the environment nor opens connections.
+project_id = None
+dataset_id = None
+llm_client = None
 
-database_settings = None
+schema_registry = None
+snapshot_store = None
 bq_client = None
+sql_cache = None
+result_cache = None
+result_store = None
+context_cache_manager = None
+_registry_lock = threading.Lock()
+
+# Identical work of concurrent sessions (the SQL generation of the same
+# question, the execution of the same query) runs once
+nl2sql_flight = singleflight.SingleFlight("nl2sql")
+query_flight = singleflight.SingleFlight("query")
+
+speculation_counts = Counter()
+_speculation_lock = threading.Lock()
+
+# Latency and validation outcome of the tool models the SQL generation is
+# routed to
+model_stats = routing.ModelStats()
+
+
+def get_project_id():
+    """Get the default BigQuery project ID (BQ_PROJECT_ID).
+
+    It is also the project the query jobs of every dataset run and are billed
+    in.
+    """
+    global project_id
+    if project_id is None:
+        project_id = get_env_var("BQ_PROJECT_ID")
+    return project_id
+
+
+def get_dataset_id():
+    """Get the default BigQuery dataset ID (BQ_DATASET_ID)."""
+    global dataset_id
+    if dataset_id is None:
+        dataset_id = get_env_var("BQ_DATASET_ID")
+    return dataset_id
+
+
+def get_llm_client():
+    """Get the Gemini client of the tool model."""
+    global llm_client
+    if llm_client is None:
+        started = time.perf_counter()
+        llm_client = Client(vertexai=True, project=get_project_id())
+        startup.record("llm_client_init_seconds", time.perf_counter() - started)
+    return llm_client
+
 
 def get_bq_client():
-    """Get BigQuery client."""
+    """Get the BigQuery client shared by all sessions and datasets.
+
+    Its HTTP connection pool holds `registry.bq_pool_size` connections, so
+    the concurrent schema sampling and query threads reuse connections
+    instead of opening new ones.
+    """
     global bq_client
     if bq_client is None:
-        bq_client = bigquery.Client(project=project_id)
+        started = time.perf_counter()
+        bq_client = bigquery.Client(project=get_project_id())
+        pool_size = get_config().get("registry", {}).get("bq_pool_size", 0)
+        if pool_size:
+            adapter = adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+            bq_client._http.mount("https://", adapter)  # pylint: disable=protected-access
+        startup.record("bq_client_init_seconds", time.perf_counter() - started)
     return bq_client
 
 
-def get_database_settings():
-    """Get database settings."""
-    global database_settings
-    if database_settings is None:
-        database_settings = update_database_settings()
-    return database_settings
+def get_sql_cache():
+    """Get the cache of validated SQL by question, configured in config.yaml."""
+    global sql_cache
+    if sql_cache is None:
+        sql_cache = cache.LRUCache(**get_config().get("cache", {}).get("sql", {}))
+    return sql_cache
+
+
+def get_result_cache():
+    """Get the cache of query results by canonical SQL, shared by all sessions."""
+    global result_cache
+    if result_cache is None:
+        config = dict(get_config().get("cache", {}).get("results", {}))
+        config.pop("enabled", None)
+        result_cache = cache.LRUCache(**config)
+    return result_cache
+
+
+def set_result_cache(store):
+    """Replace the query result cache.
+
+    Args:
+        store (cache.CacheStore): The new cache, e.g. a client of an external
+          store shared by several replicas.
+    """
+    global result_cache
+    result_cache = store
+
+
+def get_result_store():
+    """Get the store of the query results referenced by handles."""
+    global result_store
+    if result_store is None:
+        result_store = results.create_store(get_config().get("results", {}))
+    return result_store
+
+
+def get_query_result(handle, as_arrow=False):
+    """Get a full query result by its handle.
+
+    Sessions keep only the handle (`state["query_result_handle"]`), and the
+    model only sees the first rows of large results; the fetched rows (at
+    most MAX_NUM_ROWS, see `results.fetch_arrow`) stay in the result store.
+
+    Args:
+        handle (str): The result handle.
+        as_arrow (bool): Whether to return the Arrow table instead of rows.
+
+    Returns:
+        list: The result rows (or pyarrow.Table), or None when the handle
+          expired or is unknown.
+    """
+    if not handle:
+        return None
+    table = get_result_store().load(handle)
+    if table is None or as_arrow:
+        return table
+    return results.arrow_to_rows(table)
+
+
+def store_query_result(table, tool_context):
+    """Stores a result table and keeps its handle in the session state."""
+    handle = uuid.uuid4().hex
+    get_result_store().save(handle, table)
+    tool_context.state["query_result_handle"] = handle
+    return handle
+
+
+def add_query_result(final_result, table, tool_context):
+    """Adds a query result to a validation result.
+
+    Results of up to `results.inline_max_rows` rows are returned inline.
+    Larger ones are returned as their first `results.preview_rows` rows and
+    a summary; every result is stored under the returned `result_handle`.
+    """
+    config = get_config().get("results", {})
+    with telemetry.span("convert_rows", tool_context.state) as stage:
+        final_result["result_handle"] = store_query_result(table, tool_context)
+        if table.num_rows <= config.get("inline_max_rows", 20):
+            final_result["query_result"] = results.arrow_to_rows(table)
+        else:
+            final_result["query_result"] = results.arrow_to_rows(
+                table.slice(0, config.get("preview_rows", 5))
+            )
+            final_result["result_summary"] = results.summarize(
+                table, top_k=config.get("top_k", 3)
+            )
+        stage.set(
+            rows=table.num_rows,
+            columns=table.num_columns,
+            inline_rows=len(final_result["query_result"]),
+        )
+
+
+def get_cache_stats():
+    """Get the hit/miss counters of the caches."""
+    return {
+        "sql": get_sql_cache().stats(),
+        "results": get_result_cache().stats(),
+        "result_store": get_result_store().stats(),
+    }
 
 
-def update_database_settings():
-    """Update database settings."""
-    global database_settings
-    ddl_schema = get_bigquery_schema(
+def get_coalescing_stats():
+    """Get the counters of the work shared by concurrent sessions.
+
+    For each kind of work, `executed` counts the calls that ran and
+    `coalesced` the calls that shared the result of a running call.
+    """
+    stats = get_schema_registry().flight_stats()
+    for flight in (nl2sql_flight, query_flight):
+        stats[flight.name] = flight.stats()
+    return stats
+
+
+def coalesce(flight, key, tool_context, function, *args):
+    """Runs `function(*args)`, or shares the result of the same running call.
+
+    Args:
+        flight (SingleFlight): The group of the calls.
+        key: The key of identical calls.
+        tool_context (ToolContext): The tool context of the caller.
+        function (callable): The work.
+        *args: The arguments of the work.
+
+    Returns:
+        tuple: The result and whether it was shared.
+    """
+    with telemetry.span("coalesce", tool_context.state, group=flight.name) as stage:
+        result, shared = flight.do(key, function, *args)
+        stage.set(shared=shared)
+    return result, shared
+
+
+def get_context_cache():
+    """Get the context cache manager of the tool prompts, configured in config.yaml."""
+    global context_cache_manager
+    if context_cache_manager is None:
+        context_cache_manager = context_cache.ContextCacheManager(
+            get_llm_client(), **get_config().get("context_cache", {})
+        )
+    return context_cache_manager
+
+
+def get_snapshot_store():
+    """Get the schema snapshot store configured in config.yaml."""
+    global snapshot_store
+    if snapshot_store is None:
+        snapshot_store = snapshot.create_store(get_config().get("snapshot", {}))
+    return snapshot_store
+
+
+def get_schema_registry():
+    """Get the registry of the dataset settings, configured in config.yaml."""
+    global schema_registry
+    # Sessions starting together must share one registry (and its loads)
+    with _registry_lock:
+        if schema_registry is None:
+            config = dict(get_config().get("registry", {}))
+            config.pop("bq_pool_size", None)
+            new_registry = registry.SchemaRegistry(
+                _load_initial_snapshot,
+                _refresh_snapshot,
+                _build_settings,
+                ttl_seconds=_snapshot_ttl(),
+                **config,
+            )
+            new_registry.allow(get_project_id(), get_dataset_id())
+            new_registry.start_refresh()
+            schema_registry = new_registry
+    return schema_registry
+
+
+def schema_reference(settings):
+    """Returns the reference of database settings kept in session state.
+
+    Sessions keep only the dataset and schema version (`state["schema_ref"]`);
+    the DDL stays in the schema registry of this process.
+    """
+    return {
+        key: settings[key]
+        for key in ("bq_project_id", "bq_dataset_id", "bq_schema_version")
+    }
+
+
+def session_settings(tool_context):
+    """Get the database settings of the dataset of a session."""
+    reference = tool_context.state["schema_ref"]
+    return get_database_settings(
+        reference["bq_project_id"], reference["bq_dataset_id"]
+    )
+
+
+def get_database_settings(project_id=None, dataset_id=None):
+    """Get the database settings of a dataset.
+
+    A dataset is loaded on its first use from the newest of the stored
+    snapshot and the snapshot bundled with the package (see
+    `build_snapshot_bundle`), so a new process does not need to introspect
+    it. If it is older than `snapshot.ttl_seconds` it is still served, while
+    the background refresh updates it right away. The dataset is introspected
+    synchronously only when there is no snapshot at all.
+
+    Args:
+        project_id (str): The project of the dataset. Defaults to BQ_PROJECT_ID.
+        dataset_id (str): The dataset. Defaults to BQ_DATASET_ID.
+
+    Returns:
+        dict: The database settings.
+
+    Raises:
+        ValueError: If the dataset is not in `registry.allowed_datasets`.
+    """
+    started = time.perf_counter()
+    settings, source = get_schema_registry().get_settings(
+        project_id or get_project_id(), dataset_id or get_dataset_id()
+    )
+    if source != "registry" and "first_schema_seconds" not in startup.get_report():
+        startup.record("first_schema_seconds", time.perf_counter() - started)
+        startup.record("time_to_first_schema_seconds", startup.since_start())
+        startup.record_value("schema_source", source)
+        startup.log_report()
+    return settings
+
+
+def _load_initial_snapshot(project_id, dataset_id):
+    """Returns (source, snapshot) of the newest available snapshot."""
+    candidates = [
+        ("store", get_snapshot_store().load(project_id, dataset_id)),
+        ("bundle", get_bundle_store().load(project_id, dataset_id)),
+    ]
+    candidates = [(source, s) for source, s in candidates if s]
+    if not candidates:
+        return None, None
+    return max(candidates, key=lambda candidate: candidate[1]["created_at"])
+
+
+def get_bundle_store():
+    """Get the store of the snapshots bundled with the package at deploy time."""
+    bundle_dir = get_config().get("snapshot", {}).get("bundle_dir", "snapshots")
+    return snapshot.LocalFileSnapshotStore(str(PACKAGE_DIR / bundle_dir))
+
+
+def build_snapshot_bundle(project_id=None, dataset_id=None):
+    """Introspects a dataset and saves its snapshot inside the package.
+
+    Run it before deploying (see deploy_agent.ipynb), once per dataset the
+    sessions use: the snapshots are shipped with the `data_assistant` extra
+    package, so a new replica serves its first request without introspecting
+    the dataset.
+
+    Args:
+        project_id (str): The project of the dataset. Defaults to BQ_PROJECT_ID.
+        dataset_id (str): The dataset. Defaults to BQ_DATASET_ID.
+
+    Returns:
+        str: The path of the bundled snapshot file.
+    """
+    project_id = project_id or get_project_id()
+    dataset_id = dataset_id or get_dataset_id()
+    store = get_bundle_store()
+    new_snapshot = snapshot.refresh_snapshot(
+        get_bq_client(),
+        project_id,
         dataset_id,
-        client=get_bq_client(),
-        project_id=project_id,
+        previous=store.load(project_id, dataset_id),
+        max_workers=_schema_max_workers(),
+        render_config=get_config().get("schema", {}),
+        profile_config=get_config().get("profiles", {}),
+        maximum_bytes_billed=get_config().get("cost", {}).get("maximum_bytes_billed"),
     )
-    database_settings = {
-        "bq_project_id": project_id,
-        "bq_dataset_id": dataset_id,
-        "bq_ddl_schema": ddl_schema
+    store.save(new_snapshot)
+    return store.path(project_id, dataset_id)
+
+
+def update_database_settings(project_id=None, dataset_id=None):
+    """Update the database settings of a dataset.
+
+    Only the tables whose structure changed since the current snapshot are
+    re-introspected (see `snapshot.refresh_snapshot`).
+    The new snapshot is saved to the snapshot store and replaces the current
+    settings of the dataset in the registry.
+
+    Args:
+        project_id (str): The project of the dataset. Defaults to BQ_PROJECT_ID.
+        dataset_id (str): The dataset. Defaults to BQ_DATASET_ID.
+    """
+    return get_schema_registry().refresh(
+        project_id or get_project_id(), dataset_id or get_dataset_id()
+    )
+
+
+def _refresh_snapshot(project_id, dataset_id, previous):
+    """Refreshes the snapshot of a dataset and saves it to the snapshot store."""
+    store = get_snapshot_store()
+    with telemetry.span(
+        "schema_refresh", dataset=f"{project_id}.{dataset_id}"
+    ) as stage:
+        new_snapshot = snapshot.refresh_snapshot(
+            get_bq_client(),
+            project_id,
+            dataset_id,
+            previous=previous or store.load(project_id, dataset_id),
+            max_workers=_schema_max_workers(),
+            render_config=get_config().get("schema", {}),
+            profile_config=get_config().get("profiles", {}),
+            maximum_bytes_billed=get_config().get("cost", {}).get("maximum_bytes_billed"),
+        )
+        store.save(new_snapshot)
+        stage.set(
+            tables=len(new_snapshot["tables"]),
+            schema_version=new_snapshot["version"],
+        )
+    return new_snapshot
+
+
+def _build_settings(schema_snapshot):
+    """Builds the database settings dict from a schema snapshot."""
+    return {
+        "bq_project_id": schema_snapshot["project_id"],
+        "bq_dataset_id": schema_snapshot["dataset_id"],
+        "bq_schema_version": schema_snapshot["version"],
+        "bq_table_layouts": snapshot.snapshot_layouts(schema_snapshot),
+        "bq_column_profiles": snapshot.snapshot_profiles(schema_snapshot),
+        "bq_ddl_schema": snapshot.snapshot_ddl(
+            schema_snapshot,
+            token_budget=get_config().get("schema", {}).get("token_budget", 0),
+        ),
     }
-    return database_settings
 
 
-def get_bigquery_schema(dataset_id, client=None, project_id=None):
+def _schema_max_workers():
+    return get_config().get("schema", {}).get("max_workers", schema.DEFAULT_MAX_WORKERS)
+
+
+def _snapshot_ttl():
+    return get_config().get("snapshot", {}).get("ttl_seconds", 0)
+
+
+def get_bigquery_schema(
+    dataset_id, client=None, project_id=None, max_workers=None, render_mode=None
+):
     """Retrieves schema and generates DDL with example values for a BigQuery dataset.
 
+    Column metadata for all tables is read with a single INFORMATION_SCHEMA
+    query and the example rows are fetched concurrently (see `schema.py`).
+    The timing breakdown is available in `schema.last_timings` and the token
+    count of every render mode in `schema.token_stats()`.
+
     Args:
         dataset_id (str): The ID of the BigQuery dataset (e.g., 'my_dataset').
         client (bigquery.Client): A BigQuery client.
         project_id (str): The ID of your Google Cloud Project.
+        max_workers (int): Maximum number of tables sampled concurrently.
+          Defaults to `schema.max_workers` in config.yaml.
+        render_mode (str): "ddl" or "compact" (see `schema_render.py`).
+          Defaults to `schema.render_mode` in config.yaml.
 
     Returns:
         str: A string containing the generated DDL statements.
@@ -81,53 +495,135 @@ def get_bigquery_schema(dataset_id, client=None, project_id=None):
     if client is None:
         client = bigquery.Client(project=project_id)
 
-    # dataset_ref = client.dataset(dataset_id)
-    dataset_ref = bigquery.DatasetReference(project_id, dataset_id)
+    if max_workers is None:
+        max_workers = _schema_max_workers()
+
+    render_config = get_config().get("schema", {})
+    ddl_statements = schema.introspect_dataset(
+        client,
+        project_id,
+        dataset_id,
+        max_workers=max_workers,
+        renderer=schema_render.create_renderer(render_config, mode=render_mode),
+    )
+
+    return "".join(
+        schema_render.fit_token_budget(
+            ddl_statements, render_config.get("token_budget", 0)
+        ).values()
+    )
 
-    ddl_statements = ""
 
-    for table in client.list_tables(dataset_ref):
-        table_ref = dataset_ref.table(table.table_id)
-        table_obj = client.get_table(table_ref)
+def relevant_schema(question, tool_context):
+    """Returns the part of the session schema relevant to a question.
 
-        # Check if table is a view
-        if table_obj.table_type != "TABLE":
-            continue
+    See `retrieval.relevant_schema`. The full schema is returned when pruning
+    is disabled in config.yaml or not confident.
+    """
+    return retrieval.relevant_schema(
+        question,
+        session_settings(tool_context),
+        get_config().get("retrieval", {}),
+    )
 
-        ddl_statement = f"CREATE OR REPLACE TABLE `{table_ref}` (\n"
 
-        for field in table_obj.schema:
-            ddl_statement += f"  `{field.name}` {field.field_type}"
-            if field.mode == "REPEATED":
-                ddl_statement += " ARRAY"
-            if field.description:
-                ddl_statement += f" COMMENT '{field.description}'"
-            ddl_statement += ",\n"
+def prompt_request(kind, question, tool_context, inline=False, model=None):
+    """Builds the contents of a tool model call and its cached content.
 
-        ddl_statement = ddl_statement[:-2] + "\n);\n\n"
+    The prompt prefix (instructions and full schema) is served from the
+    context cache when a handle is available; only the question part is sent
+    then. Otherwise the prompt is sent inline, with the schema pruned to the
+    question (see `relevant_schema`).
 
-        # Add example values if available (limited to first row)
-        rows = client.list_rows(table_ref, max_results=5).to_dataframe()
-        if not rows.empty:
-            ddl_statement += f"-- Example values for table `{table_ref}`:\n"
-            for _, row in rows.iterrows():  # Iterate over DataFrame rows
-                ddl_statement += f"INSERT INTO `{table_ref}` VALUES\n"
-                example_row_str = "("
-                for value in row.values:  # Now row is a pandas Series and has values
-                    if isinstance(value, str):
-                        example_row_str += f"'{value}',"
-                    elif value is None:
-                        example_row_str += "NULL,"
-                    else:
-                        example_row_str += f"{value},"
-                example_row_str = (
-                    example_row_str[:-1] + ");\n\n"
-                )  # remove trailing comma
-                ddl_statement += example_row_str
+    Args:
+        kind (str): The prompt kind, a key of PROMPT_BUILDERS.
+        question (str): Natural language question.
+        tool_context (ToolContext): The tool context.
+        inline (bool): Whether to skip the context cache.
+        model (str): The tool model called (default: AGENT_TOOL_MODEL), whose
+          cached content is used.
 
-        ddl_statements += ddl_statement
+    Returns:
+        tuple: The contents and the cached content name (None when inline).
+    """
+    build_prefix, build_suffix = PROMPT_BUILDERS[kind]
+    with telemetry.span("prompt_build", tool_context.state, kind=kind) as stage:
+        suffix = build_suffix(question, tool_context)
+        settings = session_settings(tool_context)
+        cached_content = None
+        if not inline:
+            cached_content = get_context_cache().get(
+                kind,
+                settings["bq_schema_version"],
+                model or get_env_var("AGENT_TOOL_MODEL"),
+                build_prefix(settings["bq_ddl_schema"]),
+                scope=f"{settings['bq_project_id']}.{settings['bq_dataset_id']}",
+            )
+        if cached_content is not None:
+            contents = suffix
+        else:
+            contents = build_prefix(relevant_schema(question, tool_context)) + suffix
+        stage.set(
+            context_cached=cached_content is not None,
+            prompt_tokens=retrieval.estimate_tokens(contents),
+        )
+    return contents, cached_content
 
-    return ddl_statements
+
+def generation_config(temperature, cached_content):
+    config = {"temperature": temperature}
+    if cached_content is not None:
+        config["cached_content"] = cached_content
+    return config
+
+
+def record_llm_usage(response):
+    """Records the cached and uncached input tokens of a tool model call.
+
+    The usage of each call is also set on its `llm_call` telemetry span.
+    """
+    return get_context_cache().record_usage(response)
+
+
+def generate_tool_content(kind, question, tool_context, temperature, model=None):
+    """Calls the tool model with the prompt of a kind, cached when possible.
+
+    A call with a cached content that fails (e.g. the handle expired early)
+    is retried once with the inline prompt. `model` defaults to
+    AGENT_TOOL_MODEL; its latency is recorded in `model_stats`.
+    """
+    model = model or get_env_var("AGENT_TOOL_MODEL")
+    contents, cached_content = prompt_request(kind, question, tool_context, model=model)
+    started = time.monotonic()
+    try:
+        with telemetry.span("llm_call", tool_context.state, kind=kind, model=model) as stage:
+            try:
+                response = get_llm_client().models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=generation_config(temperature, cached_content),
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if cached_content is None:
+                    raise
+                logging.warning("Cached prompt failed, retrying inline: %s", e)
+                get_context_cache().invalidate(cached_content)
+                stage.set(retried_inline=True)
+                contents, _ = prompt_request(
+                    kind, question, tool_context, inline=True, model=model
+                )
+                response = get_llm_client().models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=generation_config(temperature, None),
+                )
+            stage.set(**telemetry.llm_usage(response))
+    except Exception:
+        model_stats.record_call(model, time.monotonic() - started, ok=False)
+        raise
+    model_stats.record_call(model, time.monotonic() - started)
+    record_llm_usage(response)
+    return response
 
 
 def get_metadata_description(
@@ -141,63 +637,106 @@ def get_metadata_description(
 
     Args:
         question (str): The natural language metadata question.
-        tool_context (ToolContext): The tool context containing the schema
-                                     (tool_context.state["database_settings"]["bq_ddl_schema"]).
+        tool_context (ToolContext): The tool context referencing the schema
+                                     (tool_context.state["schema_ref"]).
+                                     Questions answered confidently from the
+                                     schema do not call the model (see
+                                     `local_metadata_answer`); otherwise only the
+                                     tables relevant to the question are sent to
+                                     the model (see `relevant_schema`).
 
     Returns:
         str: A natural language answer to the metadata question.
     """
-    ddl_schema = tool_context.state["database_settings"]["bq_ddl_schema"]
+    answer = local_metadata_answer(question, tool_context)
+    if answer is not None:
+        return save_metadata_answer(question, answer, tool_context)
+
+    model_to_use = get_env_var("AGENT_TOOL_MODEL")
+    if not model_to_use:
+        # Fallback or error if no model is defined
+        return "Error: Model for metadata description not configured."
+
+    response = generate_tool_content(
+        "metadata", question, tool_context, temperature=0.0 # Low temperature for factual answers
+    )
+
+    return save_metadata_answer(question, response.text, tool_context)
+
+
+def local_metadata_answer(question, tool_context):
+    """Answers a metadata question from the schema, without a model call.
+
+    See `metadata.answer_question`.
+
+    Returns:
+        str: The answer, or None when the model should answer.
+    """
+    with telemetry.span("metadata_local", tool_context.state) as stage:
+        answer, confidence, intent = metadata.answer_question(
+            question, session_settings(tool_context), get_config().get("metadata", {})
+        )
+        stage.set(
+            intent=intent, confidence=round(confidence, 3), answered=answer is not None
+        )
+    return answer
+
+
+def build_metadata_prompt(question, tool_context):
+    """Builds the inline prompt of `get_metadata_description`."""
+    return (
+        metadata_prompt_prefix(relevant_schema(question, tool_context))
+        + metadata_prompt_suffix(question, tool_context)
+    )
+
 
+def metadata_prompt_prefix(ddl_schema):
+    """Builds the question-independent start of the metadata prompt."""
     prompt_template = """
     You are a data analyst expert. You are provided with BigQuery database schema (DDL statements with column comments).
     Your task is to answer the user's question about where to find certain information or about the structure of the tables, based *only* on the provided schema.
     Focus on identifying the most relevant table(s) and column(s) based on their names and, crucially, their descriptions (comments).
 
+    **Instructions:**
+    - Carefully examine the table names, column names, and especially the `COMMENT` (or `--` comment) associated with each column in the schema.
+    - Provide a concise and direct natural language answer.
+    - For example: "The information about customer addresses seems to be in the `project.dataset.customer_details` table, specifically in the `address_line1`, `city`, and `postal_code` columns. The `address_line1` column is described as 'Primary street address'."
+    - If the question asks to describe a table, list its columns and their descriptions if available.
+    - Do NOT generate SQL queries. Your output should be a natural language explanation.
+    - If the schema does not seem to contain the information, state that.
+
     **Schema:**
     ```
     {SCHEMA}
     ```
+    """
+
+    return prompt_template.format(SCHEMA=ddl_schema)
+
 
+def metadata_prompt_suffix(question, tool_context):
+    """Builds the question part of the metadata prompt."""
+    prompt_template = """
     **Question:**
     ```
     {QUESTION}
     ```
 
-    **Instructions:**
-    - Carefully examine the table names, column names, and especially the `COMMENT` associated with each column in the schema.
-    - Provide a concise and direct natural language answer.
-    - For example: "The information about customer addresses seems to be in the `project.dataset.customer_details` table, specifically in the `address_line1`, `city`, and `postal_code` columns. The `address_line1` column is described as 'Primary street address'."
-    - If the question asks to describe a table, list its columns and their descriptions if available.
-    - Do NOT generate SQL queries. Your output should be a natural language explanation.
-    - If the schema does not seem to contain the information, state that.
-
     **Answer:**
     """
 
-    prompt = prompt_template.format(SCHEMA=ddl_schema, QUESTION=question)
-
-    # Consider using a specific model tuned for instruction following or QA if available,
-    # otherwise, the NL2SQL model might also work if it's a general foundation model.
-    model_to_use = get_env_var("AGENT_TOOL_MODEL")
-    if not model_to_use:
-        # Fallback or error if no model is defined
-        return "Error: Model for metadata description not configured."
+    return prompt_template.format(QUESTION=question)
 
-    response = llm_client.models.generate_content(
-        model=model_to_use,
-        contents=prompt,
-        config={"temperature": 0.0}, # Low temperature for factual answers
-    )
 
-    answer = response.text.strip()
+def save_metadata_answer(question, answer, tool_context):
+    """Stores the answer of `get_metadata_description` in the session state."""
+    answer = answer.strip()
     tool_context.state["metadata_answer"] = answer
     # Ensure sql_query related states are cleared or set to None if this path is taken
     tool_context.state["sql_query"] = None
-    tool_context.state["query_result"] = None
+    tool_context.state["query_result_handle"] = None
 
-    print(f"\n[get_metadata_description] Question: {question}")
-    print(f"[get_metadata_description] Answer: {answer}")
+    logging.debug("get_metadata_description: %r -> %r", question, answer)
     return answer
 
 
@@ -207,6 +746,12 @@ def bq_nl2sql(
 ) -> str:
     """Generates an initial SQL query from a natural language question.
 
+    If the same question (ignoring case, accents, punctuation and whitespace)
+    was already answered with a validated SQL for the current schema version,
+    that SQL is returned without calling the model. Otherwise the tool model
+    is chosen by the estimated complexity of the question (see
+    `route_sql_model`).
+
     Args:
         question (str): Natural language question.
         tool_context (ToolContext): The tool context to use for generating the SQL
@@ -216,6 +761,178 @@ def bq_nl2sql(
         str: An SQL statement to answer this question.
     """
 
+    # Reuse the last validated SQL of the same question and schema version
+    cached_sql = get_cached_sql(question, tool_context)
+    if cached_sql is not None:
+        return cached_sql
+
+    model = route_sql_model(question, tool_context)
+    if speculation_config().get("enabled", False):
+        speculation, _ = coalesce(
+            nl2sql_flight, ("speculation",) + nl2sql_flight_key(tool_context, model),
+            tool_context, speculate_sql, question, tool_context, model,
+        )
+        if speculation is not None:
+            return save_speculation(question, speculation, tool_context)
+
+    # Sessions asking the same question at the same time share one generation
+    response, _ = coalesce(
+        nl2sql_flight, nl2sql_flight_key(tool_context, model), tool_context,
+        generate_tool_content, "nl2sql", question, tool_context, 0.1, model,
+    )
+
+    return save_generated_sql(question, response.text, tool_context)
+
+
+def nl2sql_flight_key(tool_context, model=None):
+    """Returns the key of identical SQL generations.
+
+    Generations are identical for the same question, dataset and schema (the
+    SQL cache key, see `get_cached_sql`), the same repair context and the
+    same tool model.
+    """
+    last_validation = tool_context.state.get("last_validation")
+    return (
+        tool_context.state["sql_cache_key"],
+        json.dumps(last_validation, sort_keys=True, default=str)
+        if last_validation else None,
+        model,
+    )
+
+
+def routing_config():
+    return get_config().get("routing", {})
+
+
+def routing_tiers():
+    """Returns the routing tiers of config.yaml with their model names.
+
+    A tier without a model uses AGENT_TOOL_MODEL.
+    """
+    default_model = get_env_var("AGENT_TOOL_MODEL")
+    return [
+        dict(tier, model=tier.get("model") or default_model)
+        for tier in routing_config().get("tiers") or [{}]
+    ]
+
+
+def route_sql_model(question, tool_context):
+    """Chooses the tool model generating the SQL of a question.
+
+    The question goes to the first tier of `routing.tiers` whose
+    `max_complexity` is not below its estimated complexity (see
+    `routing.estimate_complexity`). With `routing.escalate_on_failure`, the
+    generation following the rejection of the last generated SQL by
+    `run_bigquery_validation` goes one tier above the model that generated
+    it, whether the question is the same (FUSED repair loop) or rephrased
+    with the error by the root model (STEPWISE). The route is kept in
+    `state["sql_route"]`, for the validation to record its outcome.
+
+    Returns:
+        str: The model name.
+    """
+    config = routing_config()
+    if not config.get("enabled", False):
+        return get_env_var("AGENT_TOOL_MODEL")
+
+    tiers = routing_tiers()
+    previous = tool_context.state.get("sql_route")
+    with telemetry.span("route", tool_context.state) as stage:
+        estimate = routing.estimate_complexity(
+            question, session_settings(tool_context), config.get("weights")
+        )
+        tier = routing.select_tier(tiers, estimate["complexity"])
+        escalated = False
+        if (
+            config.get("escalate_on_failure", True)
+            and previous is not None
+            and previous["rejected"]
+            and tool_context.state.get("last_validation")
+        ):
+            escalated_tier = min(previous["tier"] + 1, len(tiers) - 1)
+            escalated = escalated_tier > tier
+            tier = max(tier, escalated_tier)
+        model = tiers[tier]["model"]
+        stage.set(
+            tier=tier,
+            model=model,
+            complexity=estimate["complexity"],
+            tables=len(estimate["tables"]),
+            escalated=escalated,
+        )
+
+    tool_context.state["sql_route"] = {
+        "key": tool_context.state["sql_cache_key"],
+        "tier": tier,
+        "model": model,
+        "complexity": estimate["complexity"],
+        "escalated": escalated,
+        "checked": False,
+        "rejected": False,
+    }
+    model_stats.record_route(model, escalated)
+    logging.info(
+        "SQL generation routed to %s (tier %d, complexity %d, escalated %s)",
+        model, tier, estimate["complexity"], escalated,
+    )
+    return model
+
+
+def record_sql_outcome(tool_context, valid):
+    """Records whether the SQL of the routed model passed validation.
+
+    Only the first validation of a generated SQL counts. A rejection
+    escalates the next generation (see `route_sql_model`).
+    """
+    route = tool_context.state.get("sql_route")
+    if (
+        route is None or route["checked"]
+        or route["key"] != tool_context.state.get("sql_cache_key")
+    ):
+        return
+    tool_context.state["sql_route"] = dict(route, checked=True, rejected=not valid)
+    model_stats.record_outcome(route["model"], valid)
+
+
+def get_routing_stats():
+    """Get the latency and validation success of each tool model.
+
+    See `routing.ModelStats.snapshot`. `routed` counts the SQL generations
+    routed to a model (including those shared by concurrent sessions) and
+    `escalated_to` those routed after a rejection.
+    """
+    return model_stats.snapshot()
+
+
+def get_cached_sql(question, tool_context):
+    """Returns the cached SQL of a question, or None.
+
+    The cache key is kept in the session state, so that the SQL accepted by
+    `run_bigquery_validation` is cached for this question. The cache is not
+    used while the last SQL is rejected (`state["last_validation"]`).
+    """
+    cache_key = _sql_cache_key(question, tool_context)
+    tool_context.state["sql_cache_key"] = cache_key
+    if tool_context.state.get("last_validation"):
+        # A repair attempt: the previous SQL was rejected, generate a new one
+        return None
+    cached_sql = get_sql_cache().get(cache_key)
+    if cached_sql is not None:
+        logging.debug("Cached SQL: %s", cached_sql)
+        tool_context.state["sql_query"] = cached_sql
+    return cached_sql
+
+
+def build_nl2sql_prompt(question, tool_context):
+    """Builds the inline prompt of `bq_nl2sql`."""
+    return (
+        nl2sql_prompt_prefix(relevant_schema(question, tool_context))
+        + nl2sql_prompt_suffix(question, tool_context)
+    )
+
+
+def nl2sql_prompt_prefix(ddl_schema):
+    """Builds the question-independent start of the NL2SQL prompt."""
     prompt_template = """
         You are a BigQuery SQL expert tasked with generating SQL queries in the GoogleSql dialect to answer user's questions that explicitly ask for data retrieval from BigQuery tables. If the question is about table structure or where to find data (a metadata question), you should indicate that this type of question is handled differently and avoid generating SQL.
         
@@ -231,6 +948,7 @@ def bq_nl2sql(
         - **Column Usage:** Use *ONLY* the column names (column_name) mentioned in the Table Schema. Do *NOT* use any other column names. Associate `column_name` mentioned in the Table Schema only to the `table_name` specified under Table Schema.
         - **FILTERS:** You should write query effectively  to reduce and minimize the total rows to be returned. For example, you can use filters (like `WHERE`, `HAVING`, etc. (like 'COUNT', 'SUM', etc.) in the SQL query.
         - **LIMIT ROWS:**  The maximum number of rows returned should be less than {MAX_NUM_ROWS}.
+        - **Partitions:** For tables marked `-- Partitioned by`, filter on the partition column (e.g. a date range) whenever the question allows it, and prefer filters on the `-- Clustered by` columns. Queries without a partition filter are restricted to the most recent partitions.
 
         **Schema:**
 
@@ -239,7 +957,14 @@ def bq_nl2sql(
         ```
         {SCHEMA}
         ```
+   """
 
+    return prompt_template.format(MAX_NUM_ROWS=MAX_NUM_ROWS, SCHEMA=ddl_schema)
+
+
+def nl2sql_prompt_suffix(question, tool_context):
+    """Builds the question part of the NL2SQL prompt, with the repair context."""
+    prompt_template = """
         **Natural language question:**
 
         ```
@@ -250,24 +975,281 @@ def bq_nl2sql(
 
    """
 
-    ddl_schema = tool_context.state["database_settings"]["bq_ddl_schema"]
+    profiles_template = """
+        **Column values:** Profiled values of the columns related to the question (share of rows in parentheses). Use these exact literals in filters, mapping the question's wording to them (e.g. a state name to its code):
+
+        {COLUMNS}
+   """
+
+    repair_template = """
+        **Previous attempt:** The following SQL was rejected. Fix these errors in the new SQL:
+
+        ```
+        {SQL}
+        ```
+
+        {ERRORS}
+   """
+
+    prompt = prompt_template.format(QUESTION=question)
+
+    # Values of the related columns, so that filters use existing literals
+    profile_config = get_config().get("profiles", {})
+    if profile_config.get("enabled", False):
+        columns = profiles.relevant_columns(
+            question,
+            session_settings(tool_context),
+            max_columns=profile_config.get("max_columns", 8),
+        )
+        if columns:
+            prompt += profiles_template.format(
+                COLUMNS=profiles.render_columns(columns).replace("\n", "\n        ")
+            )
+
+    # Structured errors of the last rejected SQL, to repair it
+    last_validation = tool_context.state.get("last_validation")
+    if last_validation:
+        prompt += repair_template.format(
+            SQL=last_validation["sql"],
+            ERRORS="\n        ".join(
+                f"- {error['message']}" for error in last_validation["errors"]
+            ),
+        )
+    return prompt
+
+
+# Prompt kind -> builders of its question-independent prefix and its suffix
+PROMPT_BUILDERS = {
+    "metadata": (metadata_prompt_prefix, metadata_prompt_suffix),
+    "nl2sql": (nl2sql_prompt_prefix, nl2sql_prompt_suffix),
+}
+
+
+def speculation_config():
+    return get_config().get("speculation", {})
+
+
+def candidate_temperatures():
+    """Returns the temperature of each speculative SQL candidate."""
+    config = speculation_config()
+    count = max(1, min(config.get("candidates", 3), MAX_SQL_CANDIDATES))
+    temperatures = config.get("temperatures") or [0.1]
+    return [temperatures[i % len(temperatures)] for i in range(count)]
+
+
+def candidate_context(tool_context):
+    """Returns the private tool context of a SQL candidate.
+
+    Candidates run concurrently, so their stages are recorded in their own
+    turn summary and added up in the `speculation` stage.
+    """
+    return SimpleNamespace(state={
+        "schema_ref": tool_context.state["schema_ref"],
+        "last_validation": tool_context.state.get("last_validation"),
+    })
+
+
+def check_sql_candidate(sql, settings):
+    """Runs the checks of `run_bigquery_validation` preceding execution.
 
-    prompt = prompt_template.format(
-        MAX_NUM_ROWS=MAX_NUM_ROWS, SCHEMA=ddl_schema, QUESTION=question
+    Args:
+        sql (str): The generated SQL.
+        settings (dict): The database settings of the session.
+
+    Returns:
+        dict: Whether the SQL is `valid`, the checked `sql` (with its LIMIT),
+          the `checked_sql` to execute (possibly sampled) with its
+          `referenced_tables`, `bytes_processed`, `sampled` and
+          `partition_rewrite`, or the `error_message`.
+    """
+    check = {
+        "valid": False,
+        "checked_sql": None,
+        "referenced_tables": [],
+        "error_message": None,
+        "bytes_processed": None,
+        "sampled": False,
+        "partition_rewrite": None,
+    }
+    check["sql"], errors = sql_validator.validate_sql(
+        cleanup_sql(sql), settings, MAX_NUM_ROWS
+    )
+    if errors:
+        check["error_message"] = sql_validator.format_errors(errors)
+        return check
+
+    checked_sql, check["referenced_tables"] = _check_cost(check["sql"], check, settings)
+    max_bytes = speculation_config().get("max_bytes_processed", 0)
+    if checked_sql is not None and max_bytes and check["bytes_processed"] > max_bytes:
+        check["error_message"] = (
+            "Invalid SQL: Candidate would process "
+            f"{query_guard.format_bytes(check['bytes_processed'])}, over the "
+            f"speculation cap of {query_guard.format_bytes(max_bytes)}."
+        )
+        checked_sql = None
+    check["valid"] = checked_sql is not None
+    check["checked_sql"] = checked_sql
+    return check
+
+
+def candidate_result(index, sql, check, duplicate, context):
+    """Returns a checked SQL candidate."""
+    return dict(
+        check,
+        index=index,
+        generated_sql=sql,
+        duplicate=duplicate,
+        totals=(context.state.get(telemetry.STATE_KEY) or {}).get("totals", {}),
     )
 
-    response = llm_client.models.generate_content(
-        model=get_env_var("AGENT_TOOL_MODEL"),
-        contents=prompt,
-        config={"temperature": 0.1},
+
+def _sql_candidate(index, question, temperature, tool_context, checks, model):
+    """Generates and checks a SQL candidate; identical candidates share a check."""
+    context = candidate_context(tool_context)
+    response = generate_tool_content("nl2sql", question, context, temperature, model)
+    sql = clean_generated_sql(response.text or "")
+    check, duplicate = checks.do(
+        cache.canonicalize_sql(sql),
+        check_sql_candidate, sql, session_settings(context),
     )
+    return candidate_result(index, sql, check, duplicate, context)
+
 
-    sql = response.text
+def speculate_sql(question, tool_context, model=None):
+    """Generates SQL candidates concurrently and selects one.
+
+    `speculation.candidates` candidates are generated by `model` with the
+    temperatures of `speculation.temperatures`, and checked (locally and with a dry run)
+    as they arrive. With `speculation.select` "first", the first valid
+    candidate is selected and the others are cancelled; with "cheapest", the
+    valid candidate processing the fewest bytes.
+
+    Returns:
+        dict: The speculation (see `select_candidate`), or None when no
+          candidate could be generated.
+    """
+    temperatures = candidate_temperatures()
+    select = speculation_config().get("select", "first")
+    checks = singleflight.SingleFlight("sql_candidate")
+    with telemetry.span(
+        "speculation", tool_context.state, candidates=len(temperatures), select=select
+    ) as stage:
+        executor = ThreadPoolExecutor(len(temperatures))
+        futures = [
+            executor.submit(
+                _sql_candidate, index, question, temperature, tool_context, checks,
+                model,
+            )
+            for index, temperature in enumerate(temperatures)
+        ]
+        candidates = []
+        try:
+            for future in as_completed(futures):
+                try:
+                    candidates.append(future.result())
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.warning("SQL candidate failed: %s", e)
+                    continue
+                if select == "first" and candidates[-1]["valid"]:
+                    break
+        finally:
+            # Running generations finish in background, their SQL is ignored
+            executor.shutdown(wait=False, cancel_futures=True)
+        speculation = select_candidate(candidates, select, len(temperatures))
+        if speculation is not None:
+            stage.set(**speculation["summary"])
+    return speculation
+
+
+def select_candidate(candidates, select, count):
+    """Selects the SQL candidate of a speculation and counts the outcome.
+
+    A repair round is saved when the candidate of the first temperature,
+    the one a sequential generation would return, is invalid while another
+    candidate is valid.
+
+    Args:
+        candidates (list): The checked candidates, in completion order.
+        select (str): "first" or "cheapest".
+        count (int): The number of candidates started.
+
+    Returns:
+        dict: The `winner` candidate (the first candidate when none is
+          valid, for its errors to be repaired) and the `summary` of the
+          speculation, or None when there is no candidate.
+    """
+    if not candidates:
+        return None
+    valid = [candidate for candidate in candidates if candidate["valid"]]
+    if not valid:
+        winner = min(candidates, key=lambda candidate: candidate["index"])
+    elif select == "cheapest":
+        winner = min(valid, key=lambda candidate: candidate["bytes_processed"] or 0)
+    else:
+        winner = valid[0]
+    baseline = next(
+        (candidate for candidate in candidates if candidate["index"] == 0), None
+    )
+
+    summary = {
+        "completed": len(candidates),
+        "valid": len(valid),
+        "duplicates": sum(candidate["duplicate"] for candidate in candidates),
+        "winner": winner["index"],
+        "saved_repair": bool(valid) and baseline is not None and not baseline["valid"],
+    }
+    for key in ("input_tokens", "output_tokens", "cached_tokens"):
+        total = sum(candidate["totals"].get(key, 0) for candidate in candidates)
+        if total:
+            summary[key] = total
+
+    with _speculation_lock:
+        speculation_counts["speculations"] += 1
+        speculation_counts["candidates"] += count
+        speculation_counts["cancelled"] += count - len(candidates)
+        speculation_counts["duplicates"] += summary["duplicates"]
+        speculation_counts["valid" if valid else "all_invalid"] += 1
+        speculation_counts["saved_repairs"] += summary["saved_repair"]
+    return {"winner": winner, "summary": summary}
+
+
+def save_speculation(question, speculation, tool_context):
+    """Stores the selected SQL candidate in the state and returns it.
+
+    The dry run of a valid candidate is kept in `state["sql_check"]`, so
+    `run_bigquery_validation` does not run it again.
+    """
+    winner = speculation["winner"]
+    tool_context.state["sql_check"] = (
+        {
+            key: winner[key] for key in (
+                "sql", "checked_sql", "referenced_tables", "bytes_processed",
+                "sampled", "partition_rewrite",
+            )
+        }
+        if winner["valid"] else None
+    )
+    return save_generated_sql(question, winner["generated_sql"], tool_context)
+
+
+def get_speculation_stats():
+    """Get the counters of the speculative SQL generations.
+
+    `saved_repairs` counts the speculations whose first-temperature
+    candidate was invalid while another one was valid, i.e. the repair
+    rounds saved.
+    """
+    with _speculation_lock:
+        return dict(speculation_counts)
+
+
+def save_generated_sql(question, sql, tool_context):
+    """Cleans up the SQL generated by `bq_nl2sql` and stores it in the state."""
     if sql:
-        sql = sql.replace("```sql", "").replace("```", "").strip()
+        sql = clean_generated_sql(sql)
     
     # Add a check to see if the LLM decided it's a metadata question
-    if "metadata" in sql.lower() and ("table has" in question.lower() or "describe table" in question.lower()): # Heuristic
+    if sql and "metadata" in sql.lower() and ("table has" in question.lower() or "describe table" in question.lower()): # Heuristic
         tool_context.state["sql_query"] = None
         tool_context.state["metadata_hint"] = sql # Store the hint
         # Return a specific indicator or the message itself,
@@ -281,13 +1263,200 @@ def bq_nl2sql(
         # The change above is more of a safeguard or for advanced scenarios.
         
 
-    print("\n sql:", sql)
+    logging.debug("Generated SQL: %s", sql)
 
     tool_context.state["sql_query"] = sql
+    tool_context.state["last_validation"] = None
 
     return sql
 
 
+def clean_generated_sql(sql):
+    """Removes the markdown fences around a generated SQL."""
+    return sql.replace("```sql", "").replace("```", "").strip()
+
+
+def _sql_cache_key(question, tool_context):
+    """Builds the SQL cache key of a question for the session dataset and schema."""
+    schema_key = cache.schema_key(tool_context.state["schema_ref"])
+    return f"{schema_key}:{cache.fingerprint_question(question)}"
+
+
+def _table_freshness(table_names):
+    """Get the modification state of the tables referenced by a query.
+
+    The tables are read concurrently, so a query over several tables costs
+    about one `get_table` round trip.
+
+    Args:
+        table_names (list[str]): Full names of the referenced tables.
+
+    Returns:
+        list: One [table, last modified, streaming buffer rows, oldest
+          streaming entry] item per table, or None if a table could not be
+          read.
+    """
+
+    def read(table_name):
+        try:
+            table = get_bq_client().get_table(table_name)
+        except Exception:  # pylint: disable=broad-exception-caught
+            return None
+        buffer = table.streaming_buffer
+        return [
+            table_name,
+            table.modified.isoformat() if table.modified else None,
+            buffer.estimated_rows if buffer else None,
+            buffer.oldest_entry_time.isoformat()
+            if buffer and buffer.oldest_entry_time else None,
+        ]
+
+    if len(table_names) > 1:
+        with ThreadPoolExecutor(
+            max_workers=min(len(table_names), _schema_max_workers())
+        ) as executor:
+            freshness = list(executor.map(read, table_names))
+    else:
+        freshness = [read(table_name) for table_name in table_names]
+    if any(item is None for item in freshness):
+        return None
+    return freshness
+
+
+def _guard_partitions(sql_string, plan, settings, final_result):
+    """Rewrites the full scans of partitioned tables (see `partition_guard`).
+
+    Applies to queries whose dry run processes at least
+    `partition_guard.min_bytes_processed`, or failed for a missing required
+    partition filter (`plan` is None). The rewrite (`query_guard.
+    guard_partitions`) is kept only if its dry run succeeds and processes
+    fewer bytes, and is reported in `final_result["partition_rewrite"]` with
+    the bytes saved compared with the original plan.
+
+    Returns:
+        tuple: The SQL to check against the budget and its dry run plan.
+    """
+    guard_config = get_config().get("partition_guard", {})
+    if not guard_config.get("enabled", True):
+        return sql_string, plan
+    if plan is not None and (
+        plan["bytes_processed"] < guard_config.get("min_bytes_processed", 0)
+    ):
+        return sql_string, plan
+
+    rewrite = query_guard.guard_partitions(
+        sql_string,
+        settings.get("bq_table_layouts", {}),
+        settings["bq_project_id"],
+        settings["bq_dataset_id"],
+        window_days=guard_config.get("window_days", 30),
+        # A sample does not satisfy a required partition filter
+        sample_percent=guard_config.get("sample_percent", 0) if plan else 0,
+    )
+    if rewrite is None:
+        return sql_string, plan
+    try:
+        rewritten_plan = query_guard.dry_run(get_bq_client(), rewrite["sql"])
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("Partition rewrite failed its dry run: %s", e)
+        return sql_string, plan
+    if plan is not None and rewritten_plan["bytes_processed"] >= plan["bytes_processed"]:
+        return sql_string, plan
+
+    final_result["partition_rewrite"] = {
+        "method": rewrite["method"],
+        "tables": rewrite["tables"],
+        "note": rewrite["note"],
+        "original_bytes_processed": plan["bytes_processed"] if plan else None,
+        "bytes_saved": (
+            plan["bytes_processed"] - rewritten_plan["bytes_processed"] if plan else None
+        ),
+    }
+    final_result["sampled"] = rewrite["method"] == "sample"
+    return rewrite["sql"], rewritten_plan
+
+
+def _check_cost(sql_string, final_result, settings):
+    """Dry runs a query and enforces the bytes budget of config.yaml.
+
+    Full scans of partitioned tables are first rewritten to read a recent
+    window or a sample (see `_guard_partitions`). Queries over
+    `cost.max_bytes_processed` are rejected, or rewritten with TABLESAMPLE
+    when `cost.over_budget` is "sample" and the sampled query fits the
+    budget. The dry run results are recorded in `final_result`.
+
+    Returns:
+        tuple: The SQL to execute (None if it must not run) and the list of
+          referenced tables.
+    """
+    cost_config = get_config().get("cost", {})
+    max_bytes = cost_config.get("max_bytes_processed", 0)
+
+    error = None
+    try:
+        plan = query_guard.dry_run(get_bq_client(), sql_string)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        plan, error = None, e
+    if plan is not None or query_guard.is_partition_filter_error(error):
+        sql_string, plan = _guard_partitions(sql_string, plan, settings, final_result)
+    if plan is None:
+        final_result["error_message"] = f"Invalid SQL: {error}"
+        return None, []
+    final_result["bytes_processed"] = plan["bytes_processed"]
+
+    if not max_bytes or plan["bytes_processed"] <= max_bytes:
+        return sql_string, plan["referenced_tables"]
+
+    over_budget_message = (
+        f"Query would process {query_guard.format_bytes(plan['bytes_processed'])}, "
+        f"over the budget of {query_guard.format_bytes(max_bytes)}. "
+        "Add filters (e.g. on partition or date columns) or select fewer columns."
+    )
+
+    if cost_config.get("over_budget", "reject") == "sample":
+        sampled_sql = query_guard.apply_tablesample(
+            sql_string, cost_config.get("sample_percent", 1)
+        )
+        try:
+            sampled_plan = query_guard.dry_run(get_bq_client(), sampled_sql)
+        except Exception:  # pylint: disable=broad-exception-caught
+            sampled_plan = None
+        if sampled_plan and sampled_plan["bytes_processed"] <= max_bytes:
+            final_result["bytes_processed"] = sampled_plan["bytes_processed"]
+            final_result["sampled"] = True
+            return sampled_sql, sampled_plan["referenced_tables"]
+
+    final_result["error_message"] = f"Invalid SQL: {over_budget_message}"
+    return None, plan["referenced_tables"]
+
+
+def reject_sql(sql_string, errors, tool_context):
+    """Records a rejected SQL as the repair context of the next generation.
+
+    The SQL cached for the question is evicted: a cached SQL can fail later
+    (a transient job error, a lower bytes budget, data changed within the
+    same schema version) and would otherwise be returned again to every
+    repair attempt.
+    """
+    tool_context.state["last_validation"] = {"sql": sql_string, "errors": errors}
+    cache_key = tool_context.state.get("sql_cache_key")
+    if cache_key:
+        get_sql_cache().pop(cache_key)
+
+
+def bigquery_errors(final_result):
+    """Returns the validation errors of a query BigQuery rejected."""
+    return [{"code": "bigquery_error", "message": final_result["error_message"]}]
+
+
+def _cache_validated_sql(sql_string, tool_context):
+    """Cache an accepted SQL for the question that generated it."""
+    cache_key = tool_context.state.get("sql_cache_key")
+    if cache_key:
+        get_sql_cache().put(cache_key, sql_string)
+        tool_context.state["sql_cache_key"] = None
+
+
 def run_bigquery_validation(
     sql_string: str,
     tool_context: ToolContext,
@@ -299,14 +1468,22 @@ def run_bigquery_validation(
 
     1. **SQL Cleanup:**  Preprocesses the SQL string using a `cleanup_sql`
     function
-    2. **DML/DDL Restriction:**  Rejects any SQL queries containing DML or DDL
-       statements (e.g., UPDATE, DELETE, INSERT, CREATE, ALTER) to ensure
-       read-only operations.
-    3. **Syntax and Execution:** Sends the cleaned SQL to BigQuery for validation.
+    2. **Local Validation:**  Parses the SQL and rejects anything but a single
+       SELECT query, unknown tables and unknown columns of the schema (see
+       `sql_validator.py`), with structured `validation_errors`. A LIMIT is
+       added to the outermost query if it has none.
+    3. **Dry Run and Cost Budget:** Dry runs the query. Errors are returned
+       without executing it. Full scans of partitioned tables are rewritten
+       to read a recent window of partitions, or a sample for exploratory
+       queries (see `partition_guard` in config.yaml), and queries processing
+       more than `cost.max_bytes_processed` are rejected or sampled.
+    4. **Syntax and Execution:** Sends the cleaned SQL to BigQuery for validation.
        If the query is syntactically correct and executable, it retrieves the
        results.
-    4. **Result Analysis:**  Checks if the query produced any results. If so, it
-       formats the first few rows of the result set for inspection.
+    5. **Result Analysis:**  Checks if the query produced any results. If so, it
+       formats the first few rows of the result set for inspection. Results
+       larger than `results.inline_max_rows` are returned as their first rows
+       and a `result_summary`; the fetched rows are kept under `result_handle`.
 
     Args:
         sql_string (str): The SQL query string to validate.
@@ -319,77 +1496,274 @@ def run_bigquery_validation(
                 is valid but returns no data.
              - "Invalid SQL: ..." if the query is invalid, along with the error
                 message from BigQuery.
+             The result also reports the bytes processed by the query, whether
+             it was rewritten with TABLESAMPLE (`sampled`), the partition
+             filter or sample added to it with the bytes saved
+             (`partition_rewrite`), whether it was
+             served from the result cache (`from_cache`) and the age of the
+             cached data in seconds (`cache_age_seconds`). Cached results are
+             only served while the last modified time and streaming buffer of
+             every referenced table are unchanged.
     """
 
-    def cleanup_sql(sql_string):
-        """Processes the SQL string to get a printable, valid SQL string."""
+    final_result, plan = prepare_validation(sql_string, tool_context)
+    if plan is None:
+        return final_result
 
-        # 1. Remove backslashes escaping double quotes
-        sql_string = sql_string.replace('\\"', '"')
+    try:
+        with telemetry.span("execute", tool_context.state) as stage:
+            # Sessions running the same query at the same time share one job
+            (result_schema, table, job), shared = query_flight.do(
+                plan["result_key"], execute_query, plan["sql_string"]
+            )
+            # The bytes of a shared job are reported by the session that ran it
+            stage.set(shared=shared, **({} if shared else job))
+        save_query_results(final_result, plan, result_schema, table, tool_context)
+
+    except (
+        Exception
+    ) as e:  # Catch generic exceptions from BigQuery  # pylint: disable=broad-exception-caught
+        final_result["error_message"] = f"Invalid SQL: {e}"
+        reject_sql(plan["sql_string"], bigquery_errors(final_result), tool_context)
+
+    logging.debug("run_bigquery_validation result: %s", final_result)
+
+    return final_result
 
-        # 2. Remove backslashes before newlines (the key fix for this issue)
-        sql_string = sql_string.replace("\\\n", "\n")  # Corrected regex
 
-        # 3. Replace escaped single quotes
-        sql_string = sql_string.replace("\\'", "'")
+def cleanup_sql(sql_string):
+    """Processes the SQL string to get a printable, valid SQL string."""
 
-        # 4. Replace escaped newlines (those not preceded by a backslash)
-        sql_string = sql_string.replace("\\n", "\n")
+    # 1. Remove backslashes escaping double quotes
+    sql_string = sql_string.replace('\\"', '"')
 
-        # 5. Add limit clause if not present
-        if "limit" not in sql_string.lower():
-            sql_string = sql_string + " limit " + str(MAX_NUM_ROWS)
+    # 2. Remove backslashes before newlines (the key fix for this issue)
+    sql_string = sql_string.replace("\\\n", "\n")  # Corrected regex
 
-        return sql_string
+    # 3. Replace escaped single quotes
+    sql_string = sql_string.replace("\\'", "'")
 
+    # 4. Replace escaped newlines (those not preceded by a backslash)
+    sql_string = sql_string.replace("\\n", "\n")
+
+    return sql_string
+
+
+def prepare_validation(sql_string, tool_context):
+    """Runs the checks of `run_bigquery_validation` that precede execution.
+
+    Returns:
+        tuple: The validation result and the execution plan, a dict with the
+          `sql_string` to execute, its `result_key` in the result cache and
+          the `freshness` of its tables. The plan is None when the result is
+          final (rejected query or cached results).
+    """
     logging.info("Validating SQL: %s", sql_string)
     sql_string = cleanup_sql(sql_string)
     logging.info("Validating SQL (after cleanup): %s", sql_string)
 
-    final_result = {"query_result": None, "error_message": None}
+    final_result = {
+        "query_result": None,
+        "error_message": None,
+        "validation_errors": [],
+        "from_cache": False,
+        "cache_age_seconds": 0,
+        "bytes_processed": None,
+        "sampled": False,
+        "partition_rewrite": None,
+    }
 
-    # More restrictive check for BigQuery - disallow DML and DDL
-    if re.search(
-        r"(?i)(update|delete|drop|insert|create|alter|truncate|merge)", sql_string
-    ):
+    # A new validation replaces the SQL and result of the previous one
+    tool_context.state["query_result_handle"] = None
+    sql_check = tool_context.state.get("sql_check")
+    if sql_check is not None:
+        tool_context.state["sql_check"] = None
+
+    # Local check against the schema: single SELECT, known tables and columns.
+    # Also adds the LIMIT to the outermost query if missing.
+    with telemetry.span("sql_validation", tool_context.state) as stage:
+        sql_string, errors = sql_validator.validate_sql(
+            sql_string, session_settings(tool_context), MAX_NUM_ROWS
+        )
+        stage.set(errors=len(errors))
+    tool_context.state["sql_query"] = sql_string
+    if errors:
+        final_result["error_message"] = sql_validator.format_errors(errors)
+        final_result["validation_errors"] = errors
+        reject_sql(sql_string, errors, tool_context)
+        record_sql_outcome(tool_context, valid=False)
+        logging.debug("run_bigquery_validation result: %s", final_result)
+        return final_result, None
+
+    # Dry run first: invalid or too expensive queries are never executed
+    with telemetry.span("dry_run", tool_context.state) as stage:
+        if sql_check is not None and sql_check["sql"] == sql_string:
+            # Already dry run as the selected speculative candidate
+            checked_sql = sql_check["checked_sql"]
+            referenced_tables = sql_check["referenced_tables"]
+            final_result["bytes_processed"] = sql_check["bytes_processed"]
+            final_result["sampled"] = sql_check["sampled"]
+            final_result["partition_rewrite"] = sql_check["partition_rewrite"]
+            stage.set(reused=True)
+        else:
+            checked_sql, referenced_tables = _check_cost(
+                sql_string, final_result, session_settings(tool_context)
+            )
+        rewrite = final_result["partition_rewrite"]
+        stage.set(
+            bytes_processed=final_result["bytes_processed"],
+            sampled=final_result["sampled"],
+            partition_rewrite=rewrite["method"] if rewrite else None,
+            bytes_saved=(rewrite or {}).get("bytes_saved"),
+            rejected=checked_sql is None,
+        )
+    if checked_sql is None:
+        reject_sql(sql_string, bigquery_errors(final_result), tool_context)
+        record_sql_outcome(tool_context, valid=False)
+        logging.debug("run_bigquery_validation result: %s", final_result)
+        return final_result, None
+    record_sql_outcome(tool_context, valid=True)
+    sql_string = checked_sql
+    tool_context.state["sql_query"] = sql_string
+
+    # Serve the results of the same query if its tables did not change since
+    result_key = cache.canonicalize_sql(sql_string)
+    freshness = None
+    if get_config().get("cache", {}).get("results", {}).get("enabled", True):
+        freshness = _table_freshness(referenced_tables)
+    if freshness is not None:
+        cached = get_result_cache().get_entry(result_key)
+        with telemetry.span("result_cache", tool_context.state) as stage:
+            stage.set(
+                hit=cached is not None and cached[0]["freshness"] == freshness
+            )
+        if cached is not None and cached[0]["freshness"] == freshness:
+            entry, age = cached
+            if entry["table"] is not None:
+                add_query_result(
+                    final_result, results.table_from_bytes(entry["table"]), tool_context
+                )
+            final_result["error_message"] = entry["error_message"]
+            final_result["from_cache"] = True
+            final_result["cache_age_seconds"] = round(age, 1)
+            _cache_validated_sql(sql_string, tool_context)
+            logging.debug("run_bigquery_validation result (cached): %s", final_result)
+            return final_result, None
+        if cached is not None:
+            get_result_cache().pop(result_key)
+
+    plan = {
+        "sql_string": sql_string,
+        "result_key": result_key,
+        "freshness": freshness,
+    }
+    return final_result, plan
+
+
+def start_query(sql_string):
+    """Starts a query job capped at `cost.maximum_bytes_billed`."""
+    maximum_bytes_billed = get_config().get("cost", {}).get("maximum_bytes_billed")
+    return get_bq_client().query(
+        sql_string,
+        job_config=bigquery.QueryJobConfig(
+            maximum_bytes_billed=maximum_bytes_billed or None
+        ),
+    )
+
+
+def execute_query(sql_string):
+    """Executes a query and fetches at most MAX_NUM_ROWS rows.
+
+    Returns:
+        tuple: The result schema, the Arrow table of the rows and the
+          telemetry attributes of the job.
+    """
+    query_job = start_query(sql_string)
+    # Fetch at most MAX_NUM_ROWS rows, converted column by column
+    result_schema, table = results.fetch_arrow(query_job, MAX_NUM_ROWS)
+    return result_schema, table, telemetry.job_attributes(query_job)
+
+
+def save_query_results(final_result, plan, result_schema, table, tool_context):
+    """Records fetched query results in the validation result, state and caches."""
+    if result_schema:  # Check if query returned data
+        add_query_result(final_result, table, tool_context)
+    else:
         final_result["error_message"] = (
-            "Invalid SQL: Contains disallowed DML/DDL operations."
+            "Valid SQL. Query executed successfully (no results)."
         )
-        return final_result
 
-    try:
-        query_job = get_bq_client().query(sql_string)
-        results = query_job.result()  # Get the query results
-
-        if results.schema:  # Check if query returned data
-            rows = [
-                {
-                    key: (
-                        value
-                        if not isinstance(value, datetime.date)
-                        else value.strftime("%Y-%m-%d")
-                    )
-                    for (key, value) in row.items()
-                }
-                for row in results
-            ][
-                :MAX_NUM_ROWS
-            ]  # Convert BigQuery RowIterator to list of dicts
-            # return f"Valid SQL. Results: {rows}"
-            final_result["query_result"] = rows
-
-            tool_context.state["query_result"] = rows
+    _cache_validated_sql(plan["sql_string"], tool_context)
 
-        else:
-            final_result["error_message"] = (
-                "Valid SQL. Query executed successfully (no results)."
-            )
+    if plan["freshness"] is not None:
+        get_result_cache().put(
+            plan["result_key"],
+            {
+                "table": results.table_to_bytes(table) if result_schema else None,
+                "error_message": final_result["error_message"],
+                "freshness": plan["freshness"],
+            },
+        )
+
+
+def generate_and_validate_sql(
+    question: str,
+    tool_context: ToolContext,
+) -> dict:
+    """Generates, validates and executes the SQL of a question, repairing it.
+
+    Runs `bq_nl2sql` and `run_bigquery_validation` in a loop of at most
+    `repair.max_attempts` attempts (see config.yaml). Each failed attempt
+    passes its errors to the next generation, without a round trip through
+    the root model.
+
+    Args:
+        question (str): Natural language question.
+        tool_context (ToolContext): The tool context.
+
+    Returns:
+        dict: The final `sql`, its `query_result` and `error_message` (as
+          returned by `run_bigquery_validation`), the number of `attempts`
+          and the `repair_history` with the SQL and error of each attempt.
+    """
+    final_result = None
+    history = []
+    for attempt in range(1, max_repair_attempts() + 1):
+        with telemetry.span("repair_attempt", tool_context.state, attempt=attempt) as stage:
+            sql = bq_nl2sql(question, tool_context)
+            final_result = run_bigquery_validation(sql, tool_context)
+            history.append(repair_step(attempt, sql, final_result))
+            stage.set(failed=validation_failed(final_result))
+        if not validation_failed(final_result):
+            break
+
+    return fused_result(history, final_result)
+
+
+def max_repair_attempts():
+    return max(1, get_config().get("repair", {}).get("max_attempts", 3))
+
+
+def validation_failed(final_result):
+    """Whether a `run_bigquery_validation` result rejected the SQL."""
+    return (final_result["error_message"] or "").startswith("Invalid SQL")
+
+
+def repair_step(attempt, sql, final_result):
+    return {
+        "attempt": attempt,
+        "sql": sql,
+        "error_message": final_result["error_message"]
+        if validation_failed(final_result) else None,
+    }
 
-    except (
-        Exception
-    ) as e:  # Catch generic exceptions from BigQuery  # pylint: disable=broad-exception-caught
-        final_result["error_message"] = f"Invalid SQL: {e}"
 
-    print("\n run_bigquery_validation final_result: \n", final_result)
+def fused_result(history, final_result):
+    """Builds the response of `generate_and_validate_sql`."""
+    response = dict(final_result)
+    response["sql"] = history[-1]["sql"]
+    response["attempts"] = len(history)
+    response["repair_history"] = history
+    logging.debug("generate_and_validate_sql attempts: %d", len(history))
+    return response
 
-    return final_result
\ No newline at end of file
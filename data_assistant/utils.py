@@ -14,6 +14,14 @@
 
 import os
 import json
+from pathlib import Path
+
+import yaml
+
+PACKAGE_DIR = Path(__file__).parent.absolute()
+CONFIG_PATH = PACKAGE_DIR / 'config.yaml'
+
+_config = None
 
 def get_env_var(var_name):
   """Retrieves the value of an environment variable.
@@ -34,6 +42,19 @@ def get_env_var(var_name):
     raise ValueError(f'Missing environment variable: {var_name}')
 
 
+def get_config():
+  """Loads the agent config file (config.yaml) once and returns it.
+
+  Returns:
+    A dictionary with the agent config.
+  """
+  global _config
+  if _config is None:
+    with open(CONFIG_PATH, 'r') as f:
+      _config = yaml.safe_load(f)
+  return _config
+
+
 def get_image_bytes(filepath):
   """Reads an image file and returns its bytes.
 
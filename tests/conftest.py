@@ -0,0 +1,95 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared fixtures of the unit tests."""
+
+import copy
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# The agent reads these on import and first use; the tests call no service.
+for name, value in {
+    "BQ_PROJECT_ID": "p",
+    "BQ_DATASET_ID": "d",
+    "AGENT_ROOT_MODEL": "test-root-model",
+    "AGENT_TOOL_MODEL": "test-tool-model",
+    "GOOGLE_CLOUD_LOCATION": "us-central1",
+}.items():
+    os.environ.setdefault(name, value)
+
+DDL_SCHEMA = """CREATE OR REPLACE TABLE `p.d.orders` (
+  `order_id` INT64,
+  `customer_id` INT64,
+  `amount` FLOAT64,
+  `order_date` DATE
+);
+CREATE OR REPLACE TABLE `p.d.customers` (
+  `customer_id` INT64,
+  `name` STRING,
+  `city` STRING
+);
+"""
+
+
+@pytest.fixture
+def database_settings():
+    """Database settings of a two-table dataset `p.d`."""
+    return {
+        "bq_project_id": "p",
+        "bq_dataset_id": "d",
+        "bq_ddl_schema": DDL_SCHEMA,
+        "bq_schema_version": "test-version",
+    }
+
+
+@pytest.fixture
+def fake_agent():
+    """The tools wired to the benchmark fakes of BigQuery and Gemini.
+
+    The tool model answers with valid SQL for the scenario questions
+    (`scenario.question(run)`). The agent config is restored afterwards.
+    """
+    from benchmarks import fakes
+    from benchmarks import run_benchmark
+    from data_assistant import tools
+    from data_assistant.utils import get_config
+
+    config = get_config()
+    saved_config = copy.deepcopy(config)
+    run_benchmark.configure(SimpleNamespace(
+        render_mode="compact", no_context_cache=True, speculation=0, routing=False,
+    ))
+    dataset = fakes.SyntheticDataset(4, 6)
+    bq_client = fakes.FakeBigQueryClient(dataset, result_rows=10)
+    scenario = run_benchmark.Scenario(
+        dataset, bq_client.project, bq_client.dataset_id, fail_every=0
+    )
+    llm_client = fakes.FakeGenAIClient(scenario.script)
+    run_benchmark.install_clients(
+        bq_client, llm_client, bq_client.project, bq_client.dataset_id
+    )
+    run_benchmark.clear_caches()
+    settings = tools.get_database_settings()
+    yield SimpleNamespace(
+        bq_client=bq_client,
+        llm_client=llm_client,
+        scenario=scenario,
+        settings=settings,
+        tool_context=lambda: run_benchmark.tool_context(settings),
+    )
+    run_benchmark.clear_caches()
+    config.clear()
+    config.update(saved_config)
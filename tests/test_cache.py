@@ -0,0 +1,73 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from data_assistant import cache
+
+
+def test_fingerprint_ignores_case_accents_and_punctuation():
+    assert cache.fingerprint_question(
+        "Quantos   pedidos em São Paulo?"
+    ) == cache.fingerprint_question("quantos pedidos em sao paulo")
+
+
+@pytest.mark.parametrize("first, second", [
+    ("orders with amount > 100", "orders with amount < 100"),
+    ("orders with amount = 100", "orders with amount != 100"),
+    ("orders with amount >= 100", "orders with amount > 100"),
+    ("balance of -5", "balance of 5"),
+])
+def test_fingerprint_keeps_operators_and_signs(first, second):
+    assert cache.fingerprint_question(first) != cache.fingerprint_question(second)
+
+
+def test_fingerprint_ignores_operator_spacing():
+    assert cache.fingerprint_question(
+        "amount>100"
+    ) == cache.fingerprint_question("amount > 100")
+
+
+def test_canonicalize_sql():
+    assert cache.canonicalize_sql(
+        "SELECT  a -- first column\n FROM `p.d.T` /* table */ WHERE b = 'X';"
+    ) == "select a from `p.d.T` where b = 'X'"
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = cache.LRUCache(max_entries=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_cache_pop():
+    lru = cache.LRUCache()
+    lru.put("a", 1)
+    lru.pop("a")
+    assert lru.get("a") is None
+    assert lru.stats()["bytes"] == 0
+
+
+def test_canonicalize_sql_keeps_literal_whitespace():
+    assert cache.canonicalize_sql(
+        "SELECT a FROM t WHERE b = 'X  Y'"
+    ) != cache.canonicalize_sql("SELECT a FROM t WHERE b = 'X Y'")
+    assert cache.canonicalize_sql(
+        "SELECT  a\n\tFROM t  WHERE b = 'X  Y'  "
+    ) == "select a from t where b = 'X  Y'"
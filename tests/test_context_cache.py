@@ -0,0 +1,97 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from data_assistant import context_cache
+
+
+PREFIX = "x" * 20000  # Above min_tokens
+
+
+class Caches:
+    """`client.caches` whose creations for the "slow" model wait for `release`."""
+
+    def __init__(self):
+        self.created = []
+        self.deleted = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def create(self, model, config):
+        if model == "slow":
+            self.started.set()
+            assert self.release.wait(5)
+        self.created.append(model)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def update(self, name, config):
+        return None
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+def manager(clock=None):
+    client = SimpleNamespace(caches=Caches())
+    return context_cache.ContextCacheManager(
+        client, ttl_seconds=100, refresh_margin_seconds=10, clock=clock or (lambda: 0)
+    ), client.caches
+
+
+def test_handle_is_reused_and_small_prefixes_are_inline():
+    cache_manager, caches = manager()
+    name = cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.d")
+    assert cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.d") == name
+    assert cache_manager.get("nl2sql", "v1", "m", "small", scope="p.d") is None
+    assert caches.created == ["m"]
+
+
+def test_new_version_deletes_the_previous_handle():
+    cache_manager, caches = manager()
+    old = cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.d")
+    cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.other")
+    cache_manager.get("nl2sql", "v2", "m", PREFIX, scope="p.d")
+    assert caches.deleted == [old]
+
+
+def test_slow_creation_does_not_block_other_keys():
+    cache_manager, caches = manager()
+    with ThreadPoolExecutor(4) as executor:
+        slow = [
+            executor.submit(cache_manager.get, "nl2sql", "v1", "slow", PREFIX, "p.d")
+            for _ in range(3)
+        ]
+        assert caches.started.wait(5)
+        # Served while the creation of the "slow" handle is in progress
+        assert cache_manager.get("nl2sql", "v1", "fast", PREFIX, scope="p.d")
+        assert cache_manager.stats()["handles"] == 1
+        caches.release.set()
+        names = {future.result() for future in slow}
+    # The callers of the same handle shared one creation
+    assert len(names) == 1
+    assert caches.created.count("slow") == 1
+
+
+def test_expiring_handle_is_refreshed():
+    now = [0]
+    cache_manager, caches = manager(clock=lambda: now[0])
+    name = cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.d")
+    now[0] = 95
+    assert cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.d") == name
+    assert cache_manager.stats()["refreshed"] == 1
+    now[0] = 500
+    assert cache_manager.get("nl2sql", "v1", "m", PREFIX, scope="p.d") != name
@@ -0,0 +1,72 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+import pytest
+
+from data_assistant import metadata
+from data_assistant import retrieval
+from data_assistant import sql_validator
+from data_assistant import tools
+
+from .conftest import DDL_SCHEMA
+
+
+def tenant_settings(dataset_id):
+    """Settings of an identically structured dataset, with the same version."""
+    return {
+        "bq_project_id": "p",
+        "bq_dataset_id": dataset_id,
+        "bq_ddl_schema": DDL_SCHEMA.replace("`p.d.", f"`p.{dataset_id}."),
+        "bq_schema_version": "same-version",
+    }
+
+
+@pytest.fixture
+def tenants():
+    return tenant_settings("tenant_a"), tenant_settings("tenant_b")
+
+
+def test_validator_columns_are_kept_per_dataset(tenants):
+    tenant_a, tenant_b = tenants
+    for settings in (tenant_a, tenant_b):
+        own = f"SELECT order_id FROM `p.{settings['bq_dataset_id']}.orders`"
+        _, errors = sql_validator.validate_sql(own, settings, 80)
+        assert errors == []
+
+    assert sorted(sql_validator.schema_columns(tenant_b)) == [
+        "p.tenant_b.customers", "p.tenant_b.orders"
+    ]
+
+
+def test_schema_indexes_are_kept_per_dataset(tenants):
+    tenant_a, tenant_b = tenants
+
+    assert retrieval.get_index(tenant_a) is not retrieval.get_index(tenant_b)
+    assert sorted(retrieval.get_index(tenant_b).names) == [
+        "p.tenant_b.customers", "p.tenant_b.orders"
+    ]
+    assert metadata.get_index(tenant_a) is not metadata.get_index(tenant_b)
+
+
+def test_sql_cache_keys_differ_per_dataset(tenants):
+    keys = {
+        tools._sql_cache_key(  # pylint: disable=protected-access
+            "How many orders?",
+            SimpleNamespace(state={"schema_ref": tools.schema_reference(settings)}),
+        )
+        for settings in tenants
+    }
+    assert len(keys) == 2
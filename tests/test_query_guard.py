@@ -0,0 +1,140 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import sqlglot
+from sqlglot import exp
+
+from data_assistant import query_guard
+
+
+LAYOUTS = {
+    "p.d.orders": {
+        "partition_column": "order_date",
+        "partition_type": "DATE",
+        "require_partition_filter": False,
+    },
+    "p.d.events": {
+        "partition_column": "ts",
+        "partition_type": "TIMESTAMP",
+        "require_partition_filter": False,
+    },
+}
+
+
+def guard(sql_string, sample_percent=0):
+    return query_guard.guard_partitions(
+        sql_string, LAYOUTS, "p", "d", 30, sample_percent=sample_percent
+    )
+
+
+def parse(sql_string):
+    return sqlglot.parse_one(sql_string, read=query_guard.DIALECT)
+
+
+def test_window_filter_is_added_to_where():
+    rewrite = guard("SELECT COUNT(*) FROM `p.d.orders` AS o")
+
+    assert rewrite["method"] == "window"
+    assert rewrite["tables"] == ["p.d.orders"]
+    assert parse(rewrite["sql"]).args["where"] is not None
+    assert (
+        "`o`.`order_date` >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)"
+        in " ".join(rewrite["sql"].split())
+    )
+
+
+def test_filtered_scan_is_left_as_is():
+    assert guard(
+        "SELECT COUNT(*) FROM `p.d.orders` WHERE order_date = '2024-01-01'"
+    ) is None
+    assert guard("SELECT COUNT(*) FROM `p.d.customers`") is None
+
+
+@pytest.mark.parametrize("join", ["LEFT JOIN", "LEFT OUTER JOIN", "FULL JOIN"])
+def test_outer_joined_table_is_filtered_in_a_subquery(join):
+    rewrite = guard(
+        "SELECT c.name, COUNT(o.order_id) FROM `p.d.customers` AS c "
+        f"{join} `p.d.orders` AS o ON o.customer_id = c.customer_id GROUP BY 1"
+    )
+
+    ast = parse(rewrite["sql"])
+    assert ast.args.get("where") is None
+    joined = ast.args["joins"][0]
+    assert joined.side == join.split()[0]
+    assert isinstance(joined.this, exp.Subquery)
+    assert joined.this.alias == "o"
+    assert joined.this.this.args["where"] is not None
+    assert (
+        "FROM `p.d.orders` WHERE `order_date` >= DATE_SUB(CURRENT_DATE(), "
+        "INTERVAL 30 DAY) ) AS o" in " ".join(rewrite["sql"].split())
+    )
+
+
+def test_table_before_right_join_is_filtered_in_a_subquery():
+    rewrite = guard(
+        "SELECT COUNT(*) FROM `p.d.orders` RIGHT JOIN `p.d.customers` AS c "
+        "USING (customer_id)"
+    )
+
+    ast = parse(rewrite["sql"])
+    assert ast.args.get("where") is None
+    assert ast.find(exp.Subquery).alias == "orders"
+
+
+def test_preserved_side_of_left_join_is_filtered_in_where():
+    rewrite = guard(
+        "SELECT COUNT(*) FROM `p.d.orders` AS o "
+        "LEFT JOIN `p.d.customers` AS c ON o.customer_id = c.customer_id"
+    )
+
+    ast = parse(rewrite["sql"])
+    assert ast.find(exp.Subquery) is None
+    assert "`o`.`order_date`" in ast.args["where"].sql(dialect="bigquery")
+
+
+def test_exploratory_query_is_sampled():
+    rewrite = guard(
+        "SELECT EXTRACT(YEAR FROM `order_date`) AS year FROM `p.d.orders`",
+        sample_percent=1,
+    )
+
+    assert rewrite["method"] == "sample"
+    assert "TABLESAMPLE SYSTEM (1 PERCENT)" in rewrite["sql"]
+
+
+def test_tablesample_only_touches_tables():
+    sampled = query_guard.apply_tablesample(
+        "WITH recent AS (SELECT EXTRACT(YEAR FROM `order_date`) AS year, "
+        "customer_id FROM `p.d.orders`) "
+        "SELECT * FROM recent JOIN p.d.customers c USING (customer_id)",
+        2.5,
+    )
+
+    ast = parse(sampled)
+    samples = {
+        table.name: table.args.get("sample") is not None
+        for table in ast.find_all(exp.Table)
+    }
+    assert samples == {"orders": True, "recent": False, "customers": True}
+    assert ast.find(exp.Extract).sql(dialect="bigquery") == (
+        "EXTRACT(YEAR FROM `order_date`)"
+    )
+    assert "TABLESAMPLE SYSTEM (2.5 PERCENT)" in sampled
+
+
+def test_tablesample_keeps_unparseable_sql():
+    assert query_guard.apply_tablesample("SELECT FROM WHERE (", 1) == (
+        "SELECT FROM WHERE ("
+    )
@@ -0,0 +1,59 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import pytest
+
+from data_assistant import registry
+
+
+def make_registry(allowed_datasets=()):
+    schema_registry = registry.SchemaRegistry(
+        lambda project_id, dataset_id: (None, None),
+        lambda project_id, dataset_id, previous: {
+            "dataset": f"{project_id}.{dataset_id}", "created_at": time.time()
+        },
+        dict,
+        allowed_datasets=allowed_datasets,
+    )
+    schema_registry.allow("p", "d")
+    return schema_registry
+
+
+def test_empty_allowed_datasets_allows_only_the_default_dataset():
+    schema_registry = make_registry([])
+
+    settings, _ = schema_registry.get_settings("p", "d")
+
+    assert settings["dataset"] == "p.d"
+    with pytest.raises(ValueError, match="other.dataset"):
+        schema_registry.get_settings("other", "dataset")
+
+
+def test_allowed_datasets_are_added_to_the_default_dataset():
+    schema_registry = make_registry(["other.dataset"])
+
+    schema_registry.get_settings("p", "d")
+    schema_registry.get_settings("other", "dataset")
+    with pytest.raises(ValueError):
+        schema_registry.get_settings("other", "d")
+
+
+def test_wildcard_allows_any_dataset():
+    schema_registry = make_registry(["*"])
+
+    settings, _ = schema_registry.get_settings("any", "dataset")
+
+    assert settings["dataset"] == "any.dataset"
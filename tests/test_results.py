@@ -0,0 +1,96 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+
+import pyarrow as pa
+import pytest
+
+from benchmarks import fakes
+from data_assistant import results
+
+
+def query_job(num_rows):
+    return fakes.FakeQueryJob(
+        [{"label": f"label {i}", "value": i} for i in range(num_rows)],
+        schema=["label", "value"],
+    )
+
+
+@pytest.mark.parametrize("num_rows, total_rows, truncated", [
+    (100, 100, True),  # more rows than fetched
+    (80, 80, True),  # as many rows as the cap, e.g. the LIMIT added to the query
+    (10, 10, False),
+])
+def test_summary_reports_total_rows_and_truncation(num_rows, total_rows, truncated):
+    _, table = results.fetch_arrow(query_job(num_rows), 80)
+    assert table.num_rows == min(num_rows, 80)
+
+    summary = results.summarize(results.table_from_bytes(results.table_to_bytes(table)))
+    assert summary["row_count"] == table.num_rows
+    assert summary["total_rows"] == total_rows
+    assert summary["truncated"] is truncated
+    assert summary["columns"]["value"]["max"] == table.num_rows - 1
+
+
+def test_summary_of_a_table_without_metadata():
+    summary = results.summarize(pa.table({"value": [1, 2, 3]}))
+    assert (summary["total_rows"], summary["truncated"]) == (3, False)
+
+
+def test_arrow_to_rows_converts_dates_and_bytes():
+    rows = results.arrow_to_rows(pa.table({
+        "day": [datetime.date(2024, 1, 2)],
+        "payload": pa.array([b"ab"], pa.binary()),
+    }))
+    assert rows == [{"day": "2024-01-02", "payload": "YWI="}]
+
+
+def test_arrow_to_rows_converts_nested_bytes():
+    table = pa.table({
+        "payloads": pa.array([[b"ab", None], None], pa.list_(pa.binary())),
+        "record": pa.array(
+            [{"day": datetime.date(2024, 1, 2), "payload": b"ab"}, None],
+            pa.struct([("day", pa.date32()), ("payload", pa.binary())]),
+        ),
+    })
+
+    rows = results.arrow_to_rows(table)
+
+    assert rows == [
+        {"payloads": ["YWI=", None], "record": {"day": "2024-01-02", "payload": "YWI="}},
+        {"payloads": None, "record": None},
+    ]
+    json.dumps(rows)
+
+
+def test_arrow_to_rows_converts_intervals():
+    intervals = pa.array([
+        pa.MonthDayNano([14, 3, 3_723_500_000_000]),
+        pa.MonthDayNano([-1, 0, -1_000_000_000]),
+        None,
+    ], pa.month_day_nano_interval())
+    table = pa.table({
+        "interval": intervals,
+        "intervals": pa.array([[value] for value in intervals.to_pylist()],
+                              pa.list_(pa.month_day_nano_interval())),
+    })
+
+    rows = results.arrow_to_rows(table)
+
+    assert [row["interval"] for row in rows] == ["1-2 3 1:2:3.5", "-0-1 0 -0:0:1", None]
+    assert rows[0]["intervals"] == ["1-2 3 1:2:3.5"]
+    summary = results.summarize(table)
+    assert summary["columns"]["interval"] == {"type": "month_day_nano_interval", "nulls": 1}
@@ -0,0 +1,103 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from data_assistant import routing
+from data_assistant import tools
+from data_assistant.utils import get_config
+
+
+TIERS = [
+    {"model": "fast", "max_complexity": 1},
+    {"model": "medium", "max_complexity": 5},
+    {"model": "strong"},
+]
+
+
+@pytest.mark.parametrize("complexity, tier", [(0, 0), (1, 0), (2, 1), (5, 1), (6, 2)])
+def test_select_tier(complexity, tier):
+    assert routing.select_tier(TIERS, complexity) == tier
+
+
+def test_select_tier_falls_back_to_the_last_tier():
+    assert routing.select_tier([{"max_complexity": 1}, {"max_complexity": 3}], 9) == 1
+
+
+def test_estimate_complexity(database_settings):
+    simple = routing.estimate_complexity("How many orders?", database_settings)
+    assert simple["complexity"] == 1
+    assert simple["tables"] == ["p.d.orders"]
+
+    complex_ = routing.estimate_complexity(
+        "Compare the running total of order amount for each customer city",
+        database_settings,
+    )
+    assert complex_["tables"] == ["p.d.orders", "p.d.customers"]
+    assert complex_["joins"] == 2 and complex_["windows"] == 1
+    assert complex_["complexity"] > simple["complexity"]
+
+
+def test_estimate_complexity_portuguese_keywords(database_settings):
+    estimate = routing.estimate_complexity(
+        "Quantos clientes nunca compraram acima da média?", database_settings
+    )
+    assert estimate["aggregations"] >= 1
+    assert estimate["nesting"] >= 1
+
+
+def test_model_stats():
+    stats = routing.ModelStats()
+    stats.record_call("fast", 0.2)
+    stats.record_call("fast", 0.4)
+    stats.record_call("fast", 1.0, ok=False)
+    stats.record_route("fast", escalated=False)
+    stats.record_outcome("fast", valid=True)
+    stats.record_outcome("fast", valid=False)
+    report = stats.snapshot()["fast"]
+    assert report["calls"] == 3 and report["errors"] == 1
+    assert report["latency_p50"] == pytest.approx(0.3)
+    assert report["success_rate"] == 0.5
+
+
+@pytest.fixture
+def routed_agent(fake_agent):
+    get_config()["routing"] = {
+        "enabled": True, "tiers": TIERS, "escalate_on_failure": True,
+    }
+    return fake_agent
+
+
+def test_stepwise_regeneration_escalates(routed_agent):
+    question = routed_agent.scenario.question(1)
+    tool_context = routed_agent.tool_context()
+    tools.bq_nl2sql(question, tool_context)
+    assert tool_context.state["sql_route"]["model"] == "fast"
+
+    table = routed_agent.settings["bq_ddl_schema"].split("`", 2)[1]
+    result = tools.run_bigquery_validation(f"SELECT __fail__ FROM `{table}`", tool_context)
+    assert tools.validation_failed(result)
+
+    # The root model asks again, rephrasing the question
+    tools.bq_nl2sql(f"{question} Try again.", tool_context)
+    route = tool_context.state["sql_route"]
+    assert (route["model"], route["escalated"]) == ("medium", True)
+
+
+def test_no_escalation_after_a_valid_sql(routed_agent):
+    tool_context = routed_agent.tool_context()
+    sql = tools.bq_nl2sql(routed_agent.scenario.question(1), tool_context)
+    assert tools.run_bigquery_validation(sql, tool_context)["error_message"] is None
+    tools.bq_nl2sql(routed_agent.scenario.question(2), tool_context)
+    assert tool_context.state["sql_route"]["escalated"] is False
@@ -0,0 +1,41 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+from benchmarks import fakes
+from data_assistant import schema
+from data_assistant import schema_render
+
+
+def test_other_render_modes_are_only_rendered_for_token_stats():
+    client = fakes.FakeBigQueryClient(fakes.SyntheticDataset(3, 6))
+    renderer = schema_render.CompactRenderer()
+
+    with mock.patch.object(
+        schema_render.DDLRenderer, "render_levels",
+        autospec=True, side_effect=schema_render.DDLRenderer.render_levels,
+    ) as ddl_render_levels:
+        ddl = schema.introspect_dataset(
+            client, client.project, client.dataset_id, renderer=renderer
+        )
+        assert ddl_render_levels.call_count == 0
+
+        tokens = schema.token_stats()
+        assert ddl_render_levels.call_count == 3
+
+    assert set(tokens) == set(schema_render.RENDERERS) | {"selected"}
+    assert tokens["selected"] == tokens["compact"] < tokens["ddl"]
+    assert schema.last_timings["tokens"] == {"selected": tokens["selected"]}
+    assert sorted(ddl) == client.dataset.tables
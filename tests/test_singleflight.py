@@ -0,0 +1,157 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from data_assistant import singleflight
+
+
+WAITERS = 4
+
+
+class Interrupted(BaseException):
+    """Stands for a KeyboardInterrupt or cancellation of the running caller."""
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def start_leader(flight, executor, key, function):
+    """Starts the call running `function` and waits until it is in flight."""
+    future = executor.submit(flight.do, key, function)
+    wait_for(lambda: flight.stats()["in_flight"] == 1)
+    return future
+
+
+def join_waiters(flight, executor, key, function, coalesced=WAITERS):
+    futures = [executor.submit(flight.do, key, function) for _ in range(WAITERS)]
+    wait_for(lambda: flight.stats()["coalesced"] == coalesced)
+    return futures
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = singleflight.SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(WAITERS + 1) as executor:
+        leader = start_leader(flight, executor, "key", work)
+        waiters = join_waiters(flight, executor, "key", work)
+        release.set()
+        results = [leader.result()] + [future.result() for future in waiters]
+
+    assert calls == [1]
+    assert results == [("result", False)] + [("result", True)] * WAITERS
+    assert flight.stats() == {
+        "executed": 1, "coalesced": WAITERS, "errors": 0, "in_flight": 0
+    }
+
+
+def test_error_is_raised_to_every_caller_and_not_kept():
+    flight = singleflight.SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("failed")
+
+    with ThreadPoolExecutor(WAITERS + 1) as executor:
+        leader = start_leader(flight, executor, "key", fail)
+        waiters = join_waiters(flight, executor, "key", fail)
+        release.set()
+        for future in [leader] + waiters:
+            with pytest.raises(ValueError, match="failed"):
+                future.result()
+
+    assert flight.do("key", lambda: "retried") == ("retried", False)
+    assert flight.stats()["errors"] == 1
+    assert flight.stats()["executed"] == 2
+
+
+def test_different_keys_run_concurrently():
+    flight = singleflight.SingleFlight("test")
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    with ThreadPoolExecutor(2) as executor:
+        slow_call = start_leader(flight, executor, "slow", slow)
+        assert flight.do("fast", lambda: "fast") == ("fast", False)
+        release.set()
+        assert slow_call.result() == ("slow", False)
+
+
+def test_waiter_runs_the_work_of_an_interrupted_caller():
+    flight = singleflight.SingleFlight("test")
+    release = threading.Event()
+
+    def interrupted():
+        release.wait(5)
+        raise Interrupted()
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = start_leader(flight, executor, "key", interrupted)
+        waiter = executor.submit(flight.do, "key", lambda: "resumed")
+        wait_for(lambda: flight.stats()["coalesced"] == 1)
+        release.set()
+        with pytest.raises(Interrupted):
+            leader.result()
+        assert waiter.result() == ("resumed", False)
+
+    assert flight.stats() == {
+        "executed": 2, "coalesced": 1, "errors": 0, "in_flight": 0
+    }
+
+
+def test_async_waiters_share_the_running_call():
+    flight = singleflight.SingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        leader = asyncio.create_task(flight.do_async("key", work))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(flight.do_async("key", work))
+        waiters = [flight.do_async("key", work) for _ in range(WAITERS)]
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        results = await asyncio.gather(leader, *waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return results
+
+    results = asyncio.run(run())
+
+    assert calls == [1]
+    assert results == [("result", False)] + [("result", True)] * WAITERS
@@ -0,0 +1,146 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+
+from benchmarks import fakes
+from data_assistant import snapshot
+
+
+RENDER_CONFIG = {"render_mode": "compact"}
+
+
+class GrowingDataset(fakes.SyntheticDataset):
+    """A synthetic dataset whose sample rows and columns can change."""
+
+    extra_column = None
+
+    def columns(self, table_index):
+        columns = super().columns(table_index)
+        if self.extra_column and table_index == 0:
+            columns.append(self.extra_column)
+        return columns
+
+
+@pytest.fixture
+def dataset_client():
+    return fakes.FakeBigQueryClient(GrowingDataset(3, 6))
+
+
+def refresh(client, previous=None):
+    return snapshot.refresh_snapshot(
+        client, client.project, client.dataset_id,
+        previous=previous, render_config=RENDER_CONFIG,
+    )
+
+
+def test_data_load_keeps_version(dataset_client):
+    built = refresh(dataset_client)
+    dataset_client.dataset.sample_rows = 2
+    dataset_client.modified += 1000
+    dataset_client.calls.reset()
+
+    refreshed = refresh(dataset_client, json.loads(json.dumps(built)))
+
+    assert refreshed["version"] == built["version"]
+    assert "list_rows" not in dataset_client.calls.snapshot()
+    assert all(
+        table["modified"] == dataset_client.modified
+        for table in refreshed["tables"].values()
+    )
+
+
+def test_sample_values_are_not_versioned(dataset_client):
+    built = refresh(dataset_client)
+    dataset_client.dataset.sample_rows = 2
+
+    rebuilt = refresh(dataset_client)
+
+    assert rebuilt["tables"]["table_0000"]["ddl"] != built["tables"]["table_0000"]["ddl"]
+    assert rebuilt["version"] == built["version"]
+
+
+def test_structure_change_bumps_version(dataset_client):
+    built = refresh(dataset_client)
+    dataset_client.dataset.extra_column = ("added", "STRING", None)
+    dataset_client.modified += 1000
+
+    refreshed = refresh(dataset_client, built)
+
+    assert refreshed["version"] != built["version"]
+    assert "added" in refreshed["tables"]["table_0000"]["ddl"]
+    assert refreshed["tables"]["table_0001"]["ddl"] == built["tables"]["table_0001"]["ddl"]
+
+
+def test_description_change_bumps_version(dataset_client):
+    built = refresh(dataset_client)
+    dataset_client.dataset.extra_column = ("added", "STRING", "First")
+    rebuilt = refresh(dataset_client)
+    dataset_client.dataset.extra_column = ("added", "STRING", "Second")
+
+    assert refresh(dataset_client)["version"] != rebuilt["version"] != built["version"]
+
+
+def test_snapshot_without_columns_is_rebuilt(dataset_client):
+    built = refresh(dataset_client)
+    old = dict(built, tables={
+        table_id: {k: v for k, v in table.items() if k != "columns"}
+        for table_id, table in built["tables"].items()
+    })
+
+    refreshed = refresh(dataset_client, old)
+
+    assert refreshed["tables"] == built["tables"]
+    assert refreshed["version"] == built["version"]
+
+
+def test_profiles_are_computed_once_per_structure(dataset_client):
+    profile_config = {"enabled": True, "max_bytes_per_table": 0}
+    built = snapshot.refresh_snapshot(
+        dataset_client, dataset_client.project, dataset_client.dataset_id,
+        render_config=RENDER_CONFIG, profile_config=profile_config,
+    )
+    calls = dataset_client.calls.snapshot()
+    assert calls["profile"] == 3
+    # Modified times and columns, reused by the profiles
+    assert calls["metadata"] == 2
+    assert all(table["profile"] for table in built["tables"].values())
+
+    dataset_client.modified += 1000
+    dataset_client.calls.reset()
+    refreshed = snapshot.refresh_snapshot(
+        dataset_client, dataset_client.project, dataset_client.dataset_id,
+        previous=built, render_config=RENDER_CONFIG, profile_config=profile_config,
+    )
+
+    assert "profile" not in dataset_client.calls.snapshot()
+    assert snapshot.snapshot_profiles(refreshed) == snapshot.snapshot_profiles(built)
+
+
+def test_identical_datasets_have_different_versions():
+    dataset = GrowingDataset(3, 6)
+    tenants = [
+        fakes.FakeBigQueryClient(dataset, dataset_id=dataset_id)
+        for dataset_id in ("tenant_a", "tenant_b")
+    ]
+
+    tenant_a, tenant_b = [refresh(client) for client in tenants]
+
+    for table_id, table in tenant_a["tables"].items():
+        assert snapshot.table_structure(table) == snapshot.table_structure(
+            tenant_b["tables"][table_id]
+        )
+    assert tenant_a["version"] != tenant_b["version"]
@@ -0,0 +1,111 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from benchmarks import fakes
+from data_assistant import query_guard
+from data_assistant import sql_validator
+
+
+def codes(errors):
+    return [error["code"] for error in errors]
+
+
+def test_valid_select_gets_a_limit(database_settings):
+    sql, errors = sql_validator.validate_sql(
+        "SELECT order_id, amount FROM `p.d.orders`", database_settings, 80
+    )
+    assert errors == []
+    assert sql.endswith("\nLIMIT 80")
+
+
+def test_existing_limit_is_kept(database_settings):
+    sql, errors = sql_validator.validate_sql(
+        "SELECT order_id FROM `p.d.orders` LIMIT 5", database_settings, 80
+    )
+    assert errors == []
+    assert sql == "SELECT order_id FROM `p.d.orders` LIMIT 5"
+
+
+@pytest.mark.parametrize("sql, code", [
+    ("DELETE FROM `p.d.orders` WHERE TRUE", "not_select"),
+    ("INSERT INTO `p.d.orders` (order_id) VALUES (1)", "not_select"),
+    ("DROP TABLE `p.d.orders`", "not_select"),
+    ("SELECT 1; DELETE FROM `p.d.orders` WHERE TRUE", "multiple_statements"),
+])
+def test_dml_and_scripts_are_rejected(database_settings, sql, code):
+    _, errors = sql_validator.validate_sql(sql, database_settings, 80)
+    assert codes(errors) == [code]
+
+
+def test_unparseable_script_hiding_dml_is_rejected(database_settings):
+    sql = (
+        "SELECT * FROM APPENDS(TABLE `p.d.t`, NULL, NULL); "
+        "DELETE FROM `p.d.t` WHERE TRUE; SELECT 1 LIMIT 1"
+    )
+    _, errors = sql_validator.validate_sql(sql, database_settings, 80)
+    assert codes(errors) == ["parse_error"]
+
+
+def test_unknown_table_and_column(database_settings):
+    _, errors = sql_validator.validate_sql(
+        "SELECT o.amount, o.total FROM `p.d.orders` o JOIN `p.d.order` c USING (customer_id)",
+        database_settings, 80,
+    )
+    assert set(codes(errors)) == {"unknown_column", "unknown_table"}
+    assert "Did you mean" in sql_validator.format_errors(errors)
+
+
+def test_unqualified_table(database_settings):
+    _, errors = sql_validator.validate_sql(
+        "SELECT amount FROM orders", database_settings, 80
+    )
+    assert codes(errors) == ["unqualified_table"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT O.amount FROM `p.d.orders` AS o",
+    "SELECT o.AMOUNT FROM `p.d.orders` AS O",
+    "SELECT Orders.amount FROM `p.d.orders`",
+    "SELECT C.name FROM `p.d.orders` o JOIN `p.d.customers` c USING (customer_id)",
+])
+def test_qualifiers_are_case_insensitive(database_settings, sql):
+    _, errors = sql_validator.validate_sql(sql, database_settings, 80)
+    assert errors == []
+
+
+def test_unknown_qualifier(database_settings):
+    _, errors = sql_validator.validate_sql(
+        "SELECT x.amount FROM `p.d.orders` AS o", database_settings, 80
+    )
+    assert codes(errors) == ["unknown_qualifier"]
+
+
+def test_wildcard_tables_are_left_to_the_dry_run(database_settings):
+    _, errors = sql_validator.validate_sql(
+        "SELECT event_name FROM `p.d.events_*` WHERE _TABLE_SUFFIX >= '20240101'",
+        database_settings, 80,
+    )
+    assert errors == []
+
+
+def test_dry_run_rejects_scripts():
+    client = fakes.FakeBigQueryClient(fakes.SyntheticDataset(2, 4))
+    table = f"`{client.project}.{client.dataset_id}.{client.dataset.tables[0]}`"
+    assert query_guard.dry_run(client, f"SELECT * FROM {table}")["bytes_processed"]
+    with pytest.raises(ValueError, match="SCRIPT"):
+        query_guard.dry_run(
+            client, f"SELECT * FROM {table}; DELETE FROM {table} WHERE TRUE"
+        )
@@ -0,0 +1,81 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+
+import pytest
+
+from data_assistant import async_tools
+from data_assistant import tools
+
+
+def test_validated_sql_is_cached(fake_agent):
+    question = fake_agent.scenario.question(1)
+    tool_context = fake_agent.tool_context()
+    result = tools.generate_and_validate_sql(question, tool_context)
+    assert result["attempts"] == 1
+
+    tool_context = fake_agent.tool_context()
+    calls = fake_agent.llm_client.calls.snapshot()["generate_content"]
+    cached_sql = tools.bq_nl2sql(question, tool_context)
+    assert cached_sql.startswith(result["sql"])
+    assert fake_agent.llm_client.calls.snapshot()["generate_content"] == calls
+
+
+@pytest.mark.parametrize("fused", [
+    tools.generate_and_validate_sql,
+    lambda question, tool_context: asyncio.run(
+        async_tools.generate_and_validate_sql(question, tool_context)
+    ),
+])
+def test_rejected_cached_sql_is_evicted(fake_agent, fused):
+    question = fake_agent.scenario.question(2)
+    tool_context = fake_agent.tool_context()
+    table = fake_agent.settings["bq_ddl_schema"].split("`", 2)[1]
+    failing_sql = f"SELECT __fail__ FROM `{table}`"
+    tools.get_cached_sql(question, tool_context)
+    tools.get_sql_cache().put(tool_context.state["sql_cache_key"], failing_sql)
+
+    result = fused(question, tool_context)
+
+    assert result["attempts"] == 2
+    assert result["repair_history"][0]["sql"] == failing_sql
+    assert result["error_message"] is None
+    cached_sql = tools.get_cached_sql(question, fake_agent.tool_context())
+    assert cached_sql.startswith(result["sql"])
+
+
+def test_table_freshness_reads_tables_concurrently(fake_agent):
+    tables = [
+        f"{fake_agent.bq_client.project}.{fake_agent.bq_client.dataset_id}.{table_id}"
+        for table_id in fake_agent.bq_client.dataset.tables
+    ]
+    fake_agent.bq_client.latency = {"get_table": 0.2}
+
+    started = time.perf_counter()
+    freshness = tools._table_freshness(tables)  # pylint: disable=protected-access
+    elapsed = time.perf_counter() - started
+
+    assert [item[0] for item in freshness] == tables
+    assert fake_agent.bq_client.calls.snapshot()["get_table"] == len(tables)
+    assert elapsed < 0.2 * (len(tables) - 1)
+
+
+@pytest.mark.parametrize("sql", [None, ""])
+def test_missing_generated_sql_is_saved_as_is(fake_agent, sql):
+    tool_context = fake_agent.tool_context()
+
+    assert tools.save_generated_sql("Describe table orders", sql, tool_context) == sql
+    assert tool_context.state["sql_query"] == sql